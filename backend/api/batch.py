@@ -0,0 +1,68 @@
+import base64
+import io
+from urllib.parse import urlsplit
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import Http404
+from django.urls import resolve
+from django.utils.encoding import iri_to_uri
+
+API_PREFIX = "/api/"
+BATCH_PATH = "/api/batch/"
+
+
+def dispatch_get(request, path):
+    """Выполняет GET `path` в этом же процессе от имени пользователя `request`.
+
+    Подзапрос получает заголовки пакетного запроса и уже
+    аутентифицированного пользователя (`_force_auth_user` DRF), поэтому
+    токен не проверяется повторно, а запросы к БД идут через то же
+    соединение. Разрешения и ограничения частоты view применяются как
+    обычно. Возвращает элемент ответа: статус и данные DRF в `body`; тело
+    ответа не из DRF (файл списка покупок) передаётся в `body_base64` с
+    `content_type`.
+    """
+    url = urlsplit(iri_to_uri(path))
+    if url.scheme or url.netloc:
+        return error(400, "Передайте путь без схемы и хоста.")
+    if not url.path.startswith(API_PREFIX) or url.path == BATCH_PATH:
+        return error(400, "Допустимы только пути API, кроме самого /api/batch/.")
+    environ = {
+        key: value
+        for key, value in request._request.META.items()
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH")
+    }
+    environ.update(
+        {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": url.path,
+            "QUERY_STRING": url.query,
+            "wsgi.input": io.BytesIO(),
+        }
+    )
+    sub_request = WSGIRequest(environ)
+    if request.user.is_authenticated:
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+    try:
+        match = resolve(sub_request.path_info)
+        sub_request.resolver_match = match
+        response = match.func(sub_request, *match.args, **match.kwargs)
+    except Http404:
+        return error(404, "Страница не найдена.")
+    if hasattr(response, "data"):
+        return {"status": response.status_code, "body": response.data}
+    if response.streaming:
+        content = b"".join(response.streaming_content)
+    else:
+        content = response.content
+    return {
+        "status": response.status_code,
+        "body": None,
+        "content_type": response.get("Content-Type"),
+        "body_base64": base64.b64encode(content).decode(),
+    }
+
+
+def error(status, detail):
+    return {"status": status, "body": {"detail": detail}}
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Tags, Warning, register
+from recipes.caches import is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_throttle_cache(app_configs, **kwargs):
+    """Лимиты запросов без общего кеша действуют на каждый воркер отдельно."""
+    if not settings.API_THROTTLE_ENABLED:
+        return []
+    if is_shared(caches[settings.API_THROTTLE_CACHE]):
+        return []
+    return [
+        Warning(
+            "Корзины токенов хранятся в памяти процесса: каждый воркер "
+            "пропускает полный лимит запросов.",
+            hint="Задайте общий кеш THROTTLE_CACHE_BACKEND (например, Redis).",
+            id="api.W001",
+        )
+    ]
@@ -0,0 +1,80 @@
+from rest_framework import serializers
+
+FIELDS_PARAM = "fields"
+OMIT_PARAM = "omit"
+
+
+def _split(value):
+    return frozenset(name.strip() for name in value.split(",") if name.strip())
+
+
+class FieldSet:
+    """Поля ответа, запрошенные через `?fields=` и `?omit=`.
+
+    `?fields=id,name,image` оставляет только перечисленные поля,
+    `?omit=text,ingredients` убирает перечисленные. Неизвестные имена
+    игнорируются. Параметры действуют только на GET-запросы.
+    """
+
+    def __init__(self, fields=None, omit=frozenset()):
+        self.fields = fields
+        self.omit = omit
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None or request.method != "GET":
+            return ALL_FIELDS
+        params = getattr(request, "query_params", request.GET)
+        fields = params.get(FIELDS_PARAM)
+        omit = params.get(OMIT_PARAM)
+        if not fields and not omit:
+            return ALL_FIELDS
+        return cls(_split(fields) if fields else None, _split(omit or ""))
+
+    def __contains__(self, name):
+        return (self.fields is None or name in self.fields) and name not in self.omit
+
+    def filter(self, data):
+        if self is ALL_FIELDS:
+            return data
+        return {name: value for name, value in data.items() if name in self}
+
+
+ALL_FIELDS = FieldSet()
+
+
+def requested_fields(serializer):
+    """Набор полей для сериализатора верхнего уровня ответа.
+
+    Вложенные сериализаторы (автор рецепта, подписка) отдаются целиком.
+    Разобранный набор кешируется в общем контексте сериализаторов.
+    """
+    parent = serializer.parent
+    if isinstance(parent, serializers.ListSerializer):
+        parent = parent.parent
+    if parent is not None:
+        return ALL_FIELDS
+    context = serializer.context
+    if "fieldset" not in context:
+        context["fieldset"] = FieldSet.from_request(context.get("request"))
+    return context["fieldset"]
+
+
+class SparseFieldsMixin:
+    """Не строит поля, которые клиент не запросил.
+
+    Убранные поля не вычисляются вовсе, поэтому их `SerializerMethodField`
+    и вложенные сериализаторы не обращаются к БД. Выборки под поля
+    подготавливает view по тому же `FieldSet`.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = requested_fields(self)
+        if fieldset is ALL_FIELDS:
+            return fields
+        return {
+            name: field
+            for name, field in fields.items()
+            if field.write_only or name in fieldset
+        }
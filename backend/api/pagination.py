@@ -1,5 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size_query_param = "limit"
+    max_page_size = 100
+
+
+class FeedCursorPagination(CursorPagination):
+    ordering = "-id"
+    page_size_query_param = "limit"
+    max_page_size = 100
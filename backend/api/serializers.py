@@ -3,12 +3,48 @@ from djoser.serializers import UserSerializer as BaseUserSerializer
 from users.models import User, Follow
 from recipes.models import Recipe, Ingredient, RecipeIngredient, Favorite, ShoppingCart
 from drf_extra_fields.fields import Base64ImageField
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Q
+from jobs.queue import enqueue
+from recipes.caches import recipe_representations
+from recipes.facets import recipe_facets
+from recipes.tasks import delete_recipe_image
+from recipes.state import user_recipe_state
+from .fieldsets import SparseFieldsMixin, requested_fields
+from functools import partial
 import re
+import time
 
 MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 32000
 MIN_AMOUNT = 1
+USERNAME_RE = re.compile(r"^[\w.@+-]+\Z")
+# Поле профиля, максимальная длина и сообщение о её превышении
+PROFILE_FIELDS = (
+    ("email", 254, "Максимальная длина email 254 символа."),
+    ("username", 150, "Максимальная длина имени пользователя 150 символов."),
+    ("first_name", 150, "Максимальная длина имени 150 символов."),
+    ("last_name", 150, "Максимальная длина фамилии 150 символов."),
+)
+
+
+def avatar_url(request, user):
+    if user.avatar and hasattr(user.avatar, "url") and request:
+        return request.build_absolute_uri(user.avatar.url)
+    return None
+
+
+def is_subscribed(request, author):
+    """Подписан ли текущий пользователь на автора.
+
+    Если выборка уже посчитала это аннотацией `is_subscribed`, запроса нет.
+    """
+    if not request or not request.user.is_authenticated:
+        return False
+    subscribed = getattr(author, "is_subscribed", None)
+    if subscribed is None:
+        subscribed = request.user.following.filter(following=author).exists()
+    return subscribed
 
 
 class UserSerializer(BaseUserSerializer):
@@ -24,108 +60,86 @@ class UserSerializer(BaseUserSerializer):
         )
         extra_kwargs = {
             "email": {"required": True, "allow_blank": False},
-            "username": {"required": True, "allow_blank": False},
+            # Формат и уникальность проверяет to_internal_value
+            "username": {"required": True, "allow_blank": False, "validators": []},
             "first_name": {"required": True, "allow_blank": False},
             "last_name": {"required": True, "allow_blank": False},
             "password": {"write_only": True, "required": True},
         }
 
     def to_internal_value(self, data):
-        email = data.get("email")
-        username = data.get("username")
-        first_name = data.get("first_name")
-        last_name = data.get("last_name")
-
-        if not email or email.strip() == "":
-            raise serializers.ValidationError(
-                {"email": "Это поле не может быть пустым."}
-            )
-        if len(email) > 254:
-            raise serializers.ValidationError(
-                {"email": "Максимальная длина email 254 символа."}
-            )
-        if User.objects.filter(email=email).exists():
-            raise serializers.ValidationError(
-                {"email": "Пользователь с таким email уже существует."}
-            )
-
-        if not username or username.strip() == "":
-            raise serializers.ValidationError(
-                {"username": "Это поле не может быть пустым."}
-            )
-        if len(username) > 150:
-            raise serializers.ValidationError(
-                {"username": "Максимальная длина имени пользователя 150 символов."}
-            )
-        if User.objects.filter(username=username).exists():
-            raise serializers.ValidationError(
-                {"username": "Пользователь с таким именем уже существует."}
-            )
-        if not re.match(r"^[\w.@+-]+\Z", username):
-            raise serializers.ValidationError(
-                {"username": "Имя пользователя содержит недопустимые символы."}
-            )
-
-        if not first_name or first_name.strip() == "":
-            raise serializers.ValidationError(
-                {"first_name": "Это поле не может быть пустым."}
-            )
-        if len(first_name) > 150:
-            raise serializers.ValidationError(
-                {"first_name": "Максимальная длина имени 150 символов."}
-            )
-
-        if not last_name or last_name.strip() == "":
-            raise serializers.ValidationError(
-                {"last_name": "Это поле не может быть пустым."}
-            )
-        if len(last_name) > 150:
-            raise serializers.ValidationError(
-                {"last_name": "Максимальная длина фамилии 150 символов."}
-            )
-
-        validated_data = super().to_internal_value(data)
-        validated_data["email"] = email
-        validated_data["username"] = username
-        validated_data["first_name"] = first_name
-        validated_data["last_name"] = last_name
+        """Проверяет все поля за один проход и сообщает все ошибки сразу.
+
+        Уникальность email и имени без учёта регистра проверяется одним
+        запросом; одновременные регистрации с одинаковыми данными отсекают
+        уникальные индексы, и `create` превращает их ошибку в ответ 400.
+        """
+        errors = {}
+        values = {}
+        for name, max_length, too_long in PROFILE_FIELDS:
+            value = data.get(name)
+            if not isinstance(value, str) or not value.strip():
+                errors[name] = "Это поле не может быть пустым."
+            elif len(value) > max_length:
+                errors[name] = too_long
+            else:
+                values[name] = value
+        if "username" in values and not USERNAME_RE.match(values["username"]):
+            errors["username"] = "Имя пользователя содержит недопустимые символы."
+            del values["username"]
+        try:
+            validated_data = super().to_internal_value(data)
+        except serializers.ValidationError as error:
+            validated_data = {}
+            for name, detail in error.detail.items():
+                errors.setdefault(name, detail)
+        errors.update(
+            {
+                name: message
+                for name, message in self.unique_errors(
+                    values.get("email"), values.get("username")
+                ).items()
+                if name not in errors
+            }
+        )
+        if errors:
+            raise serializers.ValidationError(errors)
+        validated_data.update(values)
         return validated_data
 
-    def validate_email(self, value):
-        if len(value) > 254:
-            raise serializers.ValidationError("Максимальная длина email 254 символа.")
-        return value
-
-    def validate_username(self, value):
-        if len(value) > 150:
-            raise serializers.ValidationError(
-                "Максимальная длина имени пользователя 150 символов."
-            )
-        if not re.match(r"^[\w.@+-]+\Z", value):
-            raise serializers.ValidationError(
-                "Имя пользователя содержит недопустимые символы."
-            )
-        return value
-
-    def validate_first_name(self, value):
-        if len(value) > 150:
-            raise serializers.ValidationError("Максимальная длина имени 150 символов.")
-        return value
-
-    def validate_last_name(self, value):
-        if len(value) > 150:
-            raise serializers.ValidationError(
-                "Максимальная длина фамилии 150 символов."
-            )
-        return value
+    def unique_errors(self, email, username):
+        """Занятые email и имя пользователя — одним запросом."""
+        condition = Q()
+        if email:
+            condition |= Q(email__iexact=email)
+        if username:
+            condition |= Q(username__iexact=username)
+        if not condition:
+            return {}
+        taken = User.objects.filter(condition)
+        if self.instance is not None:
+            taken = taken.exclude(pk=self.instance.pk)
+        errors = {}
+        for taken_email, taken_username in taken.values_list("email", "username"):
+            if email and taken_email.lower() == email.lower():
+                errors["email"] = "Пользователь с таким email уже существует."
+            if username and taken_username.lower() == username.lower():
+                errors["username"] = "Пользователь с таким именем уже существует."
+        return errors
 
     def create(self, validated_data):
         try:
-            user = User.objects.create_user(**validated_data)
-            return user
+            # Точка сохранения: после ошибки внешняя транзакция (например,
+            # ATOMIC_REQUESTS) остаётся рабочей для запроса unique_errors
+            with transaction.atomic():
+                return User.objects.create_user(**validated_data)
         except IntegrityError:
+            # Кто-то успел зарегистрироваться с теми же данными
             raise serializers.ValidationError(
-                {"detail": "Пользователь с таким email или именем уже существует."}
+                self.unique_errors(
+                    validated_data.get("email"), validated_data.get("username")
+                )
+                or {"detail": "Пользователь с таким email или именем уже существует."}
             )
 
     def to_representation(self, instance):
@@ -138,22 +152,19 @@ class UserSerializer(BaseUserSerializer):
                 "first_name": instance.first_name,
                 "last_name": instance.last_name,
             }
-        avatar_url = None
-        if instance.avatar and hasattr(instance.avatar, "url") and request:
-            avatar_url = request.build_absolute_uri(instance.avatar.url)
-        return {
+        fieldset = requested_fields(self)
+        data = {
             "id": instance.id,
             "email": instance.email,
             "username": instance.username,
             "first_name": instance.first_name,
             "last_name": instance.last_name,
-            "avatar": avatar_url,
-            "is_subscribed": (
-                request.user.following.filter(following=instance).exists()
-                if request and request.user.is_authenticated
-                else False
-            ),
         }
+        if "avatar" in fieldset:
+            data["avatar"] = avatar_url(request, instance)
+        if "is_subscribed" in fieldset:
+            data["is_subscribed"] = is_subscribed(request, instance)
+        return fieldset.filter(data)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -191,7 +202,24 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "image", "cooking_time")
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+def uses_recipe_cache(fieldset):
+    """Кеш нужен, когда в ответе есть дорогие автор или ингредиенты.
+
+    Карточкам без них хватает одной выборки без кеша.
+    """
+    return recipe_representations.enabled and (
+        "author" in fieldset or "ingredients" in fieldset
+    )
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if not uses_recipe_cache(requested_fields(self.child)):
+            return super().to_representation(data)
+        return self.child.cached_representation(list(data))
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
         many=True, read_only=True, source="recipeingredient_set"
@@ -222,6 +250,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             "is_favorited",
             "is_in_shopping_cart",
         )
+        list_serializer_class = RecipeListSerializer
 
     def to_internal_value(self, data):
         if "ingredients" in data and "ingredients_input" not in data:
@@ -315,15 +344,24 @@ class RecipeSerializer(serializers.ModelSerializer):
                     )
                 )
             RecipeIngredient.objects.bulk_create(recipe_ingredients)
+            # bulk_create не шлёт сигналов
+            transaction.on_commit(
+                partial(recipe_representations.bump_recipe, recipe.id)
+            )
 
     def create(self, validated_data):
         ingredients_data = validated_data.pop("ingredients_input")
         recipe = Recipe.objects.create(**validated_data)
         self._update_ingredients(recipe, ingredients_data)
+        transaction.on_commit(
+            partial(recipe_facets.bump, *recipe_facets.scopes([recipe.pk]))
+        )
         return recipe
 
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop("ingredients_input", None)
+        previous_image = instance.image.name
+        authors, ingredients = recipe_facets.scopes([instance.pk])
         instance.name = validated_data.get("name", instance.name)
         instance.image = validated_data.get("image", instance.image)
         instance.text = validated_data.get("text", instance.text)
@@ -331,40 +369,124 @@ class RecipeSerializer(serializers.ModelSerializer):
             "cooking_time", instance.cooking_time
         )
         instance.save()
+        if previous_image and previous_image != instance.image.name:
+            enqueue(delete_recipe_image, name=previous_image, requested_at=time.time())
         if ingredients_data is not None:
             self._update_ingredients(instance, ingredients_data)
+        new_authors, new_ingredients = recipe_facets.scopes([instance.pk])
+        transaction.on_commit(
+            partial(
+                recipe_facets.bump,
+                authors | new_authors,
+                ingredients | new_ingredients,
+            )
+        )
         return instance
 
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
+    def shared_representation(self, recipe):
+        """Часть рецепта, одинаковая для всех зрителей."""
+        request = self.context.get("request")
+        author = recipe.author
+        image = recipe.image.url if recipe.image else None
+        if image and request:
+            image = request.build_absolute_uri(image)
+        return {
+            "id": recipe.id,
+            "author": {
+                "id": author.id,
+                "email": author.email,
+                "username": author.username,
+                "first_name": author.first_name,
+                "last_name": author.last_name,
+                "avatar": avatar_url(request, author),
+            },
+            "name": recipe.name,
+            "image": image,
+            "text": recipe.text,
+            "ingredients": [
+                {
+                    "id": item.ingredient.id,
+                    "name": item.ingredient.name,
+                    "measurement_unit": item.ingredient.measurement_unit,
+                    "amount": item.amount,
+                }
+                for item in recipe.recipeingredient_set.all()
+            ],
+            "cooking_time": recipe.cooking_time,
+        }
+
+    def cached_representation(self, recipes):
+        """Рецепты из кеша общих частей с флагами зрителя поверх.
+
+        Промахи дочитываются одной выборкой с автором и ингредиентами, флаги
+        берутся из `user_recipe_state` пачкой на всю страницу.
+        """
         request = self.context.get("request")
-        author_data = data["author"]
-        author_data["is_subscribed"] = (
-            request.user.following.filter(following=instance.author).exists()
-            if request and request.user.is_authenticated
-            else False
+        keys = recipe_representations.keys(
+            recipes, request.build_absolute_uri("/") if request else ""
         )
-        avatar_url = None
-        if (
-            instance.author.avatar
-            and hasattr(instance.author.avatar, "url")
-            and request
-        ):
-            avatar_url = request.build_absolute_uri(instance.author.avatar.url)
-        author_data["avatar"] = avatar_url
-        ingredients = RecipeIngredient.objects.filter(recipe=instance)
-        data["ingredients"] = RecipeIngredientSerializer(ingredients, many=True).data
+        shared = recipe_representations.get_many(keys)
+        missing = [recipe.id for recipe in recipes if recipe.id not in shared]
+        if missing:
+            fresh = {
+                recipe.id: self.shared_representation(recipe)
+                for recipe in Recipe.objects.filter(id__in=missing)
+                .select_related("author")
+                .prefetch_related(
+                    Prefetch(
+                        "recipeingredient_set",
+                        queryset=RecipeIngredient.objects.select_related("ingredient"),
+                    )
+                )
+            }
+            recipe_representations.set_many(
+                {keys[recipe_id]: data for recipe_id, data in fresh.items()}
+            )
+            shared.update(fresh)
+        state = user_recipe_state(request.user if request else None, recipes)
+        fieldset = requested_fields(self)
+        result = []
+        for recipe in recipes:
+            if recipe.id not in shared:
+                continue
+            data = dict(shared[recipe.id])
+            data["author"] = dict(
+                data["author"], is_subscribed=recipe.author_id in state.subscribed
+            )
+            data["is_favorited"] = recipe.id in state.favorited
+            data["is_in_shopping_cart"] = recipe.id in state.in_shopping_cart
+            result.append(fieldset.filter(data))
+        return result
+
+    def to_representation(self, instance):
+        if uses_recipe_cache(requested_fields(self)):
+            return self.cached_representation([instance])[0]
+        if hasattr(instance, "author_is_subscribed"):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        data = super().to_representation(instance)
+        if "author" in data:
+            # После POST вложенный UserSerializer отдаёт автора без этих полей
+            request = self.context.get("request")
+            author_data = data["author"]
+            if "is_subscribed" not in author_data:
+                author_data["is_subscribed"] = is_subscribed(request, instance.author)
+            if "avatar" not in author_data:
+                author_data["avatar"] = avatar_url(request, instance.author)
         return data
 
     def get_is_favorited(self, obj):
         request = self.context["request"]
         if request and request.user.is_authenticated:
+            if hasattr(obj, "is_favorited"):
+                return obj.is_favorited
             return request.user.favorites.filter(recipe=obj).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context["request"]
         if request and request.user.is_authenticated:
+            if hasattr(obj, "is_in_shopping_cart"):
+                return obj.is_in_shopping_cart
             return request.user.shopping_carts.filter(recipe=obj).exists()
         return False
 
@@ -399,9 +521,22 @@ class FollowSerializer(serializers.ModelSerializer):
         ).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
         return obj.following.recipes.count()
 
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = requested_fields(self)
+        for name in ("recipes", "recipes_count"):
+            if name not in fieldset:
+                del fields[name]
+        return fields
+
     def to_representation(self, instance):
+        request = self.context.get("request")
+        if request and instance.follower_id == request.user.id:
+            instance.following.is_subscribed = True
         data = super().to_representation(instance)
         following_data = data.pop("following")
         result = {
@@ -412,10 +547,10 @@ class FollowSerializer(serializers.ModelSerializer):
             "last_name": following_data["last_name"],
             "is_subscribed": following_data.get("is_subscribed", False),
             "avatar": following_data.get("avatar", None),
-            "recipes": data["recipes"],
-            "recipes_count": data["recipes_count"],
+            "recipes": data.get("recipes"),
+            "recipes_count": data.get("recipes_count"),
         }
-        return result
+        return requested_fields(self).filter(result)
 
 
 class AvatarSerializer(serializers.ModelSerializer):
@@ -0,0 +1,424 @@
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.checks import run_checks
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.serializers import UserSerializer
+from api.throttling import TokenBucketThrottle
+from api.views import MAX_STATE_IDS
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
+from users.models import Follow, User
+
+TIERS = {
+    "anon": {"default": (3, 1), "expensive": (1, 0.5)},
+    "user": {"default": (5, 1), "expensive": None},
+    "staff": {"default": None, "expensive": None},
+}
+
+
+@override_settings(API_THROTTLE_ENABLED=True, API_THROTTLE_TIERS=TIERS)
+class TokenBucketThrottleTests(SimpleTestCase):
+    def setUp(self):
+        caches["throttle"].clear()
+        self.now = 1000.0
+        patcher = mock.patch("api.throttling.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = APIRequestFactory()
+
+    def allow(self, path="/api/recipes/", scope="default", user=None):
+        request = Request(self.factory.get(path))
+        request.user = user or AnonymousUser()
+        view = SimpleNamespace(throttle_scope=scope)
+        throttle = TokenBucketThrottle()
+        return throttle.allow_request(request, view), throttle.wait()
+
+    def burst(self, count, **kwargs):
+        return [self.allow(**kwargs)[0] for _ in range(count)]
+
+    def test_burst_up_to_capacity(self):
+        self.assertEqual(self.burst(4), [True, True, True, False])
+        allowed, wait = self.allow()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 1)
+
+    def test_tokens_refill_over_time(self):
+        self.burst(3)
+        self.now += 0.5
+        self.assertFalse(self.allow()[0])
+        self.now += 0.5
+        self.assertEqual(self.burst(2), [True, False])
+        # Пополнение не превышает ёмкость корзины
+        self.now += 60
+        self.assertEqual(self.burst(4), [True, True, True, False])
+
+    def test_scopes_have_separate_buckets(self):
+        self.assertEqual(self.burst(2, scope="expensive"), [True, False])
+        self.assertEqual(self.burst(3), [True, True, True])
+        self.assertEqual(self.burst(1, path="/api/recipes/?search=суп"), [False])
+        self.now += 2
+        self.assertEqual(self.burst(1, path="/api/recipes/?limit=50"), [True])
+        self.assertFalse(self.allow(scope="expensive")[0])
+
+    def test_clients_have_separate_buckets(self):
+        self.burst(3)
+        user = SimpleNamespace(pk=1, is_authenticated=True, is_staff=False)
+        self.assertEqual(self.burst(6, user=user), [True] * 5 + [False])
+        self.assertEqual(self.burst(3, scope="expensive", user=user), [True] * 3)
+
+    def test_denied_requests_do_not_spend_tokens(self):
+        self.burst(3)
+        self.burst(10)
+        self.now += 1
+        self.assertEqual(self.burst(2), [True, False])
+
+    def test_bucket_resets_when_cache_entry_is_lost(self):
+        self.burst(3)
+        caches["throttle"].clear()
+        self.assertEqual(self.burst(4), [True, True, True, False])
+
+    def test_concurrent_requests_do_not_overspend(self):
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: self.allow()[0], range(40)))
+        self.assertEqual(results.count(True), 3)
+
+    @override_settings(API_THROTTLE_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.burst(10), [True] * 10)
+
+
+@override_settings(
+    API_THROTTLE_ENABLED=True,
+    API_THROTTLE_TIERS={
+        **TIERS,
+        "anon": {"default": (3, 0.01)},
+        "user": {"default": (1000, 100)},
+    },
+)
+class ThrottleContentionTests(SimpleTestCase):
+    """Клиент, упёршийся в лимит, не мешает остальным."""
+
+    def setUp(self):
+        caches["throttle"].clear()
+        self.factory = APIRequestFactory()
+        self.view = SimpleNamespace(throttle_scope="default")
+
+    def allow(self, user):
+        request = Request(self.factory.get("/api/recipes/"))
+        request.user = user
+        started = time.perf_counter()
+        allowed = TokenBucketThrottle().allow_request(request, self.view)
+        return allowed, time.perf_counter() - started
+
+    def normal_client(self, requests=200):
+        user = SimpleNamespace(pk=1, is_authenticated=True, is_staff=False)
+        results = [self.allow(user) for _ in range(requests)]
+        latencies = sorted(latency for _, latency in results)
+        return [allowed for allowed, _ in results], latencies[
+            int(len(latencies) * 0.99)
+        ]
+
+    def test_hot_client_does_not_throttle_others(self):
+        _, baseline = self.normal_client()
+        caches["throttle"].clear()
+        hot = AnonymousUser()
+        with ThreadPoolExecutor(4) as pool:
+            flood = [pool.submit(self.allow, hot) for _ in range(4000)]
+            allowed, p99 = self.normal_client()
+        hot_allowed = [future.result()[0] for future in flood].count(True)
+        self.assertEqual(allowed, [True] * 200)
+        self.assertEqual(hot_allowed, 3)
+        # Переключение GIL между потоками добавляет до десятков миллисекунд
+        # в зависимости от загрузки машины, ожидания чужой корзины быть не
+        # должно
+        self.assertLess(p99, max(baseline * 50, 0.1))
+
+
+class ThrottleCacheCheckTests(SimpleTestCase):
+    def test_process_local_cache_warns_on_deploy(self):
+        ids = [message.id for message in run_checks(include_deployment_checks=True)]
+        self.assertIn("api.W001", ids)
+        with override_settings(API_THROTTLE_ENABLED=False):
+            ids = [message.id for message in run_checks(include_deployment_checks=True)]
+        self.assertNotIn("api.W001", ids)
+
+
+@override_settings(API_THROTTLE_ENABLED=True, API_THROTTLE_TIERS=TIERS)
+class ThrottledResponseTests(TestCase):
+    def setUp(self):
+        caches["throttle"].clear()
+
+    def test_exhausted_bucket_returns_429_with_retry_after(self):
+        client = APIClient()
+        statuses = [client.get("/api/ingredients/").status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        response = client.get("/api/ingredients/")
+        self.assertEqual(response["Retry-After"], "1")
+
+
+class SignupRaceTests(TestCase):
+    def test_duplicate_insert_reports_field_errors_inside_transaction(self):
+        User.objects.create_user(
+            username="Cook", email="cook@example.com", password="password"
+        )
+        # Проверка в to_internal_value пройдена, но строку успели вставить:
+        # create получает IntegrityError внутри транзакции теста
+        with self.assertRaises(ValidationError) as error:
+            UserSerializer().create(
+                {
+                    "username": "cook",
+                    "email": "COOK@example.com",
+                    "first_name": "Повар",
+                    "last_name": "Поваров",
+                    "password": "password",
+                }
+            )
+        self.assertEqual(set(error.exception.detail), {"email", "username"})
+        self.assertEqual(User.objects.count(), 1)
+
+
+@override_settings(API_THROTTLE_ENABLED=False)
+class BatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="cook", email="cook@example.com", password="password"
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name="Каша", text="Сварить", cooking_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe,
+            ingredient=Ingredient.objects.create(name="овсянка", measurement_unit="г"),
+            amount=100,
+        )
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def batch(self, paths, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        response = client.post("/api/batch/", {"requests": paths}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["responses"]
+
+    def test_mixed_statuses(self):
+        responses = self.batch(
+            [
+                f"/api/recipes/{self.recipe.pk}/",
+                "/api/recipes/999999/",
+                "/api/unknown/",
+                "/api/users/me/",
+            ]
+        )
+        self.assertEqual([item["status"] for item in responses], [200, 404, 404, 401])
+        self.assertEqual(responses[0]["body"]["name"], "Каша")
+
+    def test_rejects_recursion_and_foreign_urls(self):
+        paths = [
+            "/api/batch/",
+            "https://example.com/api/recipes/",
+            "//example.com/api/recipes/",
+            "/admin/",
+        ]
+        responses = self.batch(paths)
+        self.assertEqual([item["status"] for item in responses], [400] * len(paths))
+
+    def test_each_item_runs_as_batch_user(self):
+        paths = ["/api/users/me/", "/api/recipes/?is_in_shopping_cart=1"]
+        me, cart = self.batch(paths, self.user)
+        self.assertEqual((me["status"], me["body"]["username"]), (200, "cook"))
+        self.assertEqual(cart["body"]["count"], 1)
+        me, cart = self.batch(paths)
+        self.assertEqual(me["status"], 401)
+        self.assertEqual(cart["body"]["count"], 0)
+
+    def test_file_response_is_base64(self):
+        [item] = self.batch(["/api/recipes/download_shopping_cart/"], self.user)
+        self.assertEqual(item["status"], 200)
+        self.assertIsNone(item["body"])
+        self.assertTrue(item["content_type"].startswith("text/plain"))
+        content = base64.b64decode(item["body_base64"]).decode()
+        self.assertIn("овсянка (г) — 100", content)
+
+
+@override_settings(API_THROTTLE_ENABLED=False)
+class ShoppingCartTouchTests(TestCase):
+    def test_cart_actions_touch_remaining_rows(self):
+        user = User.objects.create_user(username="cook", email="c@example.com")
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=user, name=f"рецепт {number}", text="-", cooking_time=1)
+            for number in range(3)
+        )
+        ShoppingCart.objects.create(user=user, recipe=recipes[0])
+        client = APIClient()
+        client.force_authenticate(user)
+        for method, recipe in (("post", recipes[1]), ("delete", recipes[1])):
+            old = timezone.now() - timedelta(days=60)
+            ShoppingCart.objects.update(touched_at=old)
+            response = getattr(client, method)(
+                f"/api/recipes/{recipe.pk}/shopping_cart/"
+            )
+            self.assertIn(response.status_code, (201, 204))
+            self.assertGreater(
+                ShoppingCart.objects.get(recipe=recipes[0]).touched_at, old
+            )
+
+
+@override_settings(API_THROTTLE_ENABLED=False)
+class SparseFieldsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="author", email="a@example.com")
+        cls.reader = User.objects.create_user(username="reader", email="r@example.com")
+        ingredient = Ingredient.objects.create(name="овсянка", measurement_unit="г")
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f"Каша {number}", text="-", cooking_time=10
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=100
+            )
+            Favorite.objects.create(user=cls.reader, recipe=recipe)
+        Follow.objects.create(follower=cls.reader, following=cls.author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def get(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), len(queries)
+
+    def test_fields_selects_response_fields(self):
+        full, full_queries = self.get("/api/recipes/")
+        sparse, sparse_queries = self.get("/api/recipes/?fields=id,name,is_favorited")
+        self.assertEqual(
+            sparse["results"],
+            [
+                {key: item[key] for key in ("id", "name", "is_favorited")}
+                for item in full["results"]
+            ],
+        )
+        self.assertTrue(all(item["is_favorited"] for item in sparse["results"]))
+        # Автор, ингредиенты и подписка не загружаются
+        self.assertLess(sparse_queries, full_queries)
+
+    def test_omit_removes_fields(self):
+        full, _ = self.get("/api/recipes/")
+        [item, *_] = self.get("/api/recipes/?omit=text,ingredients")[0]["results"]
+        self.assertEqual(set(item), set(full["results"][0]) - {"text", "ingredients"})
+        recipe_id = full["results"][0]["id"]
+        detail, _ = self.get(f"/api/recipes/{recipe_id}/?fields=id,author")
+        self.assertEqual(set(detail), {"id", "author"})
+        self.assertEqual(detail["author"], full["results"][0]["author"])
+
+    def test_unknown_fields_are_ignored(self):
+        full, _ = self.get("/api/recipes/")
+        item = self.get("/api/recipes/?fields=id,unknown")[0]["results"][0]
+        self.assertEqual(item, {"id": full["results"][0]["id"]})
+        self.assertEqual(self.get("/api/recipes/?omit=unknown")[0], full)
+        empty = self.get("/api/recipes/?fields=unknown")[0]
+        self.assertEqual(empty["results"], [{}] * 3)
+
+    def test_subscriptions_fields(self):
+        data, _ = self.get("/api/users/subscriptions/?fields=id,recipes_count")
+        self.assertEqual(data["results"], [{"id": self.author.pk, "recipes_count": 3}])
+
+
+@override_settings(API_THROTTLE_ENABLED=False)
+class RecipeStateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="author", email="a@example.com")
+        cls.other = User.objects.create_user(username="other", email="o@example.com")
+        cls.reader = User.objects.create_user(username="reader", email="r@example.com")
+        cls.followed, cls.saved, cls.plain = (
+            Recipe.objects.create(
+                author=author, name=f"Каша {number}", text="-", cooking_time=10
+            )
+            for number, author in enumerate((cls.author, cls.author, cls.other))
+        )
+        Favorite.objects.create(user=cls.reader, recipe=cls.saved)
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.plain)
+        Follow.objects.create(follower=cls.reader, following=cls.author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def state(self, ids):
+        return self.client.get("/api/recipes/state/", {"ids": ids})
+
+    def test_flags_for_each_recipe(self):
+        ids = [self.plain.pk, self.saved.pk, self.followed.pk, self.saved.pk]
+        with self.assertNumQueries(3):
+            response = self.state(",".join(map(str, ids)))
+        self.assertEqual(response.status_code, 200)
+
+        def item(recipe, favorited, in_cart, subscribed):
+            return {
+                "id": recipe.pk,
+                "is_favorited": favorited,
+                "is_in_shopping_cart": in_cart,
+                "author": {"is_subscribed": subscribed},
+            }
+
+        # Повторный id отдаётся один раз, порядок — как в запросе
+        self.assertEqual(
+            response.json(),
+            [
+                item(self.plain, False, True, False),
+                item(self.saved, True, False, True),
+                item(self.followed, False, False, True),
+            ],
+        )
+
+    def test_unknown_ids_have_false_flags(self):
+        response = self.state(f"999999,{self.saved.pk}")
+        self.assertEqual(response.status_code, 200)
+        unknown, saved = response.json()
+        self.assertEqual(
+            unknown,
+            {
+                "id": 999999,
+                "is_favorited": False,
+                "is_in_shopping_cart": False,
+                "author": {"is_subscribed": False},
+            },
+        )
+        self.assertTrue(saved["is_favorited"])
+
+    def test_malformed_ids_are_rejected(self):
+        for ids in ("1,abc", "", ",", "1.5"):
+            with self.subTest(ids=ids):
+                response = self.state(ids)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("ids", response.json())
+        too_many = ",".join(str(number) for number in range(MAX_STATE_IDS + 1))
+        self.assertEqual(self.state(too_many).status_code, 400)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.state(str(self.saved.pk)).status_code, 401)
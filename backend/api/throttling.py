@@ -0,0 +1,105 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_SCOPE = "default"
+EXPENSIVE_SCOPE = "expensive"
+# Страница больше этой считается дорогим запросом
+EXPENSIVE_PAGE_SIZE = 20
+
+
+def request_scope(request, view):
+    """Бюджет, из которого списывается запрос.
+
+    Дорогие действия помечены `throttle_scope` у view или у `@action`;
+    поиск и большие страницы списков тоже считаются дорогими.
+    """
+    scope = getattr(view, "throttle_scope", DEFAULT_SCOPE)
+    if scope != DEFAULT_SCOPE:
+        return scope
+    if request.query_params.get("search"):
+        return EXPENSIVE_SCOPE
+    try:
+        if int(request.query_params.get("limit", 0)) > EXPENSIVE_PAGE_SIZE:
+            return EXPENSIVE_SCOPE
+    except ValueError:
+        pass
+    return DEFAULT_SCOPE
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Корзина токенов на клиента и бюджет.
+
+    Клиент — пользователь или IP анонима, бюджеты и уровни задаются в
+    `API_THROTTLE_TIERS` как (ёмкость, пополнение в секунду); `None` —
+    без ограничений. Состояние хранится в кеше `API_THROTTLE_CACHE`;
+    лимит общий для воркеров, только если этот кеш общий (Redis,
+    memcached), с кешем в памяти процесса он действует на каждый воркер.
+
+    Корзина хранится одним числом (алгоритм GCRA): моментом в
+    миллисекундах, когда она снова станет полной. Каждый запрос сдвигает
+    его на интервал пополнения одного токена атомарным `incr`, отказ
+    возвращает сдвиг через `decr`, так что параллельные запросы из разных
+    воркеров не могут потратить больше токенов, чем есть в корзине.
+    """
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_tier(self, request):
+        user = request.user
+        if user and user.is_authenticated:
+            return "staff" if user.is_staff else "user"
+        return "anon"
+
+    def get_cache_key(self, request, scope):
+        user = request.user
+        if user and user.is_authenticated:
+            ident = f"user:{user.pk}"
+        else:
+            ident = f"ip:{self.get_ident(request)}"
+        return f"throttle:{scope}:{ident}"
+
+    def allow_request(self, request, view):
+        if not settings.API_THROTTLE_ENABLED:
+            return True
+        scope = request_scope(request, view)
+        budget = settings.API_THROTTLE_TIERS[self.get_tier(request)].get(scope)
+        if budget is None:
+            return True
+        capacity, refill = budget
+        cache = caches[settings.API_THROTTLE_CACHE]
+        key = self.get_cache_key(request, scope)
+        interval = max(1, round(1000 / refill))
+        now = int(time.time() * 1000)
+        full_at = self.take_token(cache, key, now, interval)
+        if full_at - now > capacity * interval:
+            try:
+                cache.decr(key, interval)
+            except ValueError:
+                pass
+            self.wait_seconds = (full_at - now - capacity * interval) / 1000
+            return False
+        # Запись нужна, пока корзина не заполнится снова
+        cache.touch(key, math.ceil((full_at - now) / 1000) + 1)
+        return True
+
+    def take_token(self, cache, key, now, interval):
+        """Списывает токен и возвращает момент, когда корзина будет полной."""
+        try:
+            full_at = cache.incr(key, interval)
+        except ValueError:
+            if cache.add(key, now + interval, math.ceil(interval / 1000) + 1):
+                return now + interval
+            full_at = cache.incr(key, interval)
+        if full_at < now + interval:
+            # Корзина уже полна: отсчёт идёт от текущего момента. При гонке
+            # сдвиги складываются, и клиент получает меньше токенов, не больше.
+            full_at = cache.incr(key, now + interval - full_at)
+        return full_at
+
+    def wait(self):
+        return self.wait_seconds
@@ -2,6 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from api.views import (
     AccountViewSet,
+    BatchView,
     RecipeViewSet,
     IngredientViewSet,
     ShoppingCartIngredientsView,
@@ -22,5 +23,6 @@ urlpatterns = [
         ShoppingCartIngredientsView.as_view(),
         name="shopping_cart_ingredients",
     ),
+    path("batch/", BatchView.as_view(), name="batch"),
     path("s/<uuid:slug>/", redirect_short_link, name="short-link"),
 ]
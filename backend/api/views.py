@@ -1,3 +1,4 @@
+import time
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -10,26 +11,83 @@ from .serializers import (
     AvatarSerializer,
     RecipeIngredientSerializer,
     ShortRecipeSerializer,
+    uses_recipe_cache,
 )
-from users.models import User, Follow
-from recipes.models import Recipe, Ingredient, Favorite, ShoppingCart
+from users.models import AuthorSuggestion, User, Follow
+from users.tasks import delete_avatar
+from jobs.queue import enqueue
+from recipes.models import Recipe, Ingredient, Favorite, ShoppingCart, SimilarRecipe
+from recipes.similarity import SIMILAR_RECIPES_LIMIT
+from recipes.caches import ingredient_catalog, short_links
+from recipes.deletion import delete_recipes, delete_user
+from recipes.facets import recipe_facets
+from recipes.feed import feed_queryset
+from recipes.pantry import MAX_MISSING, MAX_PANTRY_SIZE, pantry_index
+from recipes.state import recipe_state_by_ids
+from recipes.suggestions import AUTHOR_SUGGESTIONS_LIMIT
+from recipes.trending import WINDOWS as TRENDING_WINDOWS, trending_scores
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
+from foodgram.server_timing import ServerTimingMixin
 from recipes.models import RecipeIngredient
+from .batch import dispatch_get
+from .fieldsets import FieldSet
 from .permissions import IsAuthorOrReadOnly
-from .pagination import LimitPageNumberPagination
+from .pagination import FeedCursorPagination, LimitPageNumberPagination
 from django.urls import reverse
 from django.shortcuts import redirect
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.contrib.auth import update_session_auth_hash
+from django.db.models import Count, Exists, OuterRef, Prefetch, Sum
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+
+MAX_STATE_IDS = 500
+MAX_BATCH_REQUESTS = 10
+MAX_FILTER_INGREDIENTS = 20
+
+
+def parse_ids(value, name):
+    try:
+        ids = sorted({int(item) for item in value.split(",") if item})
+    except ValueError:
+        raise ValidationError({name: "Id ингредиентов должны быть числами."})
+    if len(ids) > MAX_FILTER_INGREDIENTS:
+        raise ValidationError(
+            {name: f"Не более {MAX_FILTER_INGREDIENTS} ингредиентов."}
+        )
+    return ids
+
 
+def parse_minutes(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: "Время должно быть целым числом минут."})
 
-class AccountViewSet(viewsets.ModelViewSet):
+
+class AccountViewSet(ServerTimingMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     permission_classes = [permissions.AllowAny]
     pagination_class = LimitPageNumberPagination
     serializer_class = UserSerializer
 
+    def perform_destroy(self, instance):
+        delete_user(instance)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if (
+            self.request.method == "GET"
+            and user.is_authenticated
+            and "is_subscribed" in FieldSet.from_request(self.request)
+        ):
+            queryset = queryset.annotate(
+                is_subscribed=Exists(
+                    Follow.objects.filter(follower=user, following=OuterRef("pk"))
+                )
+            )
+        return queryset
+
     @action(
         detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
     )
@@ -68,12 +126,44 @@ class AccountViewSet(viewsets.ModelViewSet):
         follow.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
+    )
+    def suggestions(self, request):
+        """Авторы из `build_author_suggestions` без тех, на кого уже подписан."""
+        try:
+            limit = min(
+                int(request.query_params.get("limit", AUTHOR_SUGGESTIONS_LIMIT)),
+                AUTHOR_SUGGESTIONS_LIMIT,
+            )
+        except ValueError:
+            limit = AUTHOR_SUGGESTIONS_LIMIT
+        suggestions = (
+            AuthorSuggestion.objects.filter(user=request.user)
+            .filter(
+                ~Exists(
+                    Follow.objects.filter(
+                        follower=request.user, following=OuterRef("author")
+                    )
+                )
+            )
+            .select_related("author")
+            .order_by("-score")[: max(limit, 0)]
+        )
+        authors = []
+        for suggestion in suggestions:
+            suggestion.author.is_subscribed = False
+            authors.append(suggestion.author)
+        return Response(self.get_serializer(authors, many=True).data)
+
     @action(
         detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
     )
     def subscriptions(self, request):
         user = request.user
-        follows = user.following.all()
+        follows = user.following.select_related("following")
+        if "recipes_count" in FieldSet.from_request(request):
+            follows = follows.annotate(recipes_count=Count("following__recipes"))
         paginator = LimitPageNumberPagination()
         paginator.page_size = 6
         result_page = paginator.paginate_queryset(follows, request)
@@ -91,9 +181,12 @@ class AccountViewSet(viewsets.ModelViewSet):
     def update_avatar(self, request):
         user = request.user
         if request.method == "PUT":
+            previous = user.avatar.name if user.avatar else None
             serializer = AvatarSerializer(user, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            if previous and previous != user.avatar.name:
+                enqueue(delete_avatar, name=previous, requested_at=time.time())
             return Response(serializer.data, status=status.HTTP_200_OK)
         elif request.method == "DELETE":
             if not user.avatar:
@@ -101,9 +194,9 @@ class AccountViewSet(viewsets.ModelViewSet):
                     {"detail": "Аватар не установлен"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            user.avatar.delete()
+            enqueue(delete_avatar, name=user.avatar.name, requested_at=time.time())
             user.avatar = None
-            user.save()
+            user.save(update_fields=["avatar"])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -128,27 +221,79 @@ class AccountViewSet(viewsets.ModelViewSet):
 
         user.set_password(new_password)
         user.save()
-        update_session_auth_hash(request, user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ServerTimingMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     filter_backends = [filters.SearchFilter]
     search_fields = ["name", "author__username"]
     pagination_class = LimitPageNumberPagination
+    throttle_scope = "default"
+
+    def recipe_filters(self):
+        """Фильтры списка, общие для всех пользователей, в виде словаря.
+
+        `?ingredients=1,2` — рецепты со всеми указанными ингредиентами,
+        `?exclude_ingredients=3` — без них, `?cooking_time_min=` и
+        `?cooking_time_max=` — время приготовления в минутах.
+        """
+        params = self.request.query_params
+        filters = {}
+        if params.get("author"):
+            filters["author"] = params["author"]
+        for name in ("ingredients", "exclude_ingredients"):
+            ids = parse_ids(params.get(name, ""), name)
+            if ids:
+                filters[name] = ids
+        for name in ("cooking_time_min", "cooking_time_max"):
+            if params.get(name):
+                filters[name] = parse_minutes(params[name], name)
+        return filters
+
+    def facet_signature(self):
+        """Ключ кеша счётчиков или None, если выборка личная."""
+        params = self.request.query_params
+        if "1" in (params.get("is_favorited"), params.get("is_in_shopping_cart")):
+            return None
+        signature = self.recipe_filters()
+        search = " ".join(params.get("search", "").lower().split())
+        if search:
+            signature["search"] = search
+        return signature
 
     def get_queryset(self):
         queryset = self.queryset.all()
         user = self.request.user
-        author_id = self.request.query_params.get("author", None)
         is_favorited = self.request.query_params.get("is_favorited", None)
         is_in_shopping_cart = self.request.query_params.get("is_in_shopping_cart", None)
-
-        if author_id:
-            queryset = queryset.filter(author_id=author_id)
+        filters = self.recipe_filters()
+
+        if "author" in filters:
+            queryset = queryset.filter(author_id=filters["author"])
+        for ingredient_id in filters.get("ingredients", ()):
+            queryset = queryset.filter(
+                Exists(
+                    RecipeIngredient.objects.filter(
+                        recipe=OuterRef("pk"), ingredient_id=ingredient_id
+                    )
+                )
+            )
+        if "exclude_ingredients" in filters:
+            queryset = queryset.exclude(
+                Exists(
+                    RecipeIngredient.objects.filter(
+                        recipe=OuterRef("pk"),
+                        ingredient_id__in=filters["exclude_ingredients"],
+                    )
+                )
+            )
+        if "cooking_time_min" in filters:
+            queryset = queryset.filter(cooking_time__gte=filters["cooking_time_min"])
+        if "cooking_time_max" in filters:
+            queryset = queryset.filter(cooking_time__lte=filters["cooking_time_max"])
 
         if not user.is_authenticated and (
             is_favorited == "1" or is_in_shopping_cart == "1"
@@ -161,11 +306,75 @@ class RecipeViewSet(viewsets.ModelViewSet):
             if is_in_shopping_cart == "1":
                 queryset = queryset.filter(in_shopping_carts__user=user).distinct()
 
+        if self.request.method == "GET":
+            queryset = self.with_fields(queryset)
         return queryset
 
+    def with_fields(self, queryset):
+        """Готовит выборку только под запрошенные поля (`?fields=`/`?omit=`).
+
+        Если ответ собирается из кеша общих частей, читаются только id и
+        автор. Иначе автор и ингредиенты подгружаются пачкой, а
+        неотдаваемый `text` не читается из БД. Флаги пользователя в обоих
+        случаях считаются подзапросами.
+        """
+        fieldset = FieldSet.from_request(self.request)
+        user = self.request.user
+        if uses_recipe_cache(fieldset):
+            # Остальное сериализатор возьмёт из кеша или дочитает для промахов
+            queryset = queryset.only("id", "author")
+        else:
+            if "author" in fieldset:
+                queryset = queryset.select_related("author")
+            if "ingredients" in fieldset:
+                queryset = queryset.prefetch_related(
+                    Prefetch(
+                        "recipeingredient_set",
+                        queryset=RecipeIngredient.objects.select_related("ingredient"),
+                    )
+                )
+            if "text" not in fieldset:
+                queryset = queryset.defer("text")
+        if user.is_authenticated:
+            if "author" in fieldset:
+                queryset = queryset.annotate(
+                    author_is_subscribed=Exists(
+                        Follow.objects.filter(
+                            follower=user, following=OuterRef("author")
+                        )
+                    )
+                )
+            if "is_favorited" in fieldset:
+                queryset = queryset.annotate(
+                    is_favorited=Exists(
+                        Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+                    )
+                )
+            if "is_in_shopping_cart" in fieldset:
+                queryset = queryset.annotate(
+                    is_in_shopping_cart=Exists(
+                        ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+                    )
+                )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """`?facets=1` добавляет к странице счётчики для панели фильтров."""
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get("facets") == "1" and isinstance(
+            response.data, dict
+        ):
+            response.data["facets"] = recipe_facets.get(
+                self.facet_signature(), self.filter_queryset(self.get_queryset())
+            )
+        return response
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        delete_recipes(Recipe.objects.filter(pk=instance.pk))
+
     @action(
         detail=True,
         methods=["post", "delete"],
@@ -206,6 +415,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     {"detail": "Рецепт уже в корзине"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
+            # Корзина используется: остальные записи рано удалять по сроку
+            user.shopping_carts.update(touched_at=timezone.now())
             ShoppingCart.objects.create(user=user, recipe=recipe)
             serializer = ShortRecipeSerializer(recipe, context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -214,13 +425,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
             shopping_cart = user.shopping_carts.filter(recipe=recipe).first()
             if shopping_cart:
                 shopping_cart.delete()
+                user.shopping_carts.update(touched_at=timezone.now())
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
                 {"detail": "Рецепт не в корзине"}, status=status.HTTP_400_BAD_REQUEST
             )
 
     @action(
-        detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+        throttle_scope="expensive",
     )
     def shopping_cart_ingredients(self, request):
         user = request.user
@@ -232,11 +447,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(
-        detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+        throttle_scope="expensive",
     )
     def download_shopping_cart(self, request):
         user = request.user
         shopping_cart = user.shopping_carts.all()
+        # Скачанная корзина используется, её рано удалять по сроку хранения
+        shopping_cart.update(touched_at=timezone.now())
         recipes = [item.recipe for item in shopping_cart]
         ingredients = (
             RecipeIngredient.objects.filter(recipe__in=recipes)
@@ -253,6 +473,142 @@ class RecipeViewSet(viewsets.ModelViewSet):
             headers={"Content-Disposition": 'attachment; filename="shopping_list.txt"'},
         )
 
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+        pagination_class=FeedCursorPagination,
+    )
+    def feed(self, request):
+        queryset = self.with_fields(feed_queryset(request.user))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def trending(self, request):
+        window = request.query_params.get("window", "24h")
+        if window not in TRENDING_WINDOWS:
+            return Response(
+                {"window": f"Допустимые значения: {', '.join(TRENDING_WINDOWS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        page = self.paginate_queryset(trending_scores(window))
+        recipes = self.with_fields(Recipe.objects.all()).in_bulk(
+            [row["recipe_id"] for row in page]
+        )
+        serializer = self.get_serializer(
+            [recipes[row["recipe_id"]] for row in page if row["recipe_id"] in recipes],
+            many=True,
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=["get"], throttle_scope="expensive")
+    def pantry(self, request):
+        try:
+            ingredient_ids = [
+                int(value)
+                for value in request.query_params.get("ingredients", "").split(",")
+                if value
+            ]
+            max_missing = int(request.query_params.get("missing", 0))
+        except ValueError:
+            return Response(
+                {"detail": "Id ингредиентов и missing должны быть числами."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not ingredient_ids:
+            return Response(
+                {"ingredients": "Укажите хотя бы один ингредиент."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(ingredient_ids) > MAX_PANTRY_SIZE:
+            return Response(
+                {"ingredients": f"Не более {MAX_PANTRY_SIZE} ингредиентов."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 0 <= max_missing <= MAX_MISSING:
+            return Response(
+                {"missing": f"Значение должно быть от 0 до {MAX_MISSING}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        page = self.paginate_queryset(pantry_index.match(ingredient_ids, max_missing))
+        recipes = self.with_fields(Recipe.objects.all()).in_bulk(
+            [recipe_id for recipe_id, _ in page]
+        )
+        page = [
+            (recipes[recipe_id], missing)
+            for recipe_id, missing in page
+            if recipe_id in recipes
+        ]
+        # Одним списком: флаги пользователя считаются на всю страницу сразу
+        results = self.get_serializer([recipe for recipe, _ in page], many=True).data
+        for data, (_, missing) in zip(results, page):
+            data["missing"] = missing
+        return self.get_paginated_response(results)
+
+    @action(
+        detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
+    )
+    def state(self, request):
+        try:
+            recipe_ids = list(
+                dict.fromkeys(
+                    int(value)
+                    for value in request.query_params.get("ids", "").split(",")
+                    if value
+                )
+            )
+        except ValueError:
+            return Response(
+                {"ids": "Id рецептов должны быть числами."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not recipe_ids:
+            return Response(
+                {"ids": "Укажите хотя бы один рецепт."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(recipe_ids) > MAX_STATE_IDS:
+            return Response(
+                {"ids": f"Не более {MAX_STATE_IDS} рецептов."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        results = []
+        for recipe_id, flags in recipe_state_by_ids(request, recipe_ids).items():
+            favorited, in_shopping_cart, subscribed = flags
+            results.append(
+                {
+                    "id": recipe_id,
+                    "is_favorited": favorited,
+                    "is_in_shopping_cart": in_shopping_cart,
+                    "author": {"is_subscribed": subscribed},
+                }
+            )
+        return Response(results)
+
+    @action(detail=True, methods=["get"])
+    def similar(self, request, pk=None):
+        try:
+            limit = min(
+                int(request.query_params.get("limit", SIMILAR_RECIPES_LIMIT)),
+                SIMILAR_RECIPES_LIMIT,
+            )
+        except ValueError:
+            limit = SIMILAR_RECIPES_LIMIT
+        neighbors = (
+            SimilarRecipe.objects.filter(recipe_id=pk)
+            .select_related("similar")
+            .order_by("-score")[: max(limit, 0)]
+        )
+        recipes = [neighbor.similar for neighbor in neighbors]
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        serializer = ShortRecipeSerializer(
+            recipes, many=True, context={"request": request}
+        )
+        return Response(serializer.data)
+
     @action(detail=True, methods=["get"], url_path="get-link")
     def get_short_link(self, request, pk=None):
         recipe = self.get_object()
@@ -262,7 +618,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response({"short-link": short_link})
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ServerTimingMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all().order_by("id")
     serializer_class = IngredientSerializer
     permission_classes = [permissions.AllowAny]
@@ -274,9 +630,16 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
             return self.queryset.filter(name__istartswith=name)
         return self.queryset
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if name:
+            return Response(ingredient_catalog.search(name))
+        return Response(ingredient_catalog.all())
+
 
 class ShoppingCartIngredientsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "expensive"
 
     def get(self, request):
         user = request.user
@@ -287,7 +650,37 @@ class ShoppingCartIngredientsView(APIView):
         return Response(serializer.data)
 
 
+class BatchView(APIView):
+    """Несколько GET-запросов к API за один HTTP-запрос.
+
+    Тело: `{"requests": ["/api/recipes/1/", "/api/users/me/"]}`. Ответы
+    возвращаются в том же порядке, каждый со своим статусом (см.
+    `dispatch_get`).
+    """
+
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        paths = request.data.get("requests") if isinstance(request.data, dict) else None
+        if (
+            not isinstance(paths, list)
+            or not paths
+            or not all(isinstance(path, str) for path in paths)
+        ):
+            return Response(
+                {"requests": "Передайте непустой список путей."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(paths) > MAX_BATCH_REQUESTS:
+            return Response(
+                {"requests": f"Не более {MAX_BATCH_REQUESTS} запросов."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response({"responses": [dispatch_get(request, path) for path in paths]})
+
+
 def redirect_short_link(request, slug):
-    recipe = get_object_or_404(Recipe, short_uuid=slug)
-    url = reverse("recipes-detail", args=[recipe.id])
-    return redirect(url)
+    recipe_id = short_links.get(slug)
+    if recipe_id is None:
+        raise Http404
+    return redirect(reverse("recipes-detail", args=[recipe_id]))
@@ -0,0 +1,123 @@
+import hashlib
+import math
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# Токены читаем с основной БД: только что выданный токен может ещё
+# не доехать до реплики, а удалённый — продолжать там работать.
+PRIMARY_MODELS = {"authtoken.token"}
+LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != "default"]
+
+
+def _sticky_key(request):
+    authorization = request.META.get("HTTP_AUTHORIZATION")
+    if not authorization:
+        return None
+    digest = hashlib.sha256(authorization.encode()).hexdigest()
+    return f"replica-sticky:{digest}"
+
+
+class ReplicaRoutingMiddleware:
+    """Разрешает чтение с реплик для безопасных запросов к API.
+
+    После успешного изменяющего запроса клиент на
+    `REPLICA_STICKY_SECONDS` секунд закрепляется за основной БД, чтобы
+    видеть собственные изменения. Клиент определяется по заголовку
+    Authorization, отметка хранится в кеше (общем для всех воркеров,
+    если настроен общий бэкенд кеша).
+    """
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = _sticky_key(request)
+        safe = request.method in SAFE_METHODS
+        use_replicas = (
+            safe and request.path.startswith("/api/") and not (key and cache.get(key))
+        )
+        token = _replica_reads.set(use_replicas)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+        if key and not safe and response.status_code < 400:
+            cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+
+class ReplicaRouter:
+    """Отправляет чтение на случайную реплику с допустимым отставанием.
+
+    Вне запросов, помеченных `ReplicaRoutingMiddleware` (команды, запись,
+    открытая транзакция), всё идёт в `default`. Отставание реплик
+    проверяется не чаще `REPLICA_LAG_CHECK_INTERVAL` секунд; недоступная
+    или отставшая реплика исключается до следующей проверки.
+    """
+
+    def __init__(self):
+        self.replicas = replica_aliases()
+        self.checked_at = {}
+        self.healthy = {}
+
+    def db_for_read(self, model, **hints):
+        if (
+            not self.replicas
+            or not _replica_reads.get()
+            or model._meta.label_lower in PRIMARY_MODELS
+            or connections["default"].in_atomic_block
+        ):
+            return "default"
+        replicas = self.healthy_replicas()
+        return random.choice(replicas) if replicas else "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+    def healthy_replicas(self):
+        now = time.monotonic()
+        for alias in self.replicas:
+            if now - self.checked_at.get(alias, -math.inf) >= (
+                settings.REPLICA_LAG_CHECK_INTERVAL
+            ):
+                self.checked_at[alias] = now
+                self.healthy[alias] = self.lag(alias) <= settings.REPLICA_MAX_LAG
+        return [alias for alias in self.replicas if self.healthy[alias]]
+
+    def lag(self, alias):
+        """Отставание реплики в секундах, inf — если она недоступна."""
+        connection = connections[alias]
+        if connection.vendor != "postgresql":
+            return 0.0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            connection.close()
+            return math.inf
+        return float(lag or 0)
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler
+from django.utils.module_loading import import_string
+
+API_PREFIX = "/api/"
+
+
+class ApiWSGIHandler(WSGIHandler):
+    """WSGIHandler с цепочкой `API_MIDDLEWARE` вместо `MIDDLEWARE`.
+
+    API аутентифицирует только по токену, поэтому сессии, CSRF, сообщения
+    и AuthenticationMiddleware ему не нужны.
+    """
+
+    def load_middleware(self, is_async=False):
+        # Та же сборка, что в BaseHandler.load_middleware, но из
+        # API_MIDDLEWARE и только синхронная: глобальный settings.MIDDLEWARE
+        # не подменяется, поэтому сборка безопасна в любом потоке.
+        if is_async:
+            raise ImproperlyConfigured("ApiWSGIHandler работает только в WSGI.")
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+        handler = convert_exception_to_response(self._get_response)
+        for middleware_path in reversed(settings.API_MIDDLEWARE):
+            middleware = import_string(middleware_path)
+            try:
+                instance = middleware(handler)
+            except MiddlewareNotUsed:
+                continue
+            if instance is None:
+                raise ImproperlyConfigured(
+                    f"Middleware factory {middleware_path} returned None."
+                )
+            if hasattr(instance, "process_view"):
+                self._view_middleware.insert(0, instance.process_view)
+            if hasattr(instance, "process_template_response"):
+                self._template_response_middleware.append(
+                    instance.process_template_response
+                )
+            if hasattr(instance, "process_exception"):
+                self._exception_middleware.append(instance.process_exception)
+            handler = convert_exception_to_response(instance)
+        self._middleware_chain = handler
+
+
+class PathDispatchHandler:
+    """Отправляет запросы к `/api/` в укороченную цепочку, остальные — в полную."""
+
+    def __init__(self, default, api):
+        self.default = default
+        self.api = api
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "").startswith(API_PREFIX):
+            return self.api(environ, start_response)
+        return self.default(environ, start_response)
@@ -0,0 +1,32 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+ESTIMATE_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки для больших таблиц.
+
+    Для списка без фильтров в PostgreSQL число строк берётся из
+    статистики планировщика (`pg_class.reltuples`) вместо `COUNT(*)`,
+    который на миллионах строк читает всю таблицу. Небольшие таблицы и
+    отфильтрованные списки считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, "query", None)
+        if query is not None and not query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                        [queryset.model._meta.db_table],
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] >= ESTIMATE_THRESHOLD:
+                    return int(row[0])
+        return super().count
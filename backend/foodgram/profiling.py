@@ -0,0 +1,242 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.urls import reverse
+
+HEADER = "HTTP_X_PROFILE"
+QUERY_FLAG = "_profile"
+MODES = ("cprofile", "sample")
+PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]{6}-[0-9a-f]{4}$")
+STATS_LIMIT = 60
+
+# В Python 3.12+ одновременно может работать только один cProfile, а
+# сэмплер и так видит весь процесс: профилируем по одному запросу.
+_lock = threading.Lock()
+
+
+class Sampler:
+    """Сэмплирующий профилировщик одного потока на sys._current_frames.
+
+    Раз в `interval` секунд снимает стек потока и считает одинаковые
+    стеки; результат — «свёрнутые» стеки для flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                    f":{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.items())
+
+
+class SqlTimeline:
+    """Запросы к БД с временем начала от старта запроса и длительностью."""
+
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "alias": context["connection"].alias,
+                    "start_ms": round((start - self.started) * 1000, 2),
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                    "sql": sql,
+                }
+            )
+
+
+def _is_staff(request):
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    if authorization.startswith("Token "):
+        from rest_framework.authtoken.models import Token
+
+        token = (
+            Token.objects.select_related("user")
+            .filter(key=authorization[len("Token ") :])
+            .first()
+        )
+        return bool(token and token.user.is_active and token.user.is_staff)
+    user = getattr(request, "user", None)
+    return bool(user and user.is_staff)
+
+
+def _rotate():
+    names = sorted(
+        name for name in os.listdir(settings.PROFILING_DIR) if name.endswith(".json")
+    )
+    for name in names[: -settings.PROFILING_KEEP]:
+        for suffix in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(settings.PROFILING_DIR, name[:-5] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос сотрудника по заголовку `X-Profile` или `?_profile=`.
+
+    Значение — `cprofile` (по умолчанию) или `sample`. Результат с
+    временной шкалой SQL сохраняется в `PROFILING_DIR` (хранятся последние
+    `PROFILING_KEEP`), ссылка на него возвращается в заголовке
+    `X-Profile-URL`. Обычный запрос проходит одну проверку словаря.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.META.get(HEADER) or request.GET.get(QUERY_FLAG)
+        if not mode:
+            return self.get_response(request)
+        mode = mode if mode in MODES else MODES[0]
+        if not _is_staff(request) or not _lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, mode)
+        finally:
+            _lock.release()
+
+    def profile(self, request, mode):
+        started = time.perf_counter()
+        timeline = SqlTimeline(started)
+        profiler = cProfile.Profile() if mode == "cprofile" else None
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(connections[alias].execute_wrapper(timeline))
+            if profiler is None:
+                sampler = stack.enter_context(
+                    Sampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL)
+                )
+                response = self.get_response(request)
+            else:
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+        duration = (time.perf_counter() - started) * 1000
+
+        # Имена сортируются по времени — на этом держится ротация
+        profile_id = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:4]}"
+        data = {
+            "id": profile_id,
+            "mode": mode,
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "duration_ms": round(duration, 2),
+            "sql_ms": round(sum(query["duration_ms"] for query in timeline.queries), 2),
+            "sql": timeline.queries,
+        }
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        base = os.path.join(settings.PROFILING_DIR, profile_id)
+        if profiler is None:
+            data["collapsed"] = sampler.collapsed()
+        else:
+            profiler.dump_stats(base + ".prof")
+            output = io.StringIO()
+            stats = pstats.Stats(profiler, stream=output)
+            stats.sort_stats("cumulative").print_stats(STATS_LIMIT)
+            data["stats"] = output.getvalue()
+        with open(base + ".json", "w") as file:
+            json.dump(data, file, ensure_ascii=False)
+        _rotate()
+        response["X-Profile-URL"] = request.build_absolute_uri(
+            reverse("profile-detail", args=[profile_id])
+        )
+        return response
+
+
+def _load(profile_id):
+    if not PROFILE_ID.match(profile_id):
+        raise Http404
+    try:
+        with open(os.path.join(settings.PROFILING_DIR, profile_id + ".json")) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        raise Http404
+
+
+@staff_member_required
+def profile_list(request):
+    profiles = []
+    if os.path.isdir(settings.PROFILING_DIR):
+        for name in sorted(os.listdir(settings.PROFILING_DIR), reverse=True):
+            if name.endswith(".json"):
+                data = _load(name[:-5])
+                data["queries"] = len(data.pop("sql"))
+                profiles.append(data)
+    return render(
+        request,
+        "admin/profiles/list.html",
+        {"title": "Профили запросов", "profiles": profiles},
+    )
+
+
+@staff_member_required
+def profile_detail(request, profile_id):
+    data = _load(profile_id)
+    export = request.GET.get("export")
+    if export == "collapsed" and "collapsed" in data:
+        return HttpResponse(data["collapsed"], content_type="text/plain")
+    if export == "prof" and data["mode"] == "cprofile":
+        with open(
+            os.path.join(settings.PROFILING_DIR, profile_id + ".prof"), "rb"
+        ) as file:
+            response = HttpResponse(
+                file.read(), content_type="application/octet-stream"
+            )
+        response["Content-Disposition"] = f'attachment; filename="{profile_id}.prof"'
+        return response
+    return render(
+        request,
+        "admin/profiles/detail.html",
+        {"title": f"{data['method']} {data['path']}", "profile": data},
+    )
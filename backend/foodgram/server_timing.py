@@ -0,0 +1,131 @@
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+# Фазы в порядке вывода. Значение заголовка должно быть в latin-1,
+# поэтому обходимся без русских desc.
+PHASES = ("auth", "db", "serialize", "render", "view", "mw")
+
+
+class Timings:
+    """Длительности фаз одного запроса в секундах.
+
+    Фаза `measure()` учитывается целиком, вместе с запросами к БД внутри
+    неё. В `db` попадают только запросы вне измеряемых фаз, то есть
+    выборки `get_queryset` и кода view. Поэтому фазы не пересекаются и в
+    сумме дают `total`.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.sql = 0.0
+        self.sql_in_phases = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - start
+
+    @contextmanager
+    def measure(self, name):
+        start, sql = time.perf_counter(), self.sql
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (
+                time.perf_counter() - start
+            )
+            self.sql_in_phases += self.sql - sql
+
+    @contextmanager
+    def dispatch(self):
+        """Весь вызов view: подключает учёт SQL и считает `db` и `view`."""
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield
+        elapsed = time.perf_counter() - start
+        self.phases["db"] = self.sql - self.sql_in_phases
+        self.phases["view"] = elapsed - sum(self.phases.values())
+        self.phases["dispatch"] = elapsed
+
+
+class ServerTimingMixin:
+    """Размечает фазы DRF-view для заголовка `Server-Timing`.
+
+    Ставится первым базовым классом view; заголовок собирает
+    `ServerTimingMiddleware`.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.SERVER_TIMING_ENABLED:
+            return super().dispatch(request, *args, **kwargs)
+        request.server_timing = timings = Timings()
+        with timings.dispatch():
+            return super().dispatch(request, *args, **kwargs)
+
+    def perform_authentication(self, request):
+        timings = getattr(request, "server_timing", None)
+        if timings is None:
+            return super().perform_authentication(request)
+        with timings.measure("auth"):
+            super().perform_authentication(request)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        timings = getattr(self.request, "server_timing", None)
+        if timings is not None:
+            to_representation = serializer.to_representation
+
+            def timed(instance):
+                with timings.measure("serialize"):
+                    return to_representation(instance)
+
+            serializer.to_representation = timed
+        return serializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        timings = getattr(request, "server_timing", None)
+        # Файлы (список покупок) отдаются обычным HttpResponse
+        if timings is not None and not getattr(response, "is_rendered", True):
+            with timings.measure("render"):
+                response.render()
+        return response
+
+
+class ServerTimingMiddleware:
+    """Добавляет к ответам API заголовок `Server-Timing`.
+
+    Время, не попавшее в вызов view, относится к middleware. Для view без
+    `ServerTimingMixin` в заголовке будут только `mw` и `total`. Заголовок
+    получают сотрудники (пользователя DRF проставляет в запрос при
+    аутентификации), а при `DEBUG` — все.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SERVER_TIMING_ENABLED or not request.path.startswith("/api/"):
+            return self.get_response(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        total = time.perf_counter() - start
+        user = getattr(request, "user", None)
+        if not settings.DEBUG and not (user and user.is_staff):
+            return response
+        timings = getattr(request, "server_timing", None)
+        phases = dict(timings.phases) if timings is not None else {}
+        phases["mw"] = total - phases.pop("dispatch", 0.0)
+        metrics = [
+            f"{name};dur={phases[name] * 1000:.2f}" for name in PHASES if name in phases
+        ]
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        response["Server-Timing"] = ", ".join(metrics)
+        return response
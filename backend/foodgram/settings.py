@@ -1,6 +1,7 @@
 from datetime import timedelta
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -12,7 +13,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv("SECRET_KEY", "unsafe-default-key")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1")
+# Запуск `manage.py test`
+TESTING = sys.argv[1:2] == ["test"]
 
 # ALLOWED_HOSTS = ["localhost", "127.0.0.1"]
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost").split(",")
@@ -32,24 +35,38 @@ INSTALLED_APPS = [
     "recipes",
     "users",
     "api",
+    "jobs",
 ]
 
 MIDDLEWARE = [
+    "foodgram.server_timing.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "foodgram.db_router.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "foodgram.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Цепочка для /api/ (foodgram/handlers.py): API аутентифицирует только по
+# токену, сессии, CSRF и сообщения ему не нужны
+API_MIDDLEWARE = [
+    "foodgram.server_timing.ServerTimingMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    "foodgram.db_router.ReplicaRoutingMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "foodgram.profiling.ProfilingMiddleware",
+]
+
 ROOT_URLCONF = "foodgram.urls"
 
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
-        "DIRS": [],
+        "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
@@ -79,7 +96,69 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", "postgres"),
         "HOST": os.getenv("DB_HOST", "db"),
         "PORT": os.getenv("DB_PORT", "5432"),
+        # Постоянные соединения: без них каждый запрос заново подключается к БД
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+    }
+}
+
+# Реплики для чтения: DB_REPLICA_HOSTS=replica1,replica2
+for number, host in enumerate(
+    filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), start=1
+):
+    DATABASES[f"replica_{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
     }
+# В тестах роутер проверяется на реплике, которая указывает на ту же БД
+if TESTING and len(DATABASES) == 1:
+    DATABASES["replica_1"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+
+DATABASE_ROUTERS = ["foodgram.db_router.ReplicaRouter"]
+# Сколько секунд после записи клиент читает только с основной БД
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 10))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 5))
+REPLICA_LAG_CHECK_INTERVAL = int(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 2))
+
+# Миграции не хранятся в репозитории: тестовая БД строится прямо по моделям
+if TESTING:
+    MIGRATION_MODULES = {app: None for app in ("users", "recipes", "jobs")}
+
+# Для нескольких воркеров нужен общий кеш, например
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    },
+    # JSON рецептов отдельно от лимитов запросов: множество записей
+    # рецептов не должно вытеснять корзины токенов
+    "recipes": {
+        "BACKEND": os.getenv(
+            "RECIPE_CACHE_BACKEND",
+            os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        ),
+        "LOCATION": os.getenv(
+            "RECIPE_CACHE_LOCATION", os.getenv("CACHE_LOCATION", "recipes")
+        ),
+        "KEY_PREFIX": "recipes",
+    },
+    # Корзины токенов лимитов запросов. В кеше в памяти процесса у
+    # каждого воркера своя корзина, и клиент получает лимит × число
+    # воркеров; manage.py check --deploy предупреждает об этом
+    "throttle": {
+        "BACKEND": os.getenv(
+            "THROTTLE_CACHE_BACKEND",
+            os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        ),
+        "LOCATION": os.getenv(
+            "THROTTLE_CACHE_LOCATION", os.getenv("CACHE_LOCATION", "throttle")
+        ),
+        "KEY_PREFIX": "throttle",
+    },
 }
 
 
@@ -108,6 +187,9 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
+    "DEFAULT_THROTTLE_CLASSES": ["api.throttling.TokenBucketThrottle"],
+    # IP клиента берётся из X-Forwarded-For, который выставляет nginx
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 1)),
     "DEFAULT_PAGINATION_CLASS": "api.pagination.LimitPageNumberPagination",
     "PAGE_SIZE": 6,
     "DEFAULT_RENDERER_CLASSES": [
@@ -121,6 +203,20 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Ограничение частоты запросов: уровень клиента → бюджет →
+# (ёмкость корзины токенов, пополнение токенов в секунду); None — без лимита.
+# Дорогие запросы: выгрузка списка покупок, поиск, большие страницы.
+API_THROTTLE_ENABLED = os.getenv("API_THROTTLE_ENABLED", "True").lower() in (
+    "true",
+    "1",
+)
+API_THROTTLE_CACHE = "throttle"
+API_THROTTLE_TIERS = {
+    "anon": {"default": (60, 2), "expensive": (5, 0.05)},
+    "user": {"default": (120, 5), "expensive": (10, 0.1)},
+    "staff": {"default": None, "expensive": None},
+}
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
     "AUTH_HEADER_TYPES": ("Bearer",),
@@ -142,6 +238,56 @@ DJOSER = {
     },
 }
 
+# Индекс «что приготовить из своих продуктов»: снимок строит команда
+# rebuild_pantry_index, изменения рецептов подтягиваются раз в столько секунд
+PANTRY_INDEX_PATH = os.getenv(
+    "PANTRY_INDEX_PATH", os.path.join(BASE_DIR, "indexes", "pantry.pickle")
+)
+PANTRY_INDEX_SYNC_INTERVAL = int(os.getenv("PANTRY_INDEX_SYNC_INTERVAL", 5))
+
+# Лента подписок: inbox ведётся только для тех, у кого немного подписок;
+# при подписке сразу кладутся FEED_INBOX_BACKFILL новых рецептов автора,
+# остальные докладывает фоновая задача
+FEED_INBOX_MAX_FOLLOWS = int(os.getenv("FEED_INBOX_MAX_FOLLOWS", 200))
+FEED_INBOX_BACKFILL = int(os.getenv("FEED_INBOX_BACKFILL", 100))
+
+# Кеши справочника ингредиентов и коротких ссылок в памяти процесса
+INGREDIENT_CACHE_TTL = int(os.getenv("INGREDIENT_CACHE_TTL", 300))
+# Сколько коротких ссылок новых рецептов загрузить при старте gunicorn
+SHORT_LINK_WARMUP = int(os.getenv("SHORT_LINK_WARMUP", 10000))
+# Общая для всех зрителей часть JSON рецептов; 0 отключает кеш. Кеш
+# работает только с общим для воркеров бэкендом (не LocMemCache)
+RECIPE_CACHE = "recipes"
+RECIPE_CACHE_TTL = int(os.getenv("RECIPE_CACHE_TTL", 300))
+# Счётчики фильтров списка рецептов (?facets=1) хранятся в RECIPE_CACHE;
+# сочетание фильтров кешируется после FACET_CACHE_MIN_HITS запросов, 0 — не кешировать
+FACET_CACHE_TTL = int(os.getenv("FACET_CACHE_TTL", 300))
+FACET_CACHE_MIN_HITS = int(os.getenv("FACET_CACHE_MIN_HITS", 3))
+
+# Размер пачки при удалении пользователей и рецептов (recipes/deletion.py)
+DELETE_CHUNK_SIZE = int(os.getenv("DELETE_CHUNK_SIZE", 1000))
+
+# Записи корзины, которыми не пользовались столько дней, удаляет
+# purge_shopping_carts; 0 отключает удаление
+SHOPPING_CART_RETENTION_DAYS = int(os.getenv("SHOPPING_CART_RETENTION_DAYS", 90))
+SHOPPING_CART_ARCHIVE_DIR = os.getenv(
+    "SHOPPING_CART_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive")
+)
+
+# Профилирование запросов сотрудников по заголовку X-Profile
+# (foodgram/profiling.py), результаты — в /admin/profiles/
+PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILING_KEEP = int(os.getenv("PROFILING_KEEP", 50))
+PROFILING_SAMPLE_INTERVAL = float(os.getenv("PROFILING_SAMPLE_INTERVAL", 0.005))
+
+# Заголовок Server-Timing с разбивкой времени ответа API по фазам. Он
+# раскрывает внутренние тайминги, поэтому отдаётся только сотрудникам
+# (или всем при DEBUG)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "False").lower() in (
+    "true",
+    "1",
+)
+
 # Internationalization
 LANGUAGE_CODE = "ru-ru"
 TIME_ZONE = "Europe/Moscow"
@@ -156,5 +302,20 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Имена статики и медиа зависят от содержимого, что позволяет nginx
+# кешировать их бессрочно (infra/nginx.conf). Хешированным именам нужен
+# манифест от collectstatic, поэтому при разработке и в тестах статика
+# отдаётся под исходными именами.
+STORAGES = {
+    "default": {"BACKEND": "foodgram.storage.ContentAddressedStorage"},
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage"
+            if DEBUG or TESTING
+            else "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"
+        )
+    },
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -0,0 +1,65 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.utils import validate_file_name
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище медиа, где имя файла — SHA-256 его содержимого.
+
+    `recipes/photo.png` сохраняется как `recipes/ab/ab12…ef.png`. Имя
+    меняется вместе с содержимым, поэтому nginx может отдавать файлы с
+    бессрочным кешированием, а одинаковые загрузки хранятся один раз —
+    удалять файл можно, только если на него больше никто не ссылается.
+    Повторная загрузка уже сохранённого файла обновляет время его
+    изменения: так отложенное удаление (`delete_unused`) и `gc_media`
+    видят, что файл снова нужен, даже если запись о нём ещё не сохранена.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        name = os.path.join(directory, digest[:2], digest + extension)
+        validate_file_name(name, allow_relative_path=True)
+        if self.exists(name):
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                # Файл удалили между проверками — сохраняем заново
+                pass
+        name = self._save(self.get_available_name(name, max_length), content)
+        validate_file_name(name, allow_relative_path=True)
+        return name
+
+
+def delete_unused(name, in_use, requested_at=None):
+    """Удаляет файл, если он не нужен; возвращает True, если удалил.
+
+    `in_use()` проверяет ссылки в БД на момент удаления. Файл, который
+    загрузили заново после `requested_at` (время постановки задачи),
+    остаётся: ссылка на него может быть ещё не зафиксирована, а если так
+    и не появится, файл уберёт `gc_media`.
+    """
+    if in_use():
+        return False
+    try:
+        modified = default_storage.get_modified_time(name)
+    except FileNotFoundError:
+        return False
+    if requested_at is not None and modified.timestamp() > requested_at:
+        return False
+    default_storage.delete(name)
+    return True
@@ -0,0 +1,396 @@
+import json
+import math
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import got_request_exception
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError, connections, transaction
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from foodgram.db_router import ReplicaRouter, ReplicaRoutingMiddleware, replica_aliases
+from foodgram.handlers import ApiWSGIHandler
+from foodgram.storage import delete_unused
+
+
+class ReplicaRouterTests(TransactionTestCase):
+    """Роутер и middleware реплик на тестовой реплике `replica_1`.
+
+    Реплика — зеркало основной БД, поэтому проверяется только выбор
+    соединения: отставание и недоступность реплики подменяются.
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.replica = replica_aliases()[0]
+        self.factory = RequestFactory()
+
+    def read_alias(self, method="get", path="/api/recipes/", status=200, **extra):
+        """Соединение для чтения внутри запроса и статус ответа view."""
+        aliases = []
+
+        def view(request):
+            aliases.append(self.router.db_for_read(Recipe))
+            return HttpResponse(status=status)
+
+        middleware = ReplicaRoutingMiddleware(view)
+        middleware(getattr(self.factory, method)(path, **extra))
+        return aliases[0]
+
+    def test_safe_api_reads_use_replica(self):
+        self.assertEqual(self.read_alias(), self.replica)
+        self.assertEqual(self.read_alias("head"), self.replica)
+
+    def test_writes_and_other_reads_use_primary(self):
+        self.assertEqual(self.read_alias("post"), "default")
+        self.assertEqual(self.read_alias(path="/admin/"), "default")
+        self.assertEqual(self.router.db_for_read(Recipe), "default")
+        self.assertEqual(self.router.db_for_write(Recipe), "default")
+
+    def test_reads_inside_transaction_use_primary(self):
+        def view(request):
+            with transaction.atomic():
+                aliases.append(self.router.db_for_read(Recipe))
+            return HttpResponse()
+
+        aliases = []
+        ReplicaRoutingMiddleware(view)(self.factory.get("/api/recipes/"))
+        self.assertEqual(aliases, ["default"])
+
+    def test_client_reads_own_writes_from_primary(self):
+        token = {"HTTP_AUTHORIZATION": "Token reader"}
+        self.read_alias("post", status=201, **token)
+        self.assertEqual(self.read_alias(**token), "default")
+        self.assertEqual(
+            self.read_alias(HTTP_AUTHORIZATION="Token other"), self.replica
+        )
+        cache.clear()
+        self.assertEqual(self.read_alias(**token), self.replica)
+
+    def test_failed_write_does_not_stick_to_primary(self):
+        token = {"HTTP_AUTHORIZATION": "Token reader"}
+        self.read_alias("post", status=400, **token)
+        self.assertEqual(self.read_alias(**token), self.replica)
+
+    @override_settings(REPLICA_MAX_LAG=5, REPLICA_LAG_CHECK_INTERVAL=0)
+    def test_lagging_replica_falls_back_to_primary(self):
+        with mock.patch.object(self.router, "lag", return_value=30.0):
+            self.assertEqual(self.read_alias(), "default")
+        with mock.patch.object(self.router, "lag", return_value=1.0):
+            self.assertEqual(self.read_alias(), self.replica)
+
+    @override_settings(REPLICA_LAG_CHECK_INTERVAL=60)
+    def test_lag_is_checked_once_per_interval(self):
+        with mock.patch.object(self.router, "lag", return_value=30.0) as lag:
+            self.read_alias()
+            self.read_alias()
+        self.assertEqual(lag.call_count, 1)
+        self.assertEqual(self.read_alias(), "default")
+
+    @override_settings(REPLICA_LAG_CHECK_INTERVAL=0)
+    def test_unavailable_replica_falls_back_to_primary(self):
+        connection = connections[self.replica]
+        with mock.patch.object(connection, "vendor", "postgresql"), mock.patch.object(
+            connection, "cursor", side_effect=OperationalError("нет соединения")
+        ), mock.patch.object(connection, "close") as close:
+            self.assertEqual(self.router.lag(self.replica), math.inf)
+            self.assertEqual(self.read_alias(), "default")
+        close.assert_called()
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(MEDIA_ROOT=directory.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def save(self, content=b"image"):
+        return default_storage.save("recipes/photo.png", ContentFile(content))
+
+    def age(self, name, seconds):
+        path = default_storage.path(name)
+        modified = os.path.getmtime(path) - seconds
+        os.utime(path, (modified, modified))
+
+    def test_same_content_is_stored_once(self):
+        name = self.save()
+        self.assertRegex(name, r"^recipes/[0-9a-f]{2}/[0-9a-f]{64}\.png$")
+        self.assertEqual(self.save(), name)
+        self.assertNotEqual(self.save(b"other"), name)
+
+    def test_file_name_is_validated(self):
+        with self.assertRaises(SuspiciousFileOperation):
+            default_storage.save("../photo.png", ContentFile(b"image"))
+        with self.assertRaises(SuspiciousFileOperation):
+            default_storage.save("/etc/photo.png", ContentFile(b"image"))
+        # Путь остаётся внутри MEDIA_ROOT, но «..» в имени не допускается
+        with self.assertRaises(SuspiciousFileOperation):
+            default_storage.save("recipes/../photo.png", ContentFile(b"image"))
+
+    def test_reused_file_is_touched(self):
+        name = self.save()
+        self.age(name, 3600)
+        self.save()
+        self.assertGreater(
+            os.path.getmtime(default_storage.path(name)), time.time() - 60
+        )
+
+    def test_referenced_file_is_kept(self):
+        name = self.save()
+        self.assertFalse(delete_unused(name, lambda: True, time.time()))
+        self.assertTrue(default_storage.exists(name))
+
+    def test_unreferenced_file_is_deleted(self):
+        name = self.save()
+        self.age(name, 60)
+        self.assertTrue(delete_unused(name, lambda: False, time.time()))
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(delete_unused(name, lambda: False, time.time()))
+
+    def test_file_uploaded_again_after_request_is_kept(self):
+        name = self.save()
+        self.age(name, 60)
+        requested_at = time.time() - 30
+        # Та же картинка загружена снова, запись о ней ещё не сохранена
+        self.save()
+        self.assertFalse(delete_unused(name, lambda: False, requested_at))
+        self.assertTrue(default_storage.exists(name))
+
+
+def middleware_chain(handler):
+    """Классы middleware цепочки обработчика в порядке вызова."""
+    classes = []
+    layer = handler._middleware_chain.__wrapped__
+    while hasattr(layer, "get_response"):
+        classes.append(f"{type(layer).__module__}.{type(layer).__name__}")
+        layer = layer.get_response.__wrapped__
+    return classes
+
+
+@override_settings(API_THROTTLE_ENABLED=False)
+class ApiHandlerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="password"
+        )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.handler = ApiWSGIHandler()
+        self.handler.load_middleware()
+
+    def test_chain_is_built_from_api_middleware(self):
+        middleware = settings.MIDDLEWARE
+        with override_settings(MIDDLEWARE=[]):
+            handler = ApiWSGIHandler()
+            handler.load_middleware()
+        self.assertIs(settings.MIDDLEWARE, middleware)
+        self.assertEqual(middleware_chain(handler), settings.API_MIDDLEWARE)
+        self.assertNotIn(
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            middleware_chain(handler),
+        )
+
+    def test_token_authentication(self):
+        request = self.factory.get(
+            "/api/users/me/", HTTP_AUTHORIZATION=f"Token {self.token.key}"
+        )
+        response = self.handler.get_response(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["username"], "reader")
+        response = self.handler.get_response(self.factory.get("/api/users/me/"))
+        self.assertEqual(response.status_code, 401)
+
+    def test_write_without_csrf_token(self):
+        request = self.factory.post(
+            "/api/users/set_password/",
+            {"current_password": "password", "new_password": "new-password-42"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Token {self.token.key}",
+        )
+        response = self.handler.get_response(request)
+        self.assertEqual(response.status_code, 204, response.content)
+
+    def test_cross_origin_preflight_matches_full_chain(self):
+        full = WSGIHandler()
+        full.load_middleware()
+        headers = {
+            "HTTP_ORIGIN": "https://example.com",
+            "HTTP_ACCESS_CONTROL_REQUEST_METHOD": "POST",
+        }
+        responses = [
+            handler.get_response(self.factory.options("/api/recipes/", **headers))
+            for handler in (full, self.handler)
+        ]
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(responses[0]["Allow"], responses[1]["Allow"])
+        cors = [
+            {k: v for k, v in r.items() if k.lower().startswith("access-control-")}
+            for r in responses
+        ]
+        self.assertEqual(cors[0], cors[1])
+
+    def test_unhandled_exception_returns_500(self):
+        exceptions = []
+
+        def receiver(sender, request, **kwargs):
+            exceptions.append(request.path)
+
+        got_request_exception.connect(receiver)
+        self.addCleanup(got_request_exception.disconnect, receiver)
+        with mock.patch(
+            "api.views.IngredientViewSet.list", side_effect=RuntimeError("сбой")
+        ), self.assertLogs("django.request", "ERROR"):
+            response = self.handler.get_response(self.factory.get("/api/ingredients/"))
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(exceptions, ["/api/ingredients/"])
+
+
+@override_settings(SERVER_TIMING_ENABLED=True, API_THROTTLE_ENABLED=False)
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username="staff", email="staff@example.com", is_staff=True
+        )
+        cls.reader = User.objects.create_user(
+            username="reader", email="reader@example.com"
+        )
+
+    def metrics(self, user=None):
+        headers = {}
+        if user is not None:
+            token = Token.objects.get_or_create(user=user)[0]
+            headers["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+        response = self.client.get("/api/recipes/", **headers)
+        self.assertEqual(response.status_code, 200)
+        if "Server-Timing" not in response:
+            return None
+        metrics = [
+            metric.split(";") for metric in response["Server-Timing"].split(", ")
+        ]
+        for _, duration in metrics:
+            self.assertRegex(duration, r"^dur=\d+\.\d{2}$")
+        return [name for name, _ in metrics]
+
+    def test_phases_for_staff(self):
+        self.assertEqual(
+            self.metrics(self.staff),
+            ["auth", "db", "serialize", "render", "view", "mw", "total"],
+        )
+
+    def test_hidden_from_other_clients(self):
+        self.assertIsNone(self.metrics(self.reader))
+        self.assertIsNone(self.metrics())
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.metrics(), self.metrics(self.staff))
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_disabled(self):
+        self.assertIsNone(self.metrics(self.staff))
+
+
+@override_settings(API_THROTTLE_ENABLED=False, PROFILING_KEEP=2)
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username="staff", email="staff@example.com", is_staff=True
+        )
+        cls.reader = User.objects.create_user(
+            username="reader", email="reader@example.com"
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = override_settings(PROFILING_DIR=self.directory)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def profiled(self, user=None, mode="cprofile"):
+        headers = {"HTTP_X_PROFILE": mode}
+        if user is not None:
+            token = Token.objects.get_or_create(user=user)[0]
+            headers["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+        response = self.client.get("/api/recipes/", **headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_staff_request_is_profiled(self):
+        response = self.profiled(self.staff)
+        profile_id = response["X-Profile-URL"].rstrip("/").rsplit("/", 1)[-1]
+        self.assertEqual(self.files(), [f"{profile_id}.json", f"{profile_id}.prof"])
+        with open(os.path.join(self.directory, f"{profile_id}.json")) as file:
+            data = json.load(file)
+        self.assertEqual((data["mode"], data["status"]), ("cprofile", 200))
+        self.assertIn("cumulative", data["stats"])
+        self.assertTrue(data["sql"])
+
+        self.client.force_login(self.staff)
+        detail = self.client.get(response["X-Profile-URL"])
+        self.assertEqual(detail.status_code, 200)
+        export = self.client.get(response["X-Profile-URL"], {"export": "prof"})
+        self.assertEqual(export["Content-Type"], "application/octet-stream")
+
+    def test_sampling_mode(self):
+        response = self.profiled(self.staff, mode="sample")
+        [name] = self.files()
+        with open(os.path.join(self.directory, name)) as file:
+            self.assertIn("collapsed", json.load(file))
+        self.client.force_login(self.staff)
+        export = self.client.get(response["X-Profile-URL"], {"export": "collapsed"})
+        self.assertEqual(export.status_code, 200)
+
+    def test_other_clients_are_not_profiled(self):
+        for user in (self.reader, None):
+            self.assertNotIn("X-Profile-URL", self.profiled(user))
+        self.assertEqual(self.files(), [])
+
+    def test_profiles_are_viewed_by_staff_only(self):
+        url = self.profiled(self.staff)["X-Profile-URL"]
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.client.get("/admin/profiles/").status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get("/admin/profiles/").status_code, 200)
+        self.assertEqual(self.client.get("/admin/profiles/nope/").status_code, 404)
+
+    def test_old_profiles_are_rotated(self):
+        self.profiled(self.staff, mode="sample")
+        kept = [
+            self.profiled(self.staff)["X-Profile-URL"].rstrip("/").rsplit("/", 1)[-1]
+            for _ in range(2)
+        ]
+        self.assertEqual(
+            self.files(),
+            sorted(f"{name}{suffix}" for name in kept for suffix in (".json", ".prof")),
+        )
@@ -19,6 +19,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse
 from api.views import redirect_short_link
+from foodgram.profiling import profile_detail, profile_list
 
 
 def home(request):
@@ -27,6 +28,8 @@ def home(request):
 
 urlpatterns = [
     path("", home, name="home"),
+    path("admin/profiles/", profile_list, name="profile-list"),
+    path("admin/profiles/<str:profile_id>/", profile_detail, name="profile-detail"),
     path("admin/", admin.site.urls),
     path("api/", include("api.urls")),
     path("s/<slug:slug>/", redirect_short_link, name="short-link"),
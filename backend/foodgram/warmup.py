@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+from recipes.caches import ingredient_catalog, short_links
+from recipes.pantry import pantry_index
+
+
+def warm_up():
+    """Готовит процесс к приёму запросов.
+
+    Вызывается в мастер-процессе gunicorn до запуска воркеров: импорт
+    URLconf, справочник ингредиентов, короткие ссылки и индекс продуктов
+    наследуются воркерами при fork. Соединения с БД закрываются, чтобы
+    воркеры не делили один сокет.
+    """
+    get_resolver().url_patterns
+    ingredient_catalog.load()
+    short_links.prime(settings.SHORT_LINK_WARMUP)
+    pantry_index.load()
+    connections.close_all()
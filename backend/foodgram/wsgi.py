@@ -13,4 +13,7 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
 
-application = get_wsgi_application()
+from foodgram.handlers import ApiWSGIHandler, PathDispatchHandler  # noqa: E402
+
+# Запросы к API проходят укороченную цепочку API_MIDDLEWARE
+application = PathDispatchHandler(get_wsgi_application(), ApiWSGIHandler())
@@ -0,0 +1,25 @@
+import os
+
+# Ядра, доступные контейнеру (учитывает cpuset), а не все ядра хоста
+cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else 1
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", cores * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 2))
+worker_class = "gthread" if threads > 1 else "sync"
+# Приложение загружается один раз в мастере, воркеры получают его через fork
+preload_app = True
+# Перезапуск воркеров ограничивает рост памяти из-за утечек и фрагментации
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+
+def when_ready(server):
+    from foodgram.warmup import warm_up
+
+    warm_up()
+    server.log.info("Прогрев завершён")
@@ -0,0 +1,34 @@
+from django.contrib import admin
+from django.utils import timezone
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "name",
+        "status",
+        "attempts",
+        "run_at",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status", "name")
+    search_fields = ("name",)
+    readonly_fields = (
+        "attempts",
+        "locked_at",
+        "locked_by",
+        "last_error",
+        "created_at",
+        "finished_at",
+    )
+    actions = ("retry",)
+
+    @admin.action(description="Перезапустить выбранные задачи")
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(), finished_at=None
+        )
+        self.message_user(request, f"Поставлено в очередь: {updated}")
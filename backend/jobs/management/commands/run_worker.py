@@ -0,0 +1,113 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection, connections
+from jobs.queue import claim, execute, purge_finished, requeue_stale
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_INTERVAL = 60
+
+
+def work(index, stop, poll, burst):
+    """Цикл одного потока или процесса: взять задачу, выполнить, повторить."""
+    worker = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                jobs = claim(worker)
+            except DatabaseError:
+                logger.exception("Не удалось получить задачи из очереди")
+                connection.close()
+                stop.wait(poll)
+                continue
+            if not jobs:
+                if burst:
+                    return
+                stop.wait(poll)
+                continue
+            for job in jobs:
+                execute(job)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет фоновые задачи из таблицы jobs_job в пуле потоков "
+        "или процессов. Несколько воркеров могут работать одновременно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument(
+            "--processes",
+            action="store_true",
+            help="Процессы вместо потоков — для задач, нагружающих CPU",
+        )
+        parser.add_argument(
+            "--poll", type=float, default=1.0, help="Пауза при пустой очереди, с"
+        )
+        parser.add_argument(
+            "--burst", action="store_true", help="Завершиться, когда очередь опустеет"
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=600,
+            help="Через сколько секунд задача упавшего воркера вернётся в очередь",
+        )
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            default=7,
+            help="Сколько дней хранить выполненные задачи",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options["stale_after"])
+        requeue_stale(stale_after)
+        purged = purge_finished(timedelta(days=options["keep_days"]))
+        if purged:
+            self.stdout.write(f"Удалено выполненных задач: {purged}")
+
+        if options["processes"]:
+            context = multiprocessing.get_context("fork")
+            stop = context.Event()
+            spawn = context.Process
+            connections.close_all()
+        else:
+            stop = threading.Event()
+            spawn = threading.Thread
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+        workers = [
+            spawn(
+                target=work,
+                args=(index, stop, options["poll"], options["burst"]),
+                daemon=True,
+            )
+            for index in range(options["concurrency"])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(
+            f"Запущено воркеров: {len(workers)} "
+            f"({'процессы' if options['processes'] else 'потоки'})"
+        )
+        maintained_at = time.monotonic()
+        while alive := [worker for worker in workers if worker.is_alive()]:
+            alive[0].join(timeout=1)
+            if time.monotonic() - maintained_at > MAINTENANCE_INTERVAL:
+                maintained_at = time.monotonic()
+                requeue_stale(stale_after)
+        self.stdout.write("Воркеры остановлены.")
@@ -0,0 +1,49 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Выполнена"),
+        (FAILED, "Ошибка"),
+    )
+
+    name = models.CharField(max_length=100, verbose_name="Задача")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Аргументы")
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED, verbose_name="Статус"
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3, verbose_name="Максимум попыток"
+    )
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Запуск не раньше")
+    locked_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Взята в работу"
+    )
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name="Воркер")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ["-id"]
+        indexes = [
+            models.Index(
+                fields=["run_at", "id"],
+                condition=models.Q(status="queued"),
+                name="job_queued_idx",
+            ),
+            models.Index(fields=["status", "locked_at"], name="job_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
@@ -0,0 +1,112 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY = 10
+TASKS = {}
+
+
+def task(name=None, max_attempts=3):
+    """Регистрирует функцию как фоновую задачу.
+
+    Аргументы задачи передаются именованными и хранятся в JSON, поэтому
+    передавайте id объектов, а не сами объекты.
+    """
+
+    def register(func):
+        func.task_name = name or f"{func.__module__}.{func.__name__}"
+        func.max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+
+    return register
+
+
+def enqueue(func, *, delay=None, run_at=None, **payload):
+    """Ставит задачу в очередь.
+
+    Внутри транзакции задача станет видна воркерам только после фиксации.
+    """
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta())
+    return Job.objects.create(
+        name=func.task_name,
+        payload=payload,
+        max_attempts=func.max_attempts,
+        run_at=run_at,
+    )
+
+
+def claim(worker, limit=1):
+    """Забирает готовые к запуску задачи, пропуская занятые другими."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_at__lte=now)
+            .order_by("run_at", "id")[:limit]
+        )
+        if jobs:
+            Job.objects.filter(id__in=[job.id for job in jobs]).update(
+                status=Job.RUNNING,
+                locked_at=now,
+                locked_by=worker,
+                attempts=F("attempts") + 1,
+            )
+    for job in jobs:
+        job.status, job.locked_at, job.locked_by = Job.RUNNING, now, worker
+        job.attempts += 1
+    return jobs
+
+
+def execute(job):
+    func = TASKS.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f"Неизвестная задача {job.name}")
+        func(**job.payload)
+    except Exception:
+        logger.exception("Задача %s #%s завершилась ошибкой", job.name, job.id)
+        job.last_error = traceback.format_exc()
+        if func is not None and job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(
+                seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+            )
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+    job.locked_at = None
+    job.save(
+        update_fields=["status", "run_at", "locked_at", "last_error", "finished_at"]
+    )
+
+
+def requeue_stale(timeout):
+    """Возвращает в очередь задачи воркеров, которые упали посреди работы."""
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timeout)
+    stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED,
+        locked_at=None,
+        finished_at=now,
+        last_error="Воркер не завершил задачу",
+    )
+    return stale.update(status=Job.QUEUED, locked_at=None, run_at=now)
+
+
+def purge_finished(older_than):
+    return Job.objects.filter(
+        status=Job.DONE, finished_at__lt=timezone.now() - older_than
+    ).delete()[0]
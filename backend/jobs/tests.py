@@ -0,0 +1,155 @@
+import io
+import threading
+from collections import Counter
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import claim, enqueue, execute, purge_finished, requeue_stale, task
+
+calls = Counter()
+
+
+@task(name="jobs.tests.record", max_attempts=2)
+def record(key):
+    calls[key] += 1
+
+
+@task(name="jobs.tests.fail", max_attempts=2)
+def fail():
+    raise RuntimeError("сбой")
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def make_ready(self, job):
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+
+    def test_claim_takes_ready_jobs_in_order(self):
+        later = enqueue(record, delay=timedelta(hours=1), key="later")
+        first = enqueue(record, key="first")
+        second = enqueue(record, key="second")
+        self.assertEqual(
+            [job.pk for job in claim("w1", limit=5)], [first.pk, second.pk]
+        )
+        self.assertEqual(claim("w2"), [])
+        job = Job.objects.get(pk=first.pk)
+        self.assertEqual(
+            (job.status, job.locked_by, job.attempts), (Job.RUNNING, "w1", 1)
+        )
+        self.assertEqual(Job.objects.get(pk=later.pk).status, Job.QUEUED)
+
+    def test_successful_job_is_done(self):
+        enqueue(record, key="ok")
+        [job] = claim("w1")
+        execute(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(job.locked_at)
+        self.assertEqual(calls["ok"], 1)
+
+    def test_failed_job_is_retried_until_max_attempts(self):
+        enqueue(fail)
+        with self.assertLogs("jobs.queue", "ERROR"):
+            [job] = claim("w1")
+            execute(job)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+            self.assertIn("RuntimeError", job.last_error)
+            # Повтор откладывается, пока не истечёт пауза
+            self.assertGreater(job.run_at, timezone.now())
+            self.assertEqual(claim("w1"), [])
+
+            self.make_ready(job)
+            [job] = claim("w2")
+            self.assertEqual(job.attempts, 2)
+            execute(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(claim("w1"), [])
+
+    def test_unknown_task_fails_without_retry(self):
+        Job.objects.create(name="jobs.tests.missing")
+        with self.assertLogs("jobs.queue", "ERROR"):
+            [job] = claim("w1")
+            execute(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 1))
+
+    def test_requeue_stale(self):
+        old = timezone.now() - timedelta(hours=1)
+        retried, exhausted, fresh = Job.objects.bulk_create(
+            [
+                Job(name="a", status=Job.RUNNING, locked_at=old, attempts=1),
+                Job(name="b", status=Job.RUNNING, locked_at=old, attempts=3),
+                Job(name="c", status=Job.RUNNING, locked_at=timezone.now()),
+            ]
+        )
+        self.assertEqual(requeue_stale(timedelta(minutes=10)), 1)
+        statuses = dict(Job.objects.values_list("pk", "status"))
+        self.assertEqual(
+            statuses,
+            {retried.pk: Job.QUEUED, exhausted.pk: Job.FAILED, fresh.pk: Job.RUNNING},
+        )
+        # Попытка засчитывается при следующем claim
+        [job] = claim("w1")
+        self.assertEqual((job.pk, job.attempts), (retried.pk, 2))
+
+    def test_purge_finished(self):
+        now = timezone.now()
+        old = now - timedelta(days=8)
+        kept = Job.objects.bulk_create(
+            [
+                Job(name="recent", status=Job.DONE, finished_at=now),
+                Job(name="failed", status=Job.FAILED, finished_at=old),
+                Job(name="queued"),
+            ]
+        )
+        Job.objects.create(name="old", status=Job.DONE, finished_at=old)
+        self.assertEqual(purge_finished(timedelta(days=7)), 1)
+        self.assertEqual(
+            set(Job.objects.values_list("pk", flat=True)), {job.pk for job in kept}
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "SKIP LOCKED проверяется в PostgreSQL")
+class ConcurrentClaimTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_locked_job_is_skipped(self):
+        first = enqueue(record, key="first")
+        second = enqueue(record, key="second")
+        claimed = []
+
+        def other_worker():
+            try:
+                claimed.extend(claim("w2", limit=2))
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            Job.objects.select_for_update().get(pk=first.pk)
+            thread = threading.Thread(target=other_worker)
+            thread.start()
+            thread.join()
+        self.assertEqual([job.pk for job in claimed], [second.pk])
+        self.assertEqual([job.pk for job in claim("w1", limit=2)], [first.pk])
+
+    def test_workers_run_each_job_once(self):
+        for number in range(40):
+            enqueue(record, key=number)
+        call_command("run_worker", "--burst", "--concurrency=4", stdout=io.StringIO())
+        self.assertEqual(calls, Counter(range(40)))
+        self.assertEqual(
+            set(Job.objects.values_list("status", "attempts")), {(Job.DONE, 1)}
+        )
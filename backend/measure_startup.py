@@ -0,0 +1,149 @@
+"""Замер времени старта и памяти сервера приложения.
+
+Запускает сервер (по умолчанию gunicorn с gunicorn.conf.py), ждёт первого
+ответа, затем снимает RSS и PSS мастера и воркеров до и после прогона
+запросов. PSS делит общие после fork страницы между процессами, поэтому
+сумма PSS — честная оценка памяти всего сервера.
+
+    cd backend
+    python measure_startup.py --requests 500
+    GUNICORN_WORKERS=4 python measure_startup.py --json result.json
+"""
+
+import argparse
+import json
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_COMMAND = "gunicorn foodgram.wsgi:application -c gunicorn.conf.py"
+DEFAULT_PATHS = ("/api/ingredients/", "/api/recipes/", "/api/users/")
+
+
+def children(pid):
+    """Прямые потомки процесса по /proc/*/stat."""
+    result = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # Имя процесса в скобках может содержать пробелы
+        fields = stat.rsplit(")", 1)[1].split()
+        if int(fields[1]) == pid:
+            result.append(int(entry))
+    return result
+
+
+def memory(pid):
+    """RSS и PSS процесса в мегабайтах."""
+    values = {"rss": 0.0, "pss": 0.0}
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    values["rss"] = int(line.split()[1]) / 1024
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            for line in file:
+                if line.startswith("Pss:"):
+                    values["pss"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return values
+
+
+def snapshot(master):
+    processes = {"master": memory(master)}
+    for index, pid in enumerate(sorted(children(master))):
+        processes[f"worker{index}"] = memory(pid)
+    processes["total"] = {
+        key: round(sum(item[key] for item in processes.values()), 1)
+        for key in ("rss", "pss")
+    }
+    return processes
+
+
+def request(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--command", default=DEFAULT_COMMAND)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", action="append", dest="paths")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--json", help="Сохранить результат в файл")
+    args = parser.parse_args()
+    paths = args.paths or list(DEFAULT_PATHS)
+
+    started = time.monotonic()
+    # Прогон запросов с одного адреса не должен упираться в лимиты API
+    env = {"API_THROTTLE_ENABLED": "False", **os.environ}
+    server = subprocess.Popen(
+        shlex.split(args.command), start_new_session=True, env=env
+    )
+    try:
+        while request(args.base_url + paths[0]) is None:
+            if server.poll() is not None:
+                sys.exit(f"Сервер завершился с кодом {server.returncode}")
+            if time.monotonic() - started > args.startup_timeout:
+                sys.exit("Сервер не ответил за отведённое время")
+            time.sleep(0.05)
+        startup = round(time.monotonic() - started, 3)
+        # Первый ответ может дать один воркер, пока остальные ещё стартуют
+        workers, settle_until = -1, time.monotonic() + 5
+        while time.monotonic() < settle_until:
+            current = len(children(server.pid))
+            if current == workers:
+                break
+            workers = current
+            time.sleep(0.5)
+        result = {
+            "startup_seconds": startup,
+            "memory_after_start": snapshot(server.pid),
+        }
+        statuses = {}
+        request_started = time.monotonic()
+        for number in range(args.requests):
+            status = request(args.base_url + paths[number % len(paths)])
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        result["requests"] = args.requests
+        result["requests_seconds"] = round(time.monotonic() - request_started, 3)
+        result["statuses"] = statuses
+        result["memory_after_requests"] = snapshot(server.pid)
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+
+    print(f"Старт до первого ответа: {result['startup_seconds']} с")
+    for label in ("memory_after_start", "memory_after_requests"):
+        print(label)
+        for name, values in result[label].items():
+            print(
+                f"  {name:10} RSS {values['rss']:7.1f} МБ  PSS {values['pss']:7.1f} МБ"
+            )
+    print(f"Ответы: {result['statuses']}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,36 @@
+from functools import partial
+
 from django.contrib import admin
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Favorite, ShoppingCart
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from foodgram.pagination import EstimatedCountPaginator
+from recipes.deletion import delete_recipes
+from recipes.facets import recipe_facets
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Favorite,
+    ShoppingCart,
+    SimilarRecipe,
+)
+
+
+def count_of(model):
+    """Число связанных строк для каждого рецепта.
+
+    Подзапрос выполняется только для строк текущей страницы, в отличие от
+    JOIN + GROUP BY по всей таблице.
+    """
+    rows = (
+        model.objects.filter(recipe=OuterRef("pk"))
+        .order_by()
+        .values("recipe")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
 
 
 @admin.register(Ingredient)
@@ -11,22 +42,62 @@ class IngredientAdmin(admin.ModelAdmin):
 class RecipeIngredientInline(admin.StackedInline):
     model = RecipeIngredient
     extra = 1
+    autocomplete_fields = ("ingredient",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("ingredient")
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ("name", "author", "get_favorites_count", "show_ingredient_count")
+    list_select_related = ("author",)
     search_fields = ("name", "author__username")
     readonly_fields = ("get_favorites_count",)
+    autocomplete_fields = ("author",)
     inlines = [RecipeIngredientInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                favorites_count=count_of(Favorite),
+                ingredients_count=count_of(RecipeIngredient),
+            )
+        )
+
+    def save_related(self, request, form, formsets, change):
+        # Автор и ингредиенты до изменения — из начальных данных форм
+        author_ids = {form.initial.get("author")} - {None}
+        ingredient_ids = {
+            inline.initial.get("ingredient")
+            for formset in formsets
+            for inline in formset.initial_forms
+        } - {None}
+        super().save_related(request, form, formsets, change)
+        authors, ingredients = recipe_facets.scopes([form.instance.pk])
+        transaction.on_commit(
+            partial(
+                recipe_facets.bump, author_ids | authors, ingredient_ids | ingredients
+            )
+        )
+
+    def delete_model(self, request, obj):
+        delete_recipes(Recipe.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_recipes(queryset)
 
     def get_favorites_count(self, obj):
-        return len(obj.favorite_set.all())
+        return obj.favorites_count
 
     get_favorites_count.short_description = "В избранном"
 
     def show_ingredient_count(self, obj):
-        return obj.ingredients.count()
+        return obj.ingredients_count
 
     show_ingredient_count.short_description = "Число ингредиентов"
 
@@ -34,12 +105,21 @@ class RecipeAdmin(admin.ModelAdmin):
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ("user", "recipe")
+    list_select_related = ("user", "recipe")
     search_fields = ("user__username", "recipe__name")
+    autocomplete_fields = ("user", "recipe")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 # @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ["get_user", "get_recipe"]
+    list_select_related = ("user", "recipe")
+    search_fields = ("user__username", "recipe__name")
+    autocomplete_fields = ("user", "recipe")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_user(self, obj):
         return obj.user.username
@@ -53,3 +133,13 @@ class ShoppingCartAdmin(admin.ModelAdmin):
 
 
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+
+
+@admin.register(SimilarRecipe)
+class SimilarRecipeAdmin(admin.ModelAdmin):
+    list_display = ("recipe", "similar", "score", "computed_at")
+    list_select_related = ("recipe", "similar")
+    search_fields = ("recipe__name",)
+    raw_id_fields = ("recipe", "similar")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,179 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from recipes.models import Ingredient, Recipe
+
+SHORT_LINK_CACHE_SIZE = 100000
+
+
+def is_shared(cache):
+    """Видят ли все воркеры одни и те же записи кеша.
+
+    В кеше в памяти процесса сброс версии доходит только до текущего
+    воркера, остальные отдавали бы устаревшие данные до конца TTL.
+    """
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+class IngredientCatalog:
+    """Справочник ингредиентов в памяти процесса.
+
+    Справочник почти не меняется, поэтому список и поиск по началу
+    названия отдаются без запросов к БД. Изменения в этом процессе
+    сбрасывают кеш сразу (сигналы), в остальных — через
+    `INGREDIENT_CACHE_TTL` секунд.
+    """
+
+    def __init__(self):
+        self.rows = None
+        self.names = []
+        self.loaded_at = 0.0
+
+    def load(self):
+        rows = list(
+            Ingredient.objects.order_by("id").values("id", "name", "measurement_unit")
+        )
+        self.names = [row["name"].upper() for row in rows]
+        self.rows = rows
+        self.loaded_at = time.monotonic()
+
+    def all(self):
+        if (
+            self.rows is None
+            or time.monotonic() - self.loaded_at > settings.INGREDIENT_CACHE_TTL
+        ):
+            self.load()
+        return self.rows
+
+    def search(self, prefix):
+        """Аналог `name__istartswith`, порядок — по id."""
+        rows = self.all()
+        prefix = prefix.upper()
+        return [row for row, name in zip(rows, self.names) if name.startswith(prefix)]
+
+    def invalidate(self):
+        self.rows = None
+
+
+class ShortLinkCache:
+    """uuid короткой ссылки → id рецепта с вытеснением давно не нужных."""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+
+    def get(self, slug):
+        try:
+            slug = str(uuid.UUID(str(slug)))
+        except ValueError:
+            return None
+        with self.lock:
+            if slug in self.items:
+                self.items.move_to_end(slug)
+                return self.items[slug]
+        recipe_id = (
+            Recipe.objects.filter(short_uuid=slug).values_list("id", flat=True).first()
+        )
+        if recipe_id is not None:
+            self.put(slug, recipe_id)
+        return recipe_id
+
+    def put(self, slug, recipe_id):
+        with self.lock:
+            self.items[slug] = recipe_id
+            self.items.move_to_end(slug)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def prime(self, limit):
+        """Загружает ссылки самых новых рецептов — их открывают чаще всего."""
+        for slug, recipe_id in Recipe.objects.order_by("-id").values_list(
+            "short_uuid", "id"
+        )[:limit]:
+            self.put(str(slug), recipe_id)
+
+    def discard(self, slug):
+        with self.lock:
+            self.items.pop(str(slug), None)
+
+
+class RecipeRepresentationCache:
+    """Общая для всех зрителей часть JSON рецептов в кеше `RECIPE_CACHE`.
+
+    Ключ записи содержит версии рецепта, его автора и справочника
+    ингредиентов; сигналы меняют версию, и старые записи перестают
+    читаться, пока не истекут через `RECIPE_CACHE_TTL` секунд. Версия —
+    случайный токен, а не счётчик: если кеш вытеснит её, новый токен не
+    совпадёт со старыми записями. С кешем в памяти процесса кеш
+    отключён: другие воркеры не увидели бы смены версии.
+    """
+
+    ingredients_key = "recipe-version:ingredients"
+
+    @property
+    def cache(self):
+        return caches[settings.RECIPE_CACHE]
+
+    @property
+    def enabled(self):
+        return settings.RECIPE_CACHE_TTL > 0 and is_shared(self.cache)
+
+    def versions(self, keys):
+        found = self.cache.get_many(keys)
+        missing = {key: uuid.uuid4().hex[:12] for key in keys if key not in found}
+        if missing:
+            self.cache.set_many(missing, None)
+            found.update(missing)
+        return found
+
+    def keys(self, recipes, prefix):
+        """Ключи записей по id рецепта; `prefix` отделяет схемы и хосты."""
+        version_keys = {self.ingredients_key}
+        for recipe in recipes:
+            version_keys.add(f"recipe-version:recipe:{recipe.id}")
+            version_keys.add(f"recipe-version:user:{recipe.author_id}")
+        versions = self.versions(list(version_keys))
+        return {
+            recipe.id: (
+                f"recipe:{prefix}:{recipe.id}"
+                f":{versions[f'recipe-version:recipe:{recipe.id}']}"
+                f":{versions[f'recipe-version:user:{recipe.author_id}']}"
+                f":{versions[self.ingredients_key]}"
+            )
+            for recipe in recipes
+        }
+
+    def get_many(self, keys):
+        found = self.cache.get_many(list(keys.values()))
+        return {
+            recipe_id: found[key] for recipe_id, key in keys.items() if key in found
+        }
+
+    def set_many(self, items):
+        self.cache.set_many(items, settings.RECIPE_CACHE_TTL)
+
+    def bump(self, key):
+        if self.enabled:
+            self.cache.set(key, uuid.uuid4().hex[:12], None)
+
+    def bump_recipe(self, recipe_id):
+        self.bump(f"recipe-version:recipe:{recipe_id}")
+
+    def bump_user(self, user_id):
+        self.bump(f"recipe-version:user:{user_id}")
+
+    def bump_ingredients(self):
+        self.bump(self.ingredients_key)
+
+
+ingredient_catalog = IngredientCatalog()
+short_links = ShortLinkCache(size=SHORT_LINK_CACHE_SIZE)
+recipe_representations = RecipeRepresentationCache()
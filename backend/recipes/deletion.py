@@ -0,0 +1,107 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from jobs.queue import enqueue
+from recipes import feed
+from recipes.facets import recipe_facets
+from recipes.models import (
+    Favorite,
+    FeedEntry,
+    Recipe,
+    RecipeActivity,
+    RecipeIngredient,
+    ShoppingCart,
+    SimilarRecipe,
+)
+from recipes.tasks import backfill_inbox
+from users.models import AuthorSuggestion, Follow
+
+
+def delete_chunked(queryset, chunk=None, signals=True):
+    """Удаляет строки выборки пачками, каждую в своей транзакции.
+
+    Между пачками блокировки отпускаются, и удаление миллиона строк не
+    держит таблицы одной длинной транзакцией. Прерванное удаление можно
+    просто повторить. С `signals=False` строки удаляются одним DELETE на
+    пачку без сигналов и каскада. Возвращает число удалённых строк.
+    """
+    chunk = chunk or settings.DELETE_CHUNK_SIZE
+    model = queryset.model
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by().values_list("pk", flat=True)[:chunk])
+            if not ids:
+                return deleted
+            rows = model.objects.filter(pk__in=ids)
+            if signals:
+                rows.delete()
+            else:
+                rows._raw_delete(rows.db)
+        deleted += len(ids)
+
+
+def delete_recipes(queryset, chunk=None):
+    """Удаляет рецепты, сначала пачками снимая зависимые строки.
+
+    Каскад Django удалил бы избранное, корзины и ленты популярного
+    рецепта одним запросом в той же транзакции, что и сам рецепт.
+    """
+    chunk = chunk or settings.DELETE_CHUNK_SIZE
+    while True:
+        recipe_ids = list(queryset.order_by().values_list("pk", flat=True)[:chunk])
+        if not recipe_ids:
+            return
+        transaction.on_commit(
+            partial(recipe_facets.bump, *recipe_facets.scopes(recipe_ids))
+        )
+        # Избранное и корзины — без сигналов: они уменьшали бы по строке
+        # счётчики активности, которые удаляются следом целиком
+        for model, field, signals in (
+            (Favorite, "recipe", False),
+            (ShoppingCart, "recipe", False),
+            (FeedEntry, "recipe", True),
+            (RecipeActivity, "recipe", True),
+            (SimilarRecipe, "recipe", True),
+            (SimilarRecipe, "similar", True),
+            (RecipeIngredient, "recipe", True),
+        ):
+            delete_chunked(
+                model.objects.filter(**{f"{field}__in": recipe_ids}), chunk, signals
+            )
+        # Сигналы рецептов (кеши, удаление картинок) срабатывают как обычно
+        delete_chunked(Recipe.objects.filter(pk__in=recipe_ids), chunk)
+
+
+def delete_user(user, chunk=None):
+    """Удаляет пользователя с рецептами, подписками и списками пачками."""
+    delete_recipes(Recipe.objects.filter(author=user), chunk)
+    for queryset in (
+        Favorite.objects.filter(user=user),
+        ShoppingCart.objects.filter(user=user),
+        FeedEntry.objects.filter(user=user),
+        FeedEntry.objects.filter(author=user),
+    ):
+        delete_chunked(queryset, chunk)
+    # Строки ленты уже удалены, поэтому подписки удаляются без сигнала
+    # prune_feed: он правил бы inbox и ставил задачу на каждого подписчика.
+    # Пересобрать надо только inbox тех, кому лента переключится на него
+    switching = list(feed.followers_switching_to_inbox(user.pk))
+    for queryset in (
+        Follow.objects.filter(follower=user),
+        Follow.objects.filter(following=user),
+    ):
+        delete_chunked(queryset, chunk, signals=False)
+    for follower_id in switching:
+        feed.rebuild_inbox(follower_id, settings.FEED_INBOX_BACKFILL)
+        enqueue(backfill_inbox, user_id=follower_id)
+    for queryset in (
+        AuthorSuggestion.objects.filter(user=user),
+        AuthorSuggestion.objects.filter(author=user),
+        Token.objects.filter(user=user),
+    ):
+        delete_chunked(queryset, chunk)
+    user.delete()
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from recipes.caches import is_shared
+from recipes.models import Recipe, RecipeIngredient
+
+# Интервалы времени приготовления в минутах: (от, до), границы включены
+COOKING_TIME_BUCKETS = ((None, 15), (16, 30), (31, 60), (61, None))
+TOP_INGREDIENTS = 10
+REFRESH_LOCK_TIMEOUT = 30
+
+
+def bucket_label(low, high):
+    if low is None:
+        return f"0-{high}"
+    if high is None:
+        return f"{low}+"
+    return f"{low}-{high}"
+
+
+def facet_scopes(signature):
+    """Версии, от которых зависят счётчики выборки с фильтрами `signature`.
+
+    Запись рецепта меняет версии своего автора, своих ингредиентов до и
+    после изменения и общую версию `all`. Выборку автора затрагивают
+    только его рецепты, выборку с обязательными ингредиентами — только
+    рецепты, где первый из них был или стал. Справочник ингредиентов
+    (`catalog`) входит в счётчики любой выборки.
+    """
+    scopes = ["catalog"]
+    if "author" in signature:
+        scopes.append(f"author:{signature['author']}")
+    elif "ingredients" in signature:
+        scopes.append(f"ingredient:{signature['ingredients'][0]}")
+    else:
+        scopes.append("all")
+    return scopes
+
+
+def compute_facets(queryset):
+    """Счётчики фильтров по рецептам `queryset`.
+
+    Интервалы времени приготовления считаются одним агрегатным запросом,
+    самые частые ингредиенты — одним запросом с группировкой.
+    """
+    recipes = Recipe.objects.filter(pk__in=queryset.order_by().values("pk"))
+    counts = {}
+    for low, high in COOKING_TIME_BUCKETS:
+        condition = Q()
+        if low is not None:
+            condition &= Q(cooking_time__gte=low)
+        if high is not None:
+            condition &= Q(cooking_time__lte=high)
+        counts[bucket_label(low, high)] = Count("pk", filter=condition)
+    counts = recipes.aggregate(**counts)
+    ingredients = (
+        RecipeIngredient.objects.filter(recipe__in=recipes.values("pk"))
+        .values("ingredient_id", "ingredient__name", "ingredient__measurement_unit")
+        .annotate(count=Count("recipe_id", distinct=True))
+        .order_by("-count", "ingredient_id")[:TOP_INGREDIENTS]
+    )
+    return {
+        "cooking_time": [
+            {
+                "range": bucket_label(low, high),
+                "min": low,
+                "max": high,
+                "count": counts[bucket_label(low, high)],
+            }
+            for low, high in COOKING_TIME_BUCKETS
+        ],
+        "ingredients": [
+            {
+                "id": row["ingredient_id"],
+                "name": row["ingredient__name"],
+                "measurement_unit": row["ingredient__measurement_unit"],
+                "count": row["count"],
+            }
+            for row in ingredients
+        ],
+    }
+
+
+class RecipeFacetCache:
+    """Счётчики фильтров для частых сочетаний фильтров в кеше `RECIPE_CACHE`.
+
+    Без фильтров счётчики кешируются всегда, остальные сочетания — после
+    `FACET_CACHE_MIN_HITS` запросов за `FACET_CACHE_TTL` секунд. Запись
+    рецепта (создание, изменение, удаление пачки) один раз после фиксации
+    транзакции меняет версии затронутых областей (`facet_scopes`), и
+    сбрасываются только зависящие от них записи; устаревшая запись
+    пересчитывается при первом обращении к ней, а пока один воркер её
+    пересчитывает, остальные отдают старые числа. Как и кеш JSON
+    рецептов, работает только с общим для воркеров бэкендом.
+    """
+
+    @property
+    def cache(self):
+        return caches[settings.RECIPE_CACHE]
+
+    @property
+    def enabled(self):
+        return settings.FACET_CACHE_TTL > 0 and is_shared(self.cache)
+
+    def version_key(self, scope):
+        return f"recipe-facets:version:{scope}"
+
+    def versions(self, scopes):
+        keys = {scope: self.version_key(scope) for scope in scopes}
+        found = self.cache.get_many(list(keys.values()))
+        versions = {}
+        for scope, key in keys.items():
+            if key not in found:
+                self.cache.add(key, uuid.uuid4().hex[:12], None)
+                found[key] = self.cache.get(key)
+            versions[scope] = found[key]
+        return versions
+
+    def set_versions(self, scopes):
+        if self.enabled:
+            self.cache.set_many(
+                {self.version_key(scope): uuid.uuid4().hex[:12] for scope in scopes},
+                None,
+            )
+
+    def scopes(self, recipe_ids):
+        """Авторы и ингредиенты рецептов `recipe_ids` — аргументы `bump`."""
+        if not self.enabled:
+            return set(), set()
+        author_ids = Recipe.objects.filter(pk__in=recipe_ids).values_list(
+            "author_id", flat=True
+        )
+        ingredient_ids = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list("ingredient_id", flat=True)
+        return set(author_ids), set(ingredient_ids)
+
+    def bump(self, author_ids=(), ingredient_ids=()):
+        """Сбрасывает счётчики выборок, куда входили или вошли рецепты.
+
+        `author_ids` — авторы изменённых рецептов, `ingredient_ids` — их
+        ингредиенты до и после изменения.
+        """
+        self.set_versions(
+            [
+                "all",
+                *(f"author:{author_id}" for author_id in set(author_ids)),
+                *(
+                    f"ingredient:{ingredient_id}"
+                    for ingredient_id in set(ingredient_ids)
+                ),
+            ]
+        )
+
+    def bump_catalog(self):
+        self.set_versions(["catalog"])
+
+    def is_popular(self, key, signature):
+        if not signature:
+            return True
+        hits_key = f"{key}:hits"
+        self.cache.add(hits_key, 0, settings.FACET_CACHE_TTL)
+        try:
+            hits = self.cache.incr(hits_key)
+        except ValueError:
+            return False
+        return hits >= settings.FACET_CACHE_MIN_HITS
+
+    def get(self, signature, queryset):
+        """Счётчики для `queryset`; `signature` — словарь его фильтров.
+
+        `signature=None` значит, что выборка зависит от пользователя и
+        не кешируется.
+        """
+        if signature is None or not self.enabled:
+            return compute_facets(queryset)
+        digest = hashlib.sha1(
+            json.dumps(signature, sort_keys=True, ensure_ascii=False).encode()
+        ).hexdigest()
+        key = f"recipe-facets:{digest}"
+        version = self.versions(facet_scopes(signature))
+        entry = self.cache.get(key)
+        if entry is not None and entry["version"] == version:
+            return entry["facets"]
+        if entry is None and not self.is_popular(key, signature):
+            return compute_facets(queryset)
+        if entry is None:
+            return self.refresh(key, version, queryset)
+        lock_key = f"{key}:lock"
+        if not self.cache.add(lock_key, 1, REFRESH_LOCK_TIMEOUT):
+            return entry["facets"]
+        try:
+            return self.refresh(key, version, queryset)
+        finally:
+            self.cache.delete(lock_key)
+
+    def refresh(self, key, version, queryset):
+        facets = compute_facets(queryset)
+        self.cache.set(
+            key, {"version": version, "facets": facets}, settings.FACET_CACHE_TTL
+        )
+        return facets
+
+
+recipe_facets = RecipeFacetCache()
@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def follows_count(user_id):
+    return Follow.objects.filter(follower_id=user_id).count()
+
+
+def uses_inbox(user_id):
+    """Небольшие подписки читаются из готового inbox, большие — слиянием."""
+    return follows_count(user_id) <= settings.FEED_INBOX_MAX_FOLLOWS
+
+
+def feed_queryset(user):
+    if uses_inbox(user.id):
+        return Recipe.objects.filter(feed_entries__user=user)
+    return Recipe.objects.filter(
+        author__in=Follow.objects.filter(follower=user).values("following")
+    )
+
+
+def _followers_with_totals(author_id):
+    """Подписчики автора с числом их подписок в аннотации `total`."""
+    follows = (
+        Follow.objects.filter(follower=OuterRef("follower"))
+        .order_by()
+        .values("follower")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    return Follow.objects.filter(following_id=author_id).annotate(
+        total=Subquery(follows)
+    )
+
+
+def _inbox_followers(author_id):
+    return (
+        _followers_with_totals(author_id)
+        .filter(total__lte=settings.FEED_INBOX_MAX_FOLLOWS)
+        .values_list("follower_id", flat=True)
+    )
+
+
+def followers_switching_to_inbox(author_id):
+    """Подписчики, которым без этого автора лента переключится на inbox."""
+    return (
+        _followers_with_totals(author_id)
+        .filter(total=settings.FEED_INBOX_MAX_FOLLOWS + 1)
+        .values_list("follower_id", flat=True)
+    )
+
+
+def fan_out(recipe):
+    """Раскладывает новый рецепт по inbox подписчиков автора."""
+    batch = []
+    for follower_id in _inbox_followers(recipe.author_id).iterator(
+        chunk_size=FANOUT_BATCH_SIZE
+    ):
+        batch.append(
+            FeedEntry(user_id=follower_id, recipe=recipe, author_id=recipe.author_id)
+        )
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user_id, author_id, limit=None):
+    """Кладёт в inbox рецепты автора: `limit` новых или все."""
+    recipe_ids = Recipe.objects.filter(author_id=author_id).values_list("id", flat=True)
+    if limit is not None:
+        recipe_ids = recipe_ids[:limit]
+    batch = []
+    for recipe_id in recipe_ids.iterator(chunk_size=FANOUT_BATCH_SIZE):
+        batch.append(
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+        )
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill_history(user_id, author_id=None):
+    """Дополняет inbox всеми рецептами авторов (задача `backfill_inbox`).
+
+    Inbox должен совпадать с лентой, собранной слиянием, поэтому после
+    быстрого частичного заполнения история докладывается целиком.
+    """
+    if not uses_inbox(user_id):
+        return
+    authors = Follow.objects.filter(follower_id=user_id)
+    if author_id is not None:
+        authors = authors.filter(following_id=author_id)
+    for following_id in authors.values_list("following_id", flat=True):
+        backfill(user_id, following_id)
+
+
+def rebuild_inbox(user_id, limit=None):
+    with transaction.atomic():
+        FeedEntry.objects.filter(user_id=user_id).delete()
+        if not uses_inbox(user_id):
+            return
+        for author_id in Follow.objects.filter(follower_id=user_id).values_list(
+            "following_id", flat=True
+        ):
+            backfill(user_id, author_id, limit)
+
+
+def on_follow(follow):
+    """Возвращает True, если историю автора надо дополнить задачей."""
+    total = follows_count(follow.follower_id)
+    if total <= settings.FEED_INBOX_MAX_FOLLOWS:
+        # Первая страница ленты нужна сразу, остальное доложит задача
+        backfill(follow.follower_id, follow.following_id, settings.FEED_INBOX_BACKFILL)
+        return True
+    if total == settings.FEED_INBOX_MAX_FOLLOWS + 1:
+        FeedEntry.objects.filter(user_id=follow.follower_id).delete()
+    return False
+
+
+def on_unfollow(follow):
+    """Возвращает True, если inbox перестроен частично и его надо дополнить."""
+    total = follows_count(follow.follower_id)
+    if total < settings.FEED_INBOX_MAX_FOLLOWS:
+        FeedEntry.objects.filter(
+            user_id=follow.follower_id, author_id=follow.following_id
+        ).delete()
+    elif total == settings.FEED_INBOX_MAX_FOLLOWS:
+        rebuild_inbox(follow.follower_id, settings.FEED_INBOX_BACKFILL)
+        return True
+    return False
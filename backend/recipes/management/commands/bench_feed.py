@@ -0,0 +1,55 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from recipes.feed import feed_queryset, uses_inbox
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время чтения ленты подписок для случайных пользователей "
+        "(inbox и слияние при чтении отдельно). Данные готовит seed_scale."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--pages", type=int, default=5)
+        parser.add_argument("--limit", type=int, default=6)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        candidates = list(
+            User.objects.annotate(follows=Count("following"))
+            .filter(follows__gt=0)
+            .values_list("id", flat=True)[:100000]
+        )
+        rng = random.Random(options["seed"])
+        sample = rng.sample(candidates, min(options["users"], len(candidates)))
+        timings = {True: [], False: []}
+        for user in User.objects.filter(id__in=sample):
+            inbox = uses_inbox(user.id)
+            cursor = None
+            for _ in range(options["pages"]):
+                started = time.perf_counter()
+                queryset = feed_queryset(user).order_by("-id")
+                if cursor is not None:
+                    queryset = queryset.filter(id__lt=cursor)
+                page = list(queryset.values_list("id", flat=True)[: options["limit"]])
+                timings[inbox].append((time.perf_counter() - started) * 1000)
+                if not page:
+                    break
+                cursor = page[-1]
+        for inbox, values in timings.items():
+            if not values:
+                continue
+            values.sort()
+            label = "inbox" if inbox else "слияние"
+            self.stdout.write(
+                f"{label}: страниц {len(values)}, "
+                f"p50 {statistics.median(values):.2f} мс, "
+                f"p95 {values[min(len(values) - 1, int(len(values) * 0.95))]:.2f} мс, "
+                f"max {values[-1]:.2f} мс"
+            )
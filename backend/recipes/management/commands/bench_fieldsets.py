@@ -0,0 +1,78 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from users.models import User
+
+CARD_FIELDS = "id,name,image,cooking_time,is_favorited,is_in_shopping_cart"
+CASES = (
+    ("рецепты целиком", "/api/recipes/?limit={limit}"),
+    ("карточки рецептов", "/api/recipes/?limit={limit}&fields=" + CARD_FIELDS),
+    ("пользователи целиком", "/api/users/?limit={limit}"),
+    ("пользователи кратко", "/api/users/?limit={limit}&fields=id,username,avatar"),
+    ("подписки целиком", "/api/users/subscriptions/?limit={limit}"),
+    ("подписки без рецептов", "/api/users/subscriptions/?limit={limit}&omit=recipes"),
+)
+
+
+def collect_queries(queries):
+    def wrapper(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    return wrapper
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает размер ответа, число запросов к БД и время ответа API "
+        "с полным набором полей и с `?fields=`/`?omit=`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--limit", type=int, default=6)
+        parser.add_argument(
+            "--user", type=int, help="Id пользователя, от имени которого запросы"
+        )
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user = User.objects.filter(id=options["user"]).first()
+        else:
+            user = (
+                User.objects.annotate(follows=Count("following"))
+                .filter(follows__gt=0)
+                .first()
+            )
+        if user is None:
+            raise CommandError("Нет пользователя с подписками, запустите seed_scale.")
+        client = APIClient()
+        client.force_authenticate(user)
+        self.stdout.write(
+            f"{'':24} {'байт':>8} {'запросов':>9} {'p50, мс':>9} {'p95, мс':>9}"
+        )
+        with override_settings(API_THROTTLE_ENABLED=False, ALLOWED_HOSTS=["*"]):
+            for label, url in CASES:
+                url = url.format(limit=options["limit"])
+                # connection.queries сбрасывается в начале каждого запроса
+                queries = []
+                with connection.execute_wrapper(collect_queries(queries)):
+                    response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f"{url}: статус {response.status_code}")
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    client.get(url)
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(
+                    f"{label:24} {len(response.content):8} {len(queries):9} "
+                    f"{statistics.median(timings):9.2f} {p95:9.2f}"
+                )
@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from foodgram.handlers import ApiWSGIHandler
+
+DEFAULT_PATHS = ("/api/ingredients/?name=соль", "/api/recipes/?limit=1")
+
+
+def start_response(status, headers, exc_info=None):
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время обработки запросов к API полной цепочкой "
+        "MIDDLEWARE и укороченной API_MIDDLEWARE в одном процессе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--path", action="append", dest="paths")
+        parser.add_argument("--token", help="Ключ токена для заголовка Authorization")
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options["token"]:
+            headers["HTTP_AUTHORIZATION"] = f"Token {options['token']}"
+        factory = RequestFactory()
+        with override_settings(API_THROTTLE_ENABLED=False, ALLOWED_HOSTS=["*"]):
+            handlers = {"MIDDLEWARE": WSGIHandler(), "API_MIDDLEWARE": ApiWSGIHandler()}
+            for path in options["paths"] or DEFAULT_PATHS:
+                results = {}
+                for label, handler in handlers.items():
+                    timings = []
+                    for number in range(options["requests"]):
+                        environ = factory.get(path, **headers).environ
+                        started = time.perf_counter()
+                        response = handler(environ, start_response)
+                        b"".join(response)
+                        response.close()
+                        timings.append((time.perf_counter() - started) * 1e6)
+                    # Первые запросы прогревают кеши и соединение
+                    timings = sorted(timings[len(timings) // 10 :])
+                    results[label] = statistics.median(timings)
+                    self.stdout.write(
+                        f"{path} {label:15} p50 {results[label]:8.1f} мкс, "
+                        f"p95 {timings[int(len(timings) * 0.95)]:8.1f} мкс"
+                    )
+                saved = results["MIDDLEWARE"] - results["API_MIDDLEWARE"]
+                self.stdout.write(
+                    f"{path} экономия {saved:.1f} мкс на запрос "
+                    f"({saved / results['MIDDLEWARE']:.0%})"
+                )
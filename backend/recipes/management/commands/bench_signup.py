@@ -0,0 +1,77 @@
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from .bench_fieldsets import collect_queries
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Измеряет регистрацию через POST /api/users/: запросы к БД и время "
+        "на одну регистрацию. Созданные пользователи откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--real-hasher",
+            action="store_true",
+            help="Хешировать пароли настоящим PASSWORD_HASHERS (медленно)",
+        )
+
+    def handle(self, *args, **options):
+        client = APIClient()
+        overrides = {"API_THROTTLE_ENABLED": False, "ALLOWED_HOSTS": ["*"]}
+        if not options["real_hasher"]:
+            # Иначе время почти целиком уходит на PBKDF2
+            overrides["PASSWORD_HASHERS"] = [
+                "django.contrib.auth.hashers.MD5PasswordHasher"
+            ]
+        prefix = uuid.uuid4().hex[:8]
+        queries = []
+        timings = []
+        duplicates = []
+        try:
+            with override_settings(**overrides), transaction.atomic():
+                with connection.execute_wrapper(collect_queries(queries)):
+                    for number in range(options["requests"]):
+                        payload = {
+                            "email": f"bench-{prefix}-{number}@example.com",
+                            "username": f"bench_{prefix}_{number}",
+                            "first_name": "Бенчмарк",
+                            "last_name": "Регистрация",
+                            "password": "bench-password-123",
+                        }
+                        started = time.perf_counter()
+                        response = client.post("/api/users/", payload, format="json")
+                        timings.append((time.perf_counter() - started) * 1000)
+                        if response.status_code != 201:
+                            raise CommandError(
+                                f"Статус {response.status_code}: {response.data}"
+                            )
+                    signups = len(queries)
+                    # Повторная регистрация должна отсекаться проверкой
+                    payload["email"] = payload["email"].upper()
+                    response = client.post("/api/users/", payload, format="json")
+                    duplicates = [response.status_code, response.data]
+                raise Rollback
+        except Rollback:
+            pass
+        timings.sort()
+        total = sum(timings) / 1000
+        self.stdout.write(
+            f"Регистраций: {len(timings)}, {len(timings) / total:.1f} в секунду, "
+            f"p50 {statistics.median(timings):.2f} мс, "
+            f"p95 {timings[int(len(timings) * 0.95)]:.2f} мс"
+        )
+        self.stdout.write(f"Запросов к БД на регистрацию: {signups / len(timings):.1f}")
+        self.stdout.write(f"Повтор с тем же email и именем: {duplicates}")
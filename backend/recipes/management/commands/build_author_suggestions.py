@@ -0,0 +1,45 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.suggestions import (
+    AUTHOR_SUGGESTIONS_LIMIT,
+    BATCH_SIZE,
+    rebuild_author_suggestions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает рекомендации «Вам могут понравиться» по подпискам "
+        "подписок и авторам рецептов из избранного."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=AUTHOR_SUGGESTIONS_LIMIT,
+            help="Сколько авторов хранить для каждого пользователя",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Сколько пользователей обрабатывать за одну транзакцию",
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        processed = rebuild_author_suggestions(
+            limit=options["limit"],
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пересчитано пользователей: {processed} "
+                f"за {time.monotonic() - started:.1f} с"
+            )
+        )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from recipes.similarity import (
+    BATCH_SIZE,
+    SIMILAR_RECIPES_LIMIT,
+    rebuild_similar_recipes,
+)
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает списки похожих рецептов по общим ингредиентам."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Пересчитать все рецепты, а не только изменённые",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=SIMILAR_RECIPES_LIMIT,
+            help="Сколько похожих рецептов хранить для каждого рецепта",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Сколько рецептов обрабатывать за одну транзакцию",
+        )
+
+    def handle(self, *args, **options):
+        processed = rebuild_similar_recipes(
+            full=options["full"],
+            limit=options["limit"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано рецептов: {processed}"))
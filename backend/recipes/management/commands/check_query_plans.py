@@ -0,0 +1,184 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from recipes.feed import fan_out
+from recipes.models import Recipe
+from rest_framework.test import APIClient
+from users.models import User
+
+# Кеши JSON рецептов и счётчиков отключены: иначе часть запросов не дошла
+# бы до БД и их планы остались бы непроверенными
+CAPTURE_SETTINGS = {
+    "ALLOWED_HOSTS": ["testserver"],
+    "API_THROTTLE_ENABLED": False,
+    "RECIPE_CACHE_TTL": 0,
+    "FACET_CACHE_TTL": 0,
+}
+
+
+def endpoint_requests(user, author, recipe):
+    """Проверяемые запросы к API: имя → (путь, переопределения настроек).
+
+    Запросы выполняет `user`. Поиск ингредиентов не проверяется: его
+    отдаёт справочник в памяти процесса.
+    """
+    return {
+        "GET /recipes/": ("/api/recipes/", {}),
+        "GET /recipes/?author=": (f"/api/recipes/?author={author.pk}", {}),
+        "GET /recipes/?is_favorited=1": ("/api/recipes/?is_favorited=1", {}),
+        "GET /recipes/?is_in_shopping_cart=1": (
+            "/api/recipes/?is_in_shopping_cart=1",
+            {},
+        ),
+        "GET /recipes/{id}/": (f"/api/recipes/{recipe.pk}/", {}),
+        "GET /users/": ("/api/users/", {}),
+        "GET /users/{id}/": (f"/api/users/{author.pk}/", {}),
+        "GET /users/subscriptions/": ("/api/users/subscriptions/", {}),
+        "GET /recipes/download_shopping_cart/": (
+            "/api/recipes/download_shopping_cart/",
+            {},
+        ),
+        "GET /recipes/feed/": ("/api/recipes/feed/", {}),
+        "GET /recipes/feed/ (слияние)": (
+            "/api/recipes/feed/",
+            {"FEED_INBOX_MAX_FOLLOWS": 0},
+        ),
+        "GET /recipes/trending/": ("/api/recipes/trending/", {}),
+        "GET /recipes/{id}/similar/": (f"/api/recipes/{recipe.pk}/similar/", {}),
+    }
+
+
+def captured_selects(action):
+    """SQL всех SELECT, выполненных `action()`, с подставленными параметрами."""
+    with CaptureQueriesContext(connection) as queries:
+        action()
+    return [
+        query["sql"]
+        for query in queries
+        if query["sql"].lstrip().upper().startswith("SELECT")
+    ]
+
+
+def query_plan(sql):
+    """План запроса в виде словаря EXPLAIN (FORMAT JSON)."""
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def endpoint_plans(user, author, recipe):
+    """Тройки (имя, SQL, план) для всех SELECT, выполненных эндпоинтами.
+
+    Запросы снимаются с настоящих ответов API через тестовый клиент, так
+    что проверка не расходится с view. Запускать внутри транзакции:
+    роутер реплик тогда читает с основной БД, а записи (отметка о
+    скачивании корзины, рассылка в ленту) откатываются вызывающим.
+    """
+    client = APIClient()
+    client.force_authenticate(user)
+    for name, (path, overrides) in endpoint_requests(user, author, recipe).items():
+
+        def request():
+            response = client.get(path)
+            if response.status_code != 200:
+                raise CommandError(f"{name}: ответ {response.status_code}")
+
+        with override_settings(**CAPTURE_SETTINGS, **overrides):
+            selects = captured_selects(request)
+        for sql in selects:
+            yield name, sql, query_plan(sql)
+    for sql in captured_selects(lambda: fan_out(recipe)):
+        yield "рассылка в ленту", sql, query_plan(sql)
+
+
+def seq_scans(plan):
+    """Имена таблиц, которые план читает последовательным сканированием."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет EXPLAIN для запросов эндпоинтов API и завершается с ошибкой, "
+        "если план читает большую таблицу последовательным сканированием. "
+        "Запускать на PostgreSQL с данными от seed_scale."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-rows",
+            type=int,
+            default=10000,
+            help="Таблицы меньше этого размера можно сканировать целиком",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Перед проверкой обновить статистику планировщика (ANALYZE)",
+        )
+        parser.add_argument("--verbose-plans", action="store_true")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Проверка планов поддерживается только в PostgreSQL.")
+        if options["analyze"]:
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        sizes = self._table_sizes()
+        user, author, recipe = self._sample()
+        failures = []
+        with transaction.atomic():
+            for name, sql, plan in endpoint_plans(user, author, recipe):
+                large = [
+                    table
+                    for table in seq_scans(plan)
+                    if sizes.get(table, 0) >= options["min_rows"]
+                ]
+                if large:
+                    failures.append(name)
+                    self.stdout.write(
+                        self.style.ERROR(f"FAIL {name}: Seq Scan по {', '.join(large)}")
+                    )
+                else:
+                    self.stdout.write(f"ok   {name}")
+                if large or options["verbose_plans"]:
+                    self.stdout.write(sql)
+                    self.stdout.write(json.dumps(plan, ensure_ascii=False, indent=2))
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(
+                f"Последовательное сканирование в {len(failures)} запросах: "
+                + "; ".join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS("Все планы используют индексы."))
+
+    def _table_sizes(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname, reltuples FROM pg_class "
+                "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+            )
+            return {name: rows for name, rows in cursor.fetchall()}
+
+    def _sample(self):
+        """Самые активные пользователь и автор — худший случай для планов."""
+        user = (
+            User.objects.annotate(total=Count("following")).order_by("-total").first()
+        )
+        author = (
+            User.objects.annotate(total=Count("recipes")).order_by("-total").first()
+        )
+        recipe = Recipe.objects.filter(author=author).first()
+        if user is None or recipe is None:
+            raise CommandError("Нет данных: сначала выполните seed_scale.")
+        return user, author, recipe
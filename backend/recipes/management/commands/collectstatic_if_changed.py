@@ -0,0 +1,50 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+FINGERPRINT_FILE = ".collectstatic-fingerprint"
+MANIFEST_FILE = "staticfiles.json"
+IGNORE_PATTERNS = ["CVS", ".*", "*~"]
+
+
+def sources_fingerprint():
+    """Хеш списка исходных файлов статики с их размерами и временем изменения."""
+    entries = []
+    for finder in get_finders():
+        for path, storage in finder.list(IGNORE_PATTERNS):
+            stat = os.stat(storage.path(path))
+            prefix = getattr(storage, "prefix", None) or ""
+            entries.append(f"{prefix}/{path}:{stat.st_size}:{stat.st_mtime_ns}")
+    entries.sort()
+    entries.append(settings.STORAGES["staticfiles"]["BACKEND"])
+    return hashlib.sha256("\n".join(entries).encode()).hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Запускает collectstatic, только если исходные файлы статики "
+        "изменились с прошлого запуска или манифеста ещё нет."
+    )
+
+    def handle(self, *args, **options):
+        fingerprint = sources_fingerprint()
+        fingerprint_path = os.path.join(settings.STATIC_ROOT, FINGERPRINT_FILE)
+        try:
+            with open(fingerprint_path) as file:
+                previous = file.read().strip()
+        except OSError:
+            previous = None
+        # Манифест пишет только ManifestStaticFilesStorage (без DEBUG)
+        manifest = os.path.join(settings.STATIC_ROOT, MANIFEST_FILE)
+        needs_manifest = hasattr(staticfiles_storage, "manifest_name")
+        if previous == fingerprint and (not needs_manifest or os.path.exists(manifest)):
+            self.stdout.write("Статика не изменилась, collectstatic пропущен.")
+            return
+        call_command("collectstatic", interactive=False, verbosity=options["verbosity"])
+        with open(fingerprint_path, "w") as file:
+            file.write(fingerprint)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from recipes.trending import compact_activity
+
+
+class Command(BaseCommand):
+    help = "Сворачивает старые часовые интервалы активности рецептов в суточные."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-hours",
+            type=int,
+            default=48,
+            help="Сколько последних часов хранить с часовой детализацией",
+        )
+
+    def handle(self, *args, **options):
+        compacted = compact_activity(options["keep_hours"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Свёрнуто часовых интервалов: {compacted}")
+        )
@@ -0,0 +1,101 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from users.models import User
+
+# Каталог медиа → модель и поле, которые на него ссылаются
+MEDIA_DIRS = {
+    "recipes": (Recipe, "image"),
+    "users/avatars": (User, "avatar"),
+}
+
+
+def walk(path):
+    """Файлы каталога и подкаталогов без построения полного списка."""
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет из MEDIA_ROOT картинки рецептов и аватары, на которые не "
+        "ссылается ни одна запись. Файлы сверяются с БД пачками; свежие "
+        "файлы не трогаются, так как запись о них может быть ещё не сохранена."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument(
+            "--quarantine",
+            help="Переносить файлы в этот каталог вместо удаления",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=3600,
+            help="Не трогать файлы моложе стольких секунд",
+        )
+        parser.add_argument("--chunk", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.scanned = self.orphans = self.freed = 0
+        cutoff = time.time() - options["min_age"]
+        for directory, (model, field) in MEDIA_DIRS.items():
+            root = os.path.join(settings.MEDIA_ROOT, directory)
+            if not os.path.isdir(root):
+                continue
+            batch = {}
+            for entry in walk(root):
+                self.scanned += 1
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime > cutoff:
+                    continue
+                name = os.path.relpath(entry.path, settings.MEDIA_ROOT)
+                batch[name.replace(os.sep, "/")] = (entry.path, stat.st_size)
+                if len(batch) >= options["chunk"]:
+                    self.collect(batch, model, field)
+                    batch = {}
+            if batch:
+                self.collect(batch, model, field)
+        action = "Найдено" if options["dry_run"] else "Убрано"
+        self.stdout.write(
+            f"Просмотрено файлов: {self.scanned}. {action} ненужных: "
+            f"{self.orphans}, {self.freed / 1024 / 1024:.1f} МБ."
+        )
+
+    def collect(self, batch, model, field):
+        # Одинаковые файлы хранятся один раз (foodgram.storage), поэтому
+        # файл нужен, пока на него ссылается хотя бы одна запись.
+        referenced = set(
+            model.objects.filter(**{f"{field}__in": list(batch)}).values_list(
+                field, flat=True
+            )
+        )
+        for name, (path, size) in batch.items():
+            if name in referenced:
+                continue
+            self.orphans += 1
+            self.freed += size
+            if self.options["verbosity"] > 1:
+                self.stdout.write(name)
+            if self.options["dry_run"]:
+                continue
+            try:
+                if self.options["quarantine"]:
+                    target = os.path.join(self.options["quarantine"], name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(path, target)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,121 @@
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from recipes.models import ShoppingCart
+
+ARCHIVE_FIELDS = ("id", "user_id", "recipe_id", "created_at", "touched_at")
+
+
+def table_sizes(model):
+    """Размер таблицы и её индексов в байтах (только PostgreSQL)."""
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_relation_size(%s), pg_indexes_size(%s)",
+            [model._meta.db_table] * 2,
+        )
+        table, indexes = cursor.fetchone()
+    return {"table": table, "indexes": indexes}
+
+
+def megabytes(size):
+    return f"{size / 1024 / 1024:.1f} МБ"
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет записи корзины, которыми не пользовались дольше "
+        "SHOPPING_CART_RETENTION_DAYS дней. Записи удаляются небольшими "
+        "пачками; удалённая пачка дописывается в архив .ndjson.gz."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.SHOPPING_CART_RETENTION_DAYS
+        )
+        parser.add_argument("--batch", type=int, default=1000)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.05,
+            help="Пауза между пачками в секундах",
+        )
+        parser.add_argument("--archive-dir", default=settings.SHOPPING_CART_ARCHIVE_DIR)
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="После удаления выполнить VACUUM ANALYZE (PostgreSQL)",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] <= 0:
+            self.stdout.write("Срок хранения корзин не задан, удалять нечего.")
+            return
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        expired = ShoppingCart.objects.filter(touched_at__lt=cutoff)
+        if options["dry_run"]:
+            self.stdout.write(f"Будет удалено записей: {expired.count()}.")
+            return
+
+        before = table_sizes(ShoppingCart)
+        os.makedirs(options["archive_dir"], exist_ok=True)
+        archive = os.path.join(
+            options["archive_dir"],
+            f"shopping_cart-{timezone.now():%Y%m%d-%H%M%S-%f}.ndjson.gz",
+        )
+        started = time.monotonic()
+        removed = 0
+        with gzip.open(archive, "wt", encoding="utf-8") as file:
+            while True:
+                # Пачка в своей транзакции: блокировки держатся недолго,
+                # занятые строки (пользователь как раз меняет корзину)
+                # пропускаются до следующего запуска
+                with transaction.atomic():
+                    rows = list(
+                        expired.select_for_update(skip_locked=True)
+                        .order_by("id")
+                        .values(*ARCHIVE_FIELDS)[: options["batch"]]
+                    )
+                    if not rows:
+                        break
+                    ShoppingCart.objects.filter(
+                        id__in=[row["id"] for row in rows]
+                    ).delete()
+                # В архив попадают только строки, удаление которых
+                # зафиксировано: откаченная пачка останется в таблице
+                for row in rows:
+                    file.write(json.dumps(row, default=str) + "\n")
+                file.flush()
+                removed += len(rows)
+                time.sleep(options["pause"])
+        if not removed:
+            os.remove(archive)
+            archive = None
+
+        if options["vacuum"]:
+            if connection.vendor != "postgresql":
+                raise CommandError("VACUUM поддерживается только для PostgreSQL.")
+            with connection.cursor() as cursor:
+                cursor.execute(f'VACUUM ANALYZE "{ShoppingCart._meta.db_table}"')
+        after = table_sizes(ShoppingCart)
+
+        self.stdout.write(
+            f"Удалено записей: {removed} за {time.monotonic() - started:.1f} с."
+        )
+        if archive:
+            self.stdout.write(f"Архив: {archive}")
+        if after is not None:
+            self.stdout.write(
+                f"Таблица: {megabytes(before['table'])} → "
+                f"{megabytes(after['table'])}, индексы: "
+                f"{megabytes(before['indexes'])} → {megabytes(after['indexes'])}."
+            )
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from recipes.feed import rebuild_inbox
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Заново раскладывает рецепты по inbox ленты подписок."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            help="Id пользователя (можно несколько)",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options["user"]:
+            users = users.filter(id__in=options["user"])
+        else:
+            users = users.annotate(follows=Count("following")).filter(
+                follows__gt=0, follows__lte=settings.FEED_INBOX_MAX_FOLLOWS
+            )
+        total = 0
+        for user_id in users.values_list("id", flat=True).iterator():
+            rebuild_inbox(user_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Перестроено лент: {total}"))
@@ -0,0 +1,33 @@
+import os
+import pickle
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.pantry import PantryData
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит индекс «что приготовить из своих продуктов» по всем рецептам "
+        "и сохраняет его в PANTRY_INDEX_PATH. Процессы сервера подхватывают "
+        "новый файл сами."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        data = PantryData.build()
+        path = settings.PANTRY_INDEX_PATH
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись во временный файл и переименование: процессы не прочтут
+        # недописанный снимок
+        with open(f"{path}.tmp", "wb") as file:
+            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Индекс: {len(data.postings)} ингредиентов, "
+                f"{os.path.getsize(path) / 1024 / 1024:.1f} МБ "
+                f"за {time.monotonic() - started:.1f} с"
+            )
+        )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from recipes.trending import rebuild_activity
+
+
+class Command(BaseCommand):
+    help = "Пересобирает часовую активность рецептов по избранному и корзинам."
+
+    def handle(self, *args, **options):
+        total = rebuild_activity()
+        self.stdout.write(self.style.SUCCESS(f"Записано интервалов: {total}"))
@@ -0,0 +1,380 @@
+import bisect
+import csv
+import io
+import itertools
+import multiprocessing
+import os
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
+from users.models import Follow, User
+
+SEED_PASSWORD = "seed-password"
+SEED_IMAGE = "recipes/seed.png"
+MAX_RECIPE_INGREDIENTS = 12
+# Минимальный валидный PNG 1×1, общий для всех сгенерированных рецептов
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d4944415478da6364f8cf500f00038601805a347d6b"
+    "0000000049454e44ae426082"
+)
+TEXT = "Нарежьте ингредиенты, смешайте, доведите до готовности и подавайте. " * 4
+
+
+class Zipf:
+    """Выбирает ранги 0..size-1 с вероятностью ~ 1 / (rank + 1) ** exponent."""
+
+    def __init__(self, size, exponent):
+        weights = itertools.accumulate(
+            1 / (rank + 1) ** exponent for rank in range(size)
+        )
+        self.cumulative = list(weights)
+        self.total = self.cumulative[-1]
+
+    def sample(self, rng):
+        return bisect.bisect_left(self.cumulative, rng.random() * self.total)
+
+    def distinct(self, rng, count):
+        chosen = set()
+        for _ in range(count * 4):
+            chosen.add(self.sample(rng))
+            if len(chosen) >= count:
+                break
+        return chosen
+
+
+def load_rows(model, fields, rows, batch_size):
+    """Загружает строки через COPY в PostgreSQL и bulk_create в остальных БД."""
+    meta_fields = [model._meta.get_field(name) for name in fields]
+    total = 0
+    if connection.vendor == "postgresql":
+        columns = ", ".join(
+            connection.ops.quote_name(field.column) for field in meta_fields
+        )
+        sql = (
+            f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) "
+            "FROM STDIN WITH (FORMAT csv)"
+        )
+        for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(sql, buffer)
+            total += len(batch)
+        return total
+    attnames = [field.attname for field in meta_fields]
+    for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+        model.objects.bulk_create(
+            [model(**dict(zip(attnames, row))) for row in batch],
+            batch_size=batch_size,
+        )
+        total += len(batch)
+    return total
+
+
+def _spread(rng, now, days):
+    return now - timedelta(seconds=rng.randrange(days * 86400))
+
+
+def _count(rng, average, cap):
+    if average <= 0:
+        return 0
+    return min(cap, int(rng.expovariate(1 / average)))
+
+
+def users_rows(plan, start, stop, rng):
+    for user_id in range(start, stop):
+        yield (
+            user_id,
+            f"seed{user_id}@example.com",
+            f"seed{user_id}",
+            "Имя",
+            f"Фамилия{user_id}",
+            plan["password"],
+            False,
+            False,
+            True,
+            _spread(rng, plan["now"], plan["days"]),
+        )
+
+
+def recipes_rows(plan, start, stop, rng):
+    authors = Zipf(plan["users"], plan["exponent"])
+    for recipe_id in range(start, stop):
+        updated_at = _spread(rng, plan["now"], plan["days"])
+        yield (
+            recipe_id,
+            plan["user_start"] + authors.sample(rng),
+            f"Рецепт {recipe_id}",
+            SEED_IMAGE,
+            TEXT,
+            rng.randint(1, 240),
+            uuid.UUID(int=rng.getrandbits(128), version=4),
+            updated_at,
+        )
+
+
+def recipe_ingredients_rows(plan, start, stop, rng):
+    catalog = plan["ingredients"]
+    ingredients = Zipf(len(catalog), plan["exponent"])
+    row_id = (
+        plan["recipe_ingredient_start"]
+        + (start - plan["recipe_start"]) * MAX_RECIPE_INGREDIENTS
+    )
+    for recipe_id in range(start, stop):
+        count = rng.randint(3, min(MAX_RECIPE_INGREDIENTS, len(catalog)))
+        for rank in ingredients.distinct(rng, count):
+            yield (row_id, recipe_id, catalog[rank], rng.randint(1, 500))
+            row_id += 1
+
+
+def follows_rows(plan, start, stop, rng):
+    authors = Zipf(plan["users"], plan["exponent"])
+    row_id = plan["follow_start"] + (start - plan["user_start"]) * plan["follows_cap"]
+    for follower_id in range(start, stop):
+        count = _count(rng, plan["follows"], plan["follows_cap"])
+        for rank in authors.distinct(rng, count):
+            following_id = plan["user_start"] + rank
+            if following_id != follower_id:
+                yield (row_id, follower_id, following_id)
+                row_id += 1
+
+
+def _marks_rows(plan, start, stop, rng, key):
+    recipes = Zipf(plan["recipes"], plan["exponent"])
+    cap = plan[f"{key}_cap"]
+    row_id = plan[f"{key}_start"] + (start - plan["user_start"]) * cap
+    for user_id in range(start, stop):
+        count = _count(rng, plan[key], cap)
+        for rank in recipes.distinct(rng, count):
+            yield (
+                row_id,
+                user_id,
+                plan["recipe_start"] + rank,
+                _spread(rng, plan["now"], plan["days"]),
+            )
+            row_id += 1
+
+
+def favorites_rows(plan, start, stop, rng):
+    return _marks_rows(plan, start, stop, rng, "favorites")
+
+
+def carts_rows(plan, start, stop, rng):
+    # touched_at без значения по умолчанию в БД: COPY должен передать его сам
+    for row_id, user_id, recipe_id, created_at in _marks_rows(
+        plan, start, stop, rng, "carts"
+    ):
+        yield (row_id, user_id, recipe_id, created_at, created_at)
+
+
+PHASES = (
+    (
+        "пользователи",
+        User,
+        (
+            "id",
+            "email",
+            "username",
+            "first_name",
+            "last_name",
+            "password",
+            "is_staff",
+            "is_superuser",
+            "is_active",
+            "date_joined",
+        ),
+        users_rows,
+        "users",
+    ),
+    (
+        "рецепты",
+        Recipe,
+        (
+            "id",
+            "author",
+            "name",
+            "image",
+            "text",
+            "cooking_time",
+            "short_uuid",
+            "updated_at",
+        ),
+        recipes_rows,
+        "recipes",
+    ),
+    (
+        "ингредиенты рецептов",
+        RecipeIngredient,
+        ("id", "recipe", "ingredient", "amount"),
+        recipe_ingredients_rows,
+        "recipes",
+    ),
+    ("подписки", Follow, ("id", "follower", "following"), follows_rows, "users"),
+    (
+        "избранное",
+        Favorite,
+        ("id", "user", "recipe", "created_at"),
+        favorites_rows,
+        "users",
+    ),
+    (
+        "корзины",
+        ShoppingCart,
+        ("id", "user", "recipe", "created_at", "touched_at"),
+        carts_rows,
+        "users",
+    ),
+)
+
+
+def _run_chunk(task):
+    phase_index, plan, start, stop = task
+    _, model, fields, generator, _ = PHASES[phase_index]
+    rng = random.Random(f"{plan['seed']}:{phase_index}:{start}")
+    try:
+        with transaction.atomic():
+            return load_rows(
+                model, fields, generator(plan, start, stop, rng), plan["batch_size"]
+            )
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует большой синтетический набор данных: пользователей, рецепты "
+        "с ингредиентами из справочника (распределение Ципфа), подписки, "
+        "избранное и корзины. В PostgreSQL данные грузятся через COPY "
+        "в несколько процессов, в SQLite — через bulk_create."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--recipes", type=int, default=100000)
+        parser.add_argument("--follows-per-user", type=float, default=20)
+        parser.add_argument("--favorites-per-user", type=float, default=30)
+        parser.add_argument("--carts-per-user", type=float, default=5)
+        parser.add_argument(
+            "--exponent", type=float, default=1.1, help="Показатель распределения Ципфа"
+        )
+        parser.add_argument(
+            "--days", type=int, default=365, help="За сколько дней размазать даты"
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--chunk-size", type=int, default=20000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        ingredients = list(
+            Ingredient.objects.order_by("id").values_list("id", flat=True)
+        )
+        if len(ingredients) < 3:
+            raise CommandError(
+                "Справочник ингредиентов пуст: сначала выполните load_ingredients."
+            )
+        if options["users"] < 2 or options["recipes"] < 1:
+            raise CommandError("Нужно хотя бы 2 пользователя и 1 рецепт.")
+        random.Random(options["seed"]).shuffle(ingredients)
+
+        def next_id(model):
+            return (model.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+
+        plan = {
+            "seed": options["seed"],
+            "now": timezone.now(),
+            "days": max(options["days"], 1),
+            "exponent": options["exponent"],
+            "batch_size": options["batch_size"],
+            "password": make_password(SEED_PASSWORD),
+            "ingredients": ingredients,
+            "users": options["users"],
+            "recipes": options["recipes"],
+            "follows": options["follows_per_user"],
+            "favorites": options["favorites_per_user"],
+            "carts": options["carts_per_user"],
+            "user_start": next_id(User),
+            "recipe_start": next_id(Recipe),
+            "recipe_ingredient_start": next_id(RecipeIngredient),
+            "follow_start": next_id(Follow),
+            "favorites_start": next_id(Favorite),
+            "carts_start": next_id(ShoppingCart),
+        }
+        # Каждому пользователю и рецепту заранее отводится диапазон id
+        # строк, поэтому процессы пишут без пересечений и без обращений
+        # к последовательностям БД.
+        for key in ("follows", "favorites", "carts"):
+            plan[f"{key}_cap"] = max(1, int(plan[key] * 10))
+        plan["follows_cap"] = min(plan["follows_cap"], options["users"] - 1)
+        plan["favorites_cap"] = min(plan["favorites_cap"], options["recipes"])
+        plan["carts_cap"] = min(plan["carts_cap"], options["recipes"])
+
+        workers = options["workers"]
+        if connection.vendor != "postgresql" and workers > 1:
+            self.stdout.write(
+                self.style.WARNING("Не PostgreSQL: загрузка пойдёт в один процесс.")
+            )
+            workers = 1
+        self._write_image()
+        connections.close_all()
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.get_context("fork").Pool(workers)
+        try:
+            for index, (label, model, _, _, entity) in enumerate(PHASES):
+                start = plan[f"{'user' if entity == 'users' else 'recipe'}_start"]
+                stop = start + plan[entity]
+                tasks = [
+                    (index, plan, chunk, min(chunk + options["chunk_size"], stop))
+                    for chunk in range(start, stop, options["chunk_size"])
+                ]
+                started = time.monotonic()
+                if pool is not None:
+                    total = sum(pool.imap_unordered(_run_chunk, tasks))
+                else:
+                    total = sum(map(_run_chunk, tasks))
+                self.stdout.write(
+                    f"{label}: {total} строк за {time.monotonic() - started:.1f} с"
+                )
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(),
+                [User, Recipe, RecipeIngredient, Follow, Favorite, ShoppingCart],
+            ):
+                cursor.execute(sql)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Готово. Производные таблицы заполняются отдельно: "
+                "rebuild_recipe_activity, rebuild_feed, build_similar_recipes."
+            )
+        )
+
+    def _write_image(self):
+        path = os.path.join(settings.MEDIA_ROOT, SEED_IMAGE)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(PNG)
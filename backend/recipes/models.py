@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 from users.models import User
 import uuid
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -17,6 +20,14 @@ class Ingredient(models.Model):
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=["name"], name="ingredient_name_idx"),
+            # name__istartswith → UPPER(name) LIKE 'МОЛ%'
+            models.Index(
+                OpClass(Upper("name"), name="text_pattern_ops"),
+                name="ingredient_name_upper_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -40,6 +51,9 @@ class Recipe(models.Model):
         ],
     )
     short_uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    updated_at = models.DateTimeField(
+        auto_now=True, db_index=True, verbose_name="Дата изменения"
+    )
 
     class Meta:
         verbose_name = "Рецепт"
@@ -50,13 +64,14 @@ class Recipe(models.Model):
                 fields=["author", "name"], name="unique_recipe_author_name"
             )
         ]
+        indexes = [models.Index(fields=["author", "-id"], name="recipe_author_id_idx")]
 
     def __str__(self):
         return self.name
 
 
 class RecipeIngredient(models.Model):
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
     amount = models.PositiveSmallIntegerField(
         verbose_name="Количество",
@@ -67,6 +82,9 @@ class RecipeIngredient(models.Model):
         verbose_name = "Ингредиент рецепта"
         verbose_name_plural = "Ингредиенты рецептов"
         ordering = ["id"]
+        indexes = [
+            models.Index(fields=["recipe", "ingredient"], name="recipe_ingredient_idx")
+        ]
 
     def __str__(self):
         return f"{self.ingredient.name} для {self.recipe.name}"
@@ -80,6 +98,9 @@ class Favorite(models.Model):
         verbose_name="Пользователь",
     )
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, verbose_name="Рецепт")
+    created_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Дата добавления"
+    )
 
     class Meta:
         verbose_name = "Избранное"
@@ -106,6 +127,14 @@ class ShoppingCart(models.Model):
         related_name="in_shopping_carts",
         verbose_name="Рецепт",
     )
+    created_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Дата добавления"
+    )
+    # Обновляется, когда пользователь пользуется корзиной; по нему
+    # purge_shopping_carts удаляет заброшенные записи
+    touched_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Последнее использование"
+    )
 
     class Meta:
         verbose_name = "Корзина покупок"
@@ -115,7 +144,115 @@ class ShoppingCart(models.Model):
                 fields=["user", "recipe"], name="unique_shopping_cart"
             )
         ]
+        indexes = [
+            models.Index(fields=["touched_at"], name="shopping_cart_touched_idx"),
+        ]
         ordering = ["-id"]
 
     def __str__(self):
         return f"{self.user} добавил {self.recipe} в корзину"
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="neighbors",
+        verbose_name="Рецепт",
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="neighbor_of",
+        verbose_name="Похожий рецепт",
+    )
+    score = models.FloatField(verbose_name="Сходство")
+    computed_at = models.DateTimeField(verbose_name="Дата расчёта")
+
+    class Meta:
+        verbose_name = "Похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+        ordering = ["recipe", "-score"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "similar"], name="unique_similar_recipe"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["recipe", "-score"], name="similar_recipe_score_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} ~ {self.similar} ({self.score:.3f})"
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Читатель",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Рецепт",
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+", verbose_name="Автор"
+    )
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        ordering = ["user", "-recipe"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "recipe"], name="unique_feed_entry")
+        ]
+        indexes = [
+            models.Index(fields=["user", "-recipe"], name="feed_entry_user_recipe_idx"),
+            models.Index(fields=["user", "author"], name="feed_entry_user_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} в ленте {self.user}"
+
+
+class RecipeActivity(models.Model):
+    HOUR = 1
+    DAY = 24
+    SPAN_CHOICES = ((HOUR, "Час"), (DAY, "Сутки"))
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="activity",
+        verbose_name="Рецепт",
+    )
+    start_hour = models.IntegerField(verbose_name="Начало интервала (часы от эпохи)")
+    span = models.PositiveSmallIntegerField(
+        choices=SPAN_CHOICES, default=HOUR, verbose_name="Длина интервала, ч"
+    )
+    favorites = models.PositiveIntegerField(
+        default=0, verbose_name="Добавлений в избранное"
+    )
+    carts = models.PositiveIntegerField(default=0, verbose_name="Добавлений в корзину")
+
+    class Meta:
+        verbose_name = "Активность рецепта"
+        verbose_name_plural = "Активность рецептов"
+        ordering = ["-start_hour"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "span", "start_hour"], name="unique_recipe_activity"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["span", "start_hour"], name="recipe_activity_window_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.recipe}: {self.favorites}/{self.carts} с {self.start_hour} ч"
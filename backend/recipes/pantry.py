@@ -0,0 +1,361 @@
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max
+
+from recipes.models import Recipe, RecipeIngredient
+
+MAX_PANTRY_SIZE = 50
+MAX_MISSING = 5
+READ_CHUNK_SIZE = 10000
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+def _bitmap(ids):
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for recipe_id in ids:
+        buffer[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _posting(ids):
+    """Плотные списки храним битовой картой, редкие — массивом id.
+
+    Размер битовой карты определяется самым большим id, поэтому для
+    редкого ингредиента массив на порядки компактнее.
+    """
+    ids = array("q", ids)
+    if ids and len(ids) * 64 >= max(ids):
+        return _bitmap(ids)
+    return ids
+
+
+def _as_bitmap(posting):
+    if isinstance(posting, int):
+        return posting
+    return _bitmap(posting)
+
+
+def _add_to_counter(slices, bitmap):
+    """Прибавляет битовую карту к поразрядному счётчику совпадений."""
+    carry = bitmap
+    for position, bits in enumerate(slices):
+        if not carry:
+            return
+        slices[position] = bits ^ carry
+        carry &= bits
+    if carry:
+        slices.append(carry)
+
+
+class PantryMatches:
+    """Ленивый список id рецептов, упорядоченный по числу недостающих.
+
+    Поддерживает `len()` и срезы, поэтому его можно отдать в пагинатор:
+    id извлекаются из битовых карт только для запрошенной страницы.
+    """
+
+    def __init__(self, levels):
+        self.levels = [(missing, bitmap) for missing, bitmap in levels if bitmap]
+        self.sizes = [bitmap.bit_count() for _, bitmap in self.levels]
+
+    def __len__(self):
+        return sum(self.sizes)
+
+    def count(self):
+        return len(self)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item : item + 1][0]
+        start, stop, _ = item.indices(len(self))
+        result = []
+        for (missing, bitmap), size in zip(self.levels, self.sizes):
+            if start >= size:
+                start -= size
+                stop -= size
+                continue
+            if stop <= 0:
+                break
+            digits = bin(bitmap)[2:]
+            width = len(digits)
+            position = -1
+            for index in range(min(stop, size)):
+                position = digits.find("1", position + 1)
+                if index >= start:
+                    result.append((width - 1 - position, missing))
+            start = 0
+            stop -= size
+        return result
+
+
+class PantryData:
+    """Состояние индекса: постинги, рецепты по числу ингредиентов и строки.
+
+    Строки матрицы (ингредиенты каждого рецепта) хранятся плоско:
+    `flat[starts[id] : starts[id] + lengths[id]]`. По ним точечное
+    обновление находит постинги, из которых надо убрать рецепт.
+    """
+
+    def __init__(self, watermark=None):
+        self.watermark = watermark
+        self.postings = {}
+        self.sizes = {}
+        self.flat = array("q")
+        self.starts = array("q")
+        self.lengths = array("l")
+
+    @classmethod
+    def build(cls):
+        """Читает все пары рецепт–ингредиент из БД."""
+        data = cls(Recipe.objects.aggregate(Max("updated_at"))["updated_at__max"])
+        columns = defaultdict(list)
+        previous = None
+        for pair in (
+            RecipeIngredient.objects.order_by("recipe_id", "ingredient_id")
+            .values_list("recipe_id", "ingredient_id")
+            .iterator(chunk_size=READ_CHUNK_SIZE)
+        ):
+            # Повтор ингредиента в рецепте не должен считаться дважды
+            if pair == previous:
+                continue
+            previous = recipe_id, ingredient_id = pair
+            data.reserve(recipe_id)
+            if not data.lengths[recipe_id]:
+                data.starts[recipe_id] = len(data.flat)
+            data.flat.append(ingredient_id)
+            data.lengths[recipe_id] += 1
+            columns[ingredient_id].append(recipe_id)
+        by_size = defaultdict(list)
+        for recipe_id, size in enumerate(data.lengths):
+            if size:
+                by_size[size].append(recipe_id)
+        data.postings = {
+            ingredient_id: _posting(recipe_ids)
+            for ingredient_id, recipe_ids in columns.items()
+        }
+        data.sizes = {size: _bitmap(recipe_ids) for size, recipe_ids in by_size.items()}
+        return data
+
+    def reserve(self, recipe_id):
+        missing = recipe_id + 1 - len(self.lengths)
+        if missing > 0:
+            self.starts.extend([0] * missing)
+            self.lengths.extend([0] * missing)
+
+    def ingredients(self, recipe_id):
+        if recipe_id >= len(self.lengths):
+            return ()
+        start = self.starts[recipe_id]
+        return self.flat[start : start + self.lengths[recipe_id]]
+
+    def apply(self, recipe_ids):
+        """Перечитывает ингредиенты `recipe_ids` и правит только их постинги.
+
+        Постинги и размеры заменяются новыми словарями целиком, поэтому
+        читатели не видят наполовину обновлённый индекс. Старые строки
+        остаются в `flat` до следующей полной перестройки.
+        """
+        current = defaultdict(set)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=list(recipe_ids)
+        ).values_list("recipe_id", "ingredient_id"):
+            current[recipe_id].add(ingredient_id)
+        removed = defaultdict(list)
+        added = defaultdict(list)
+        old_sizes = defaultdict(list)
+        new_sizes = defaultdict(list)
+        for recipe_id in recipe_ids:
+            old = self.ingredients(recipe_id)
+            new = sorted(current.get(recipe_id, ()))
+            for ingredient_id in old:
+                removed[ingredient_id].append(recipe_id)
+            for ingredient_id in new:
+                added[ingredient_id].append(recipe_id)
+            if old:
+                old_sizes[len(old)].append(recipe_id)
+            if new:
+                new_sizes[len(new)].append(recipe_id)
+            self.reserve(recipe_id)
+            self.starts[recipe_id] = len(self.flat)
+            self.lengths[recipe_id] = len(new)
+            self.flat.extend(new)
+        postings = dict(self.postings)
+        for ingredient_id in removed.keys() | added.keys():
+            posting = _patch(
+                postings.get(ingredient_id),
+                removed.get(ingredient_id, ()),
+                added.get(ingredient_id, ()),
+            )
+            if posting:
+                postings[ingredient_id] = posting
+            else:
+                postings.pop(ingredient_id, None)
+        sizes = dict(self.sizes)
+        for size in old_sizes.keys() | new_sizes.keys():
+            sizes[size] = _patch(
+                sizes.get(size, 0), old_sizes.get(size, ()), new_sizes.get(size, ())
+            )
+        self.postings, self.sizes = postings, sizes
+
+
+def _patch(posting, removed, added):
+    """Постинг без `removed` и с `added`; битовые карты остаются картами."""
+    if isinstance(posting, int):
+        return posting & ~_bitmap(removed) | _bitmap(added)
+    removed = set(removed)
+    ids = [recipe_id for recipe_id in posting or () if recipe_id not in removed]
+    return _posting(ids + list(added))
+
+
+class PantryIndex:
+    """Инвертированный индекс ингредиент → битовая карта id рецептов.
+
+    Индекс живёт в памяти каждого процесса. Полностью его строит команда
+    `rebuild_pantry_index` и сохраняет в `PANTRY_INDEX_PATH`; процесс
+    читает файл при прогреве, а новую версию — в фоновом потоке. Изменения
+    рецептов подтягиваются точечно по `Recipe.updated_at` и сигналам не
+    чаще `PANTRY_INDEX_SYNC_INTERVAL` секунд; пока один поток обновляет
+    индекс, остальные отвечают по текущему.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.data = None
+        self.synced_at = 0.0
+        self.snapshot_mtime = None
+        self.loading = False
+        self.pending = set()
+        # Рецепты, обновлённые после загрузки снимка: новый снимок мог
+        # быть собран раньше их изменений
+        self.touched = set()
+
+    def snapshot_changed(self):
+        try:
+            mtime = os.stat(settings.PANTRY_INDEX_PATH).st_mtime
+        except FileNotFoundError:
+            return None
+        return mtime if mtime != self.snapshot_mtime else None
+
+    def read_snapshot(self):
+        mtime = self.snapshot_changed()
+        if mtime is None:
+            return None, None
+        with open(settings.PANTRY_INDEX_PATH, "rb") as file:
+            return pickle.load(file), mtime
+
+    def load(self):
+        """Загружает снимок, а если его нет — строит индекс по БД."""
+        with self.lock:
+            if self.data is not None:
+                return
+            data, mtime = self.read_snapshot()
+            self.data = data or PantryData.build()
+            self.snapshot_mtime = mtime
+            self.touched = set()
+            self.sync()
+
+    def reload_in_background(self):
+        def target():
+            try:
+                data, mtime = self.read_snapshot()
+                if data is None:
+                    return
+                with self.lock:
+                    data.apply(self.touched)
+                    self.data = data
+                    self.snapshot_mtime = mtime
+                    self.touched = set()
+                    self.sync()
+            finally:
+                self.loading = False
+                connections.close_all()
+
+        self.loading = True
+        threading.Thread(target=target, daemon=True).start()
+
+    def sync(self):
+        with self.pending_lock:
+            pending, self.pending = self.pending, set()
+        try:
+            self.synced_at = time.monotonic()
+            data = self.data
+            changed = Recipe.objects.all()
+            if data.watermark is not None:
+                changed = changed.filter(updated_at__gte=data.watermark - SYNC_OVERLAP)
+            changed = list(changed.values_list("id", "updated_at"))
+            recipe_ids = pending.union(recipe_id for recipe_id, _ in changed)
+            if recipe_ids:
+                data.apply(recipe_ids)
+                self.touched |= recipe_ids
+        except Exception:
+            with self.pending_lock:
+                self.pending |= pending
+            raise
+        if changed:
+            data.watermark = max(
+                [updated_at for _, updated_at in changed]
+                + ([data.watermark] if data.watermark else [])
+            )
+
+    def ensure_fresh(self):
+        if self.data is None:
+            # Без прогрева (runserver) индекс загружается при первом запросе
+            self.load()
+            return
+        if time.monotonic() - self.synced_at > settings.PANTRY_INDEX_SYNC_INTERVAL:
+            if not self.loading and self.snapshot_changed() is not None:
+                self.reload_in_background()
+        elif not self.pending:
+            return
+        if self.lock.acquire(blocking=False):
+            try:
+                self.sync()
+            finally:
+                self.lock.release()
+
+    def invalidate(self, recipe_id):
+        with self.pending_lock:
+            self.pending.add(recipe_id)
+
+    def match(self, ingredient_ids, max_missing=0):
+        """Рецепты, для которых не хватает не более `max_missing` ингредиентов."""
+        self.ensure_fresh()
+        data = self.data
+        postings, sizes = data.postings, data.sizes
+        slices = []
+        for ingredient_id in set(ingredient_ids):
+            posting = postings.get(ingredient_id)
+            if posting:
+                _add_to_counter(slices, _as_bitmap(posting))
+        levels = [0] * (max_missing + 1)
+        matched = 0
+        for bits in slices:
+            matched |= bits
+        for hits in range(1, (1 << len(slices))):
+            exact = matched
+            for position, bits in enumerate(slices):
+                exact &= bits if hits >> position & 1 else ~bits
+                if not exact:
+                    break
+            if not exact:
+                continue
+            for missing in range(max_missing + 1):
+                size_bitmap = sizes.get(hits + missing)
+                if size_bitmap:
+                    levels[missing] |= exact & size_bitmap
+        return PantryMatches(enumerate(levels))
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,126 @@
+import time
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from jobs.queue import enqueue
+from recipes.facets import recipe_facets
+from recipes.feed import on_follow, on_unfollow
+from recipes.caches import ingredient_catalog, recipe_representations, short_links
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
+from recipes.pantry import pantry_index
+from recipes.tasks import backfill_inbox, delete_recipe_image, fan_out_recipe
+from recipes.trending import record_event, retract_event
+from users.models import Follow, User
+from users.tasks import delete_avatar
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe_pantry(sender, instance, **kwargs):
+    # После фиксации: иначе индекс может перечитать ещё старые строки
+    transaction.on_commit(partial(pantry_index.invalidate, instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_short_link(sender, instance, **kwargs):
+    short_links.discard(instance.short_uuid)
+
+
+@receiver(post_delete, sender=Recipe)
+def enqueue_image_cleanup(sender, instance, **kwargs):
+    if instance.image:
+        enqueue(delete_recipe_image, name=instance.image.name, requested_at=time.time())
+
+
+@receiver(post_delete, sender=User)
+def enqueue_avatar_cleanup(sender, instance, **kwargs):
+    if instance.avatar:
+        enqueue(delete_avatar, name=instance.avatar.name, requested_at=time.time())
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_catalog(sender, **kwargs):
+    ingredient_catalog.invalidate()
+    transaction.on_commit(recipe_representations.bump_ingredients)
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def invalidate_ingredient_pantry(sender, instance, **kwargs):
+    transaction.on_commit(partial(pantry_index.invalidate, instance.recipe_id))
+    transaction.on_commit(
+        partial(recipe_representations.bump_recipe, instance.recipe_id)
+    )
+
+
+# Версии меняются после фиксации: иначе параллельный читатель успел бы
+# положить в кеш старые строки уже под новой версией
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe_representation(sender, instance, **kwargs):
+    transaction.on_commit(partial(recipe_representations.bump_recipe, instance.pk))
+
+
+# Изменения рецептов сбрасывают счётчики один раз на запись рецепта
+# (RecipeSerializer, RecipeAdmin, delete_recipes), а не на каждую строку
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_recipe_facets(sender, **kwargs):
+    transaction.on_commit(recipe_facets.bump_catalog)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(sender, instance, update_fields=None, **kwargs):
+    # Вход (djoser, админка) обновляет только last_login — автора в JSON
+    # рецептов это не меняет
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    transaction.on_commit(partial(recipe_representations.bump_user, instance.pk))
+
+
+@receiver(post_save, sender=Recipe)
+def enqueue_fan_out(sender, instance, created, **kwargs):
+    if created:
+        enqueue(fan_out_recipe, recipe_id=instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created and on_follow(instance):
+        enqueue(
+            backfill_inbox,
+            user_id=instance.follower_id,
+            author_id=instance.following_id,
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed(sender, instance, **kwargs):
+    if on_unfollow(instance):
+        enqueue(backfill_inbox, user_id=instance.follower_id)
+
+
+@receiver(post_save, sender=Favorite)
+def count_favorite(sender, instance, created, **kwargs):
+    if created:
+        record_event(instance.recipe_id, "favorites", instance.created_at)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def count_shopping_cart(sender, instance, created, **kwargs):
+    if created:
+        record_event(instance.recipe_id, "carts", instance.created_at)
+
+
+@receiver(post_delete, sender=Favorite)
+def uncount_favorite(sender, instance, **kwargs):
+    retract_event(instance.recipe_id, "favorites", instance.created_at)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def uncount_shopping_cart(sender, instance, **kwargs):
+    retract_event(instance.recipe_id, "carts", instance.created_at)
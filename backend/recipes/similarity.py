@@ -0,0 +1,255 @@
+import heapq
+import math
+from array import array
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+
+SIMILAR_RECIPES_LIMIT = 20
+CANDIDATES_FACTOR = 4
+# Ингредиенты из верхних 5% по частоте и любые, встречающиеся чаще
+# MAX_POSTING_LENGTH раз, не участвуют в подборе кандидатов
+FREQUENT_PERCENTILE = 0.95
+MAX_POSTING_LENGTH = 5000
+BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 10000
+
+
+class IngredientMatrix:
+    """Разреженная матрица рецепт × ингредиент с idf-весами ингредиентов.
+
+    В памяти только столбцы: для редких ингредиентов — массивы рецептов,
+    по ним подбираются кандидаты; для частых (соль, вода) — битовые маски,
+    они учитываются лишь в итоговой оценке. Строки не хранятся:
+    ингредиенты рассчитываемых рецептов читаются из БД пачками.
+    """
+
+    def __init__(self, frequencies, pairs, total, max_recipe_id):
+        """`frequencies` — {ингредиент: число рецептов}.
+
+        `pairs` — пары (рецепт, ингредиент) по возрастанию рецепта и
+        ингредиента; их можно читать из БД потоком. Пары рецептов и
+        ингредиентов, появившихся после подсчёта `frequencies` и
+        `max_recipe_id`, пропускаются.
+        """
+        total = total or 1
+        self.weights = {
+            ingredient_id: math.log(1 + total / count)
+            for ingredient_id, count in frequencies.items()
+        }
+        counts = sorted(frequencies.values())
+        cutoff = MAX_POSTING_LENGTH
+        if counts:
+            cutoff = min(cutoff, counts[int((len(counts) - 1) * FREQUENT_PERCENTILE)])
+        self.columns = {}
+        self.frequent = {}
+        for ingredient_id, count in frequencies.items():
+            if count <= cutoff:
+                self.columns[ingredient_id] = array("q")
+            else:
+                self.frequent[ingredient_id] = bytearray(max_recipe_id // 8 + 1)
+        self.norms = array("d", [0.0]) * (max_recipe_id + 1)
+        previous = None
+        for pair in pairs:
+            # Пары упорядочены, повторы ингредиента в рецепте идут подряд
+            if pair == previous:
+                continue
+            previous = recipe_id, ingredient_id = pair
+            if recipe_id > max_recipe_id or ingredient_id not in self.weights:
+                continue
+            self.norms[recipe_id] += self.weights[ingredient_id]
+            column = self.columns.get(ingredient_id)
+            if column is not None:
+                column.append(recipe_id)
+            else:
+                self.frequent[ingredient_id][recipe_id >> 3] |= 1 << (recipe_id & 7)
+
+    def neighbors(self, recipe_id, ingredients, limit):
+        """Возвращает до `limit` пар (сходство, id) по взвешенному Жаккару.
+
+        `ingredients` — множество ингредиентов рецепта `recipe_id`. Норма
+        рецепта считается по нему, а не по матрице: состав мог измениться
+        после её загрузки.
+        """
+        overlap = defaultdict(float)
+        frequent = []
+        for ingredient_id in ingredients:
+            column = self.columns.get(ingredient_id)
+            if column is None:
+                if ingredient_id in self.frequent:
+                    frequent.append(ingredient_id)
+                continue
+            weight = self.weights[ingredient_id]
+            for other_id in column:
+                overlap[other_id] += weight
+        overlap.pop(recipe_id, None)
+        candidates = heapq.nlargest(
+            limit * CANDIDATES_FACTOR, overlap, key=overlap.__getitem__
+        )
+        norm = sum(self.weights.get(ingredient_id, 0) for ingredient_id in ingredients)
+        scored = []
+        for other_id in candidates:
+            # Общий вес редких ингредиентов уже посчитан, частые — по маскам
+            shared = overlap[other_id] + sum(
+                self.weights[ingredient_id]
+                for ingredient_id in frequent
+                if self.frequent[ingredient_id][other_id >> 3] >> (other_id & 7) & 1
+            )
+            scored.append((shared / (norm + self.norms[other_id] - shared), other_id))
+        return heapq.nlargest(limit, scored)
+
+
+def load_matrix():
+    """Строит матрицу по одному снимку БД.
+
+    Частоты, число рецептов и пары читаются в одной транзакции; в
+    PostgreSQL — с уровнем REPEATABLE READ, чтобы рецепты, созданные во
+    время чтения, не попали в пары без частот.
+    """
+    # Уровень изоляции задаётся только первым запросом внешней транзакции
+    snapshot = connection.vendor == "postgresql" and not connection.in_atomic_block
+    with transaction.atomic():
+        if snapshot:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        return IngredientMatrix(
+            dict(
+                RecipeIngredient.objects.values("ingredient_id")
+                .annotate(count=Count("recipe_id", distinct=True))
+                .values_list("ingredient_id", "count")
+            ),
+            RecipeIngredient.objects.order_by("recipe_id", "ingredient_id")
+            .values_list("recipe_id", "ingredient_id")
+            .iterator(chunk_size=READ_CHUNK_SIZE),
+            total=Recipe.objects.count(),
+            max_recipe_id=Recipe.objects.aggregate(Max("id"))["id__max"] or 0,
+        )
+
+
+def _ingredient_sets(recipe_ids):
+    rows = defaultdict(set)
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list("recipe_id", "ingredient_id"):
+        rows[recipe_id].add(ingredient_id)
+    return rows
+
+
+def _save_neighbors(results, computed_at):
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=list(results)).delete()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(
+                recipe_id=recipe_id,
+                similar_id=similar_id,
+                score=score,
+                computed_at=computed_at,
+            )
+            for recipe_id, neighbors in results.items()
+            for score, similar_id in neighbors
+        )
+
+
+def _merge_reverse(changed, reverse, limit, computed_at, batch_size):
+    """Встраивает новые пары в списки рецептов, которые не менялись.
+
+    Сходство симметрично, поэтому пересчёт изменённого рецепта даёт и его
+    место в чужих топах. Списки могут стать короче `limit`, если
+    изменённый рецепт выпал из них; это исправляет полный пересчёт.
+    """
+    recipe_ids = list(reverse)
+    for start in range(0, len(recipe_ids), batch_size):
+        chunk = recipe_ids[start : start + batch_size]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(
+                recipe_id__in=chunk, similar_id__in=changed
+            ).delete()
+            current = defaultdict(list)
+            for row_id, recipe_id, similar_id, score in SimilarRecipe.objects.filter(
+                recipe_id__in=chunk
+            ).values_list("id", "recipe_id", "similar_id", "score"):
+                current[recipe_id].append((score, similar_id, row_id))
+            stale_ids = []
+            new_rows = []
+            for recipe_id in chunk:
+                merged = heapq.nlargest(
+                    limit,
+                    current[recipe_id]
+                    + [
+                        (score, similar_id, None)
+                        for score, similar_id in reverse[recipe_id]
+                    ],
+                )
+                kept = {row_id for _, _, row_id in merged}
+                stale_ids.extend(
+                    row_id for _, _, row_id in current[recipe_id] if row_id not in kept
+                )
+                new_rows.extend(
+                    SimilarRecipe(
+                        recipe_id=recipe_id,
+                        similar_id=similar_id,
+                        score=score,
+                        computed_at=computed_at,
+                    )
+                    for score, similar_id, row_id in merged
+                    if row_id is None
+                )
+            SimilarRecipe.objects.filter(id__in=stale_ids).delete()
+            SimilarRecipe.objects.bulk_create(new_rows)
+
+
+def rebuild_similar_recipes(
+    full=False, limit=SIMILAR_RECIPES_LIMIT, batch_size=BATCH_SIZE
+):
+    """Пересчитывает списки похожих рецептов и возвращает число обработанных.
+
+    Без `full` пересчитываются только рецепты, изменённые после прошлого
+    запуска; дата запуска берётся из `SimilarRecipe.computed_at`.
+    """
+    computed_at = timezone.now()
+    last_run = None
+    if not full:
+        last_run = SimilarRecipe.objects.aggregate(Max("computed_at"))[
+            "computed_at__max"
+        ]
+    matrix = load_matrix()
+    if last_run is None:
+        changed = list(
+            Recipe.objects.order_by("id")
+            .values_list("id", flat=True)
+            .iterator(chunk_size=READ_CHUNK_SIZE)
+        )
+    else:
+        changed = list(
+            Recipe.objects.filter(updated_at__gte=last_run).values_list("id", flat=True)
+        )
+    changed_ids = set(changed)
+    reverse = defaultdict(list)
+    for start in range(0, len(changed), batch_size):
+        chunk = changed[start : start + batch_size]
+        ingredients = _ingredient_sets(chunk)
+        results = {
+            recipe_id: matrix.neighbors(recipe_id, ingredients[recipe_id], limit)
+            for recipe_id in chunk
+        }
+        _save_neighbors(results, computed_at)
+        if last_run is None:
+            continue
+        for recipe_id, neighbors in results.items():
+            for score, similar_id in neighbors:
+                if similar_id not in changed_ids:
+                    reverse[similar_id].append((score, recipe_id))
+    if last_run is not None and changed:
+        for recipe_id in (
+            SimilarRecipe.objects.filter(similar_id__in=changed)
+            .exclude(recipe_id__in=changed)
+            .values_list("recipe_id", flat=True)
+            .distinct()
+        ):
+            reverse.setdefault(recipe_id, [])
+        _merge_reverse(changed, reverse, limit, computed_at, batch_size)
+    return len(changed)
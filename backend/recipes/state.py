@@ -0,0 +1,83 @@
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+
+class RecipeState:
+    """Что зависит от зрителя: избранное, корзина и подписки на авторов."""
+
+    def __init__(self, favorited=(), in_shopping_cart=(), subscribed=()):
+        self.favorited = set(favorited)
+        self.in_shopping_cart = set(in_shopping_cart)
+        self.subscribed = set(subscribed)
+
+
+def user_recipe_state(user, recipes):
+    """Состояние рецептов `recipes` для пользователя `user` пачкой.
+
+    Не больше трёх запросов на страницу. Если выборка уже посчитала флаги
+    аннотациями (`RecipeViewSet.with_fields`), запросов нет вовсе.
+    """
+    if user is None or not user.is_authenticated or not recipes:
+        return RecipeState()
+    recipe_ids = [recipe.id for recipe in recipes]
+    author_ids = {recipe.author_id for recipe in recipes}
+    if all(hasattr(recipe, "is_favorited") for recipe in recipes):
+        favorited = [recipe.id for recipe in recipes if recipe.is_favorited]
+    else:
+        favorited = Favorite.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list("recipe_id", flat=True)
+    if all(hasattr(recipe, "is_in_shopping_cart") for recipe in recipes):
+        in_shopping_cart = [
+            recipe.id for recipe in recipes if recipe.is_in_shopping_cart
+        ]
+    else:
+        in_shopping_cart = ShoppingCart.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list("recipe_id", flat=True)
+    if all(hasattr(recipe, "author_is_subscribed") for recipe in recipes):
+        subscribed = [
+            recipe.author_id for recipe in recipes if recipe.author_is_subscribed
+        ]
+    else:
+        subscribed = Follow.objects.filter(
+            follower=user, following_id__in=author_ids
+        ).values_list("following_id", flat=True)
+    return RecipeState(favorited, in_shopping_cart, subscribed)
+
+
+def recipe_state_by_ids(request, recipe_ids):
+    """Флаги зрителя по id рецептов: три запроса на любое число id.
+
+    Подписка на автора ищется соединением `Follow` с рецептами, поэтому
+    сами рецепты не загружаются; у несуществующих id все флаги ложны.
+    Результат запоминается на время запроса, и повторный вызов ходит в БД
+    только за новыми id. Возвращает `{id: (в избранном, в корзине,
+    подписан на автора)}`.
+    """
+    memo = getattr(request, "recipe_state", None)
+    if memo is None:
+        memo = request.recipe_state = {}
+    user = request.user
+    new_ids = [recipe_id for recipe_id in recipe_ids if recipe_id not in memo]
+    if new_ids and user.is_authenticated:
+        state = RecipeState(
+            Favorite.objects.filter(user=user, recipe_id__in=new_ids).values_list(
+                "recipe_id", flat=True
+            ),
+            ShoppingCart.objects.filter(user=user, recipe_id__in=new_ids).values_list(
+                "recipe_id", flat=True
+            ),
+            Follow.objects.filter(
+                follower=user, following__recipes__id__in=new_ids
+            ).values_list("following__recipes__id", flat=True),
+        )
+    else:
+        state = RecipeState()
+    for recipe_id in new_ids:
+        memo[recipe_id] = (
+            recipe_id in state.favorited,
+            recipe_id in state.in_shopping_cart,
+            recipe_id in state.subscribed,
+        )
+    return {recipe_id: memo[recipe_id] for recipe_id in recipe_ids}
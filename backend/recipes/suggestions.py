@@ -0,0 +1,130 @@
+import heapq
+import math
+import multiprocessing
+from collections import Counter, defaultdict
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from recipes.models import Favorite
+from users.models import AuthorSuggestion, Follow
+
+AUTHOR_SUGGESTIONS_LIMIT = 20
+FAVORITE_WEIGHT = 0.5
+BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 10000
+
+# Граф для процессов-обработчиков: наследуется при fork, а не передаётся
+_graph = None
+
+
+class FollowGraph:
+    """Разреженные матрицы подписок F (пользователь × автор) и избранного.
+
+    Строка произведения F·F для пользователя — авторы, на которых подписаны
+    те, на кого подписан он сам. Вклад подписки делится на log её числа
+    подписок, чтобы подписчики всех подряд не забивали рекомендации.
+    К оценке прибавляется вес авторов рецептов из избранного пользователя.
+    """
+
+    def __init__(self, follows, favorites):
+        self.follows = defaultdict(set)
+        for follower_id, author_id in follows:
+            self.follows[follower_id].add(author_id)
+        self.favorite_authors = defaultdict(Counter)
+        for user_id, author_id in favorites:
+            self.favorite_authors[user_id][author_id] += 1
+        self.weights = {
+            user_id: 1 / math.log2(2 + len(authors))
+            for user_id, authors in self.follows.items()
+        }
+
+    def users(self):
+        return sorted(self.follows.keys() | self.favorite_authors.keys())
+
+    def suggestions(self, user_id, limit):
+        """До `limit` пар (оценка, id автора) без уже отслеживаемых авторов."""
+        followed = self.follows.get(user_id, set())
+        scores = defaultdict(float)
+        for friend_id in followed:
+            weight = self.weights.get(friend_id)
+            if weight is None:
+                # Автор, который сам ни на кого не подписан
+                continue
+            for author_id in self.follows[friend_id]:
+                scores[author_id] += weight
+        for author_id, count in self.favorite_authors.get(user_id, {}).items():
+            scores[author_id] += FAVORITE_WEIGHT * math.log1p(count)
+        scores.pop(user_id, None)
+        for author_id in followed:
+            scores.pop(author_id, None)
+        return heapq.nlargest(
+            limit, ((score, author) for author, score in scores.items())
+        )
+
+
+def _suggest_batch(task):
+    user_ids, limit = task
+    return {user_id: _graph.suggestions(user_id, limit) for user_id in user_ids}
+
+
+def _save_batch(results, computed_at):
+    with transaction.atomic():
+        AuthorSuggestion.objects.filter(user_id__in=list(results)).delete()
+        AuthorSuggestion.objects.bulk_create(
+            AuthorSuggestion(
+                user_id=user_id,
+                author_id=author_id,
+                score=score,
+                computed_at=computed_at,
+            )
+            for user_id, suggestions in results.items()
+            for score, author_id in suggestions
+        )
+
+
+def rebuild_author_suggestions(
+    limit=AUTHOR_SUGGESTIONS_LIMIT, batch_size=BATCH_SIZE, workers=1
+):
+    """Пересчитывает рекомендации всех пользователей, возвращает их число.
+
+    Граф читается из БД один раз, строки произведения считаются пачками
+    пользователей в `workers` процессах, а записывает их родительский
+    процесс — каждая пачка в своей транзакции.
+    """
+    global _graph
+    computed_at = timezone.now()
+    _graph = FollowGraph(
+        Follow.objects.values_list("follower_id", "following_id").iterator(
+            chunk_size=READ_CHUNK_SIZE
+        ),
+        Favorite.objects.values_list("user_id", "recipe__author_id").iterator(
+            chunk_size=READ_CHUNK_SIZE
+        ),
+    )
+    user_ids = _graph.users()
+    tasks = [
+        (user_ids[start : start + batch_size], limit)
+        for start in range(0, len(user_ids), batch_size)
+    ]
+    pool = None
+    if workers > 1:
+        # Дочерним процессам соединения с БД не нужны и не должны достаться
+        connections.close_all()
+        pool = multiprocessing.get_context("fork").Pool(workers)
+    try:
+        batches = (
+            pool.imap_unordered(_suggest_batch, tasks)
+            if pool is not None
+            else map(_suggest_batch, tasks)
+        )
+        for results in batches:
+            _save_batch(results, computed_at)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _graph = None
+    # Пользователи, у которых не осталось ни подписок, ни избранного
+    AuthorSuggestion.objects.filter(computed_at__lt=computed_at).delete()
+    return len(user_ids)
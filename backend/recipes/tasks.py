@@ -0,0 +1,24 @@
+from foodgram.storage import delete_unused
+from jobs.queue import task
+from recipes import feed
+from recipes.models import Recipe
+
+
+@task()
+def fan_out_recipe(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is not None:
+        feed.fan_out(recipe)
+
+
+@task()
+def backfill_inbox(user_id, author_id=None):
+    feed.backfill_history(user_id, author_id)
+
+
+@task()
+def delete_recipe_image(name, requested_at=None):
+    # Как и аватары, одинаковые картинки рецептов хранятся один раз
+    delete_unused(
+        name, Recipe.objects.filter(image=name).exists, requested_at=requested_at
+    )
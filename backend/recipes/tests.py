@@ -1 +1,791 @@
-# Create your tests here.
+import gzip
+import io
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import update_last_login
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q, QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from jobs.models import Job
+from jobs.queue import claim, execute
+from recipes.caches import recipe_representations
+from recipes import facets
+from recipes.facets import recipe_facets
+from recipes.feed import feed_queryset, followers_switching_to_inbox
+from recipes.management.commands.check_query_plans import endpoint_plans, seq_scans
+from recipes.models import (
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    Recipe,
+    RecipeActivity,
+    RecipeIngredient,
+    ShoppingCart,
+    SimilarRecipe,
+)
+from recipes.pantry import PantryData, PantryIndex
+from recipes.similarity import IngredientMatrix, _merge_reverse
+from recipes.suggestions import FollowGraph, rebuild_author_suggestions
+from recipes.trending import (
+    compact_activity,
+    hour_of,
+    rebuild_activity,
+    trending_scores,
+)
+from rest_framework.test import APIClient
+from users.models import AuthorSuggestion, Follow, User
+
+# Для списка без фильтров в PostgreSQL пагинатор сначала смотрит pg_class
+ESTIMATE_QUERIES = 1 if connection.vendor == "postgresql" else 0
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN проверяется в PostgreSQL")
+class QueryPlanTests(TestCase):
+    """Запросы эндпоинтов и счётчики пагинатора читают таблицы по индексам.
+
+    В тестовой БД таблицы крошечные, поэтому последовательное сканирование
+    запрещается: планировщик выбирает его, только если подходящего индекса
+    нет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="password"
+        )
+        cls.author = User.objects.create_user(
+            username="author", email="author@example.com", password="password"
+        )
+        ingredient = Ingredient.objects.create(name="молоко", measurement_unit="мл")
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name="Каша", text="Сварить", cooking_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=ingredient, amount=200
+        )
+        Follow.objects.create(follower=cls.user, following=cls.author)
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+        FeedEntry.objects.get_or_create(
+            user=cls.user, author=cls.author, recipe=cls.recipe
+        )
+
+    def test_endpoint_queries_use_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for name, sql, plan in endpoint_plans(self.user, self.author, self.recipe):
+            with self.subTest(name, sql=sql):
+                self.assertEqual(seq_scans(plan), [], plan)
+
+
+class AdminChangelistQueryTests(TestCase):
+    """Число запросов списков админки не зависит от числа строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="password"
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент {number}", measurement_unit="г")
+            for number in range(3)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = Recipe.objects.count()
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=self.admin,
+                name=f"рецепт {number}",
+                text="текст",
+                cooking_time=10,
+            )
+            for number in range(start, start + count)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes
+            for ingredient in self.ingredients
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=self.admin, recipe=recipe) for recipe in recipes
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=self.admin, recipe=recipe) for recipe in recipes
+        )
+        now = timezone.now()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(recipe=recipe, similar=recipes[0], score=1, computed_at=now)
+            for recipe in recipes[1:]
+        )
+
+    def assert_changelist_queries(self, url, queries):
+        for count in (3, 30):
+            self.add_rows(count)
+            with self.subTest(rows=count), self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_recipe_changelist(self):
+        self.assert_changelist_queries("/admin/recipes/recipe/", 4 + ESTIMATE_QUERIES)
+
+    def test_recipe_search(self):
+        self.assert_changelist_queries("/admin/recipes/recipe/?q=рецепт", 4)
+
+    def test_favorite_changelist(self):
+        self.assert_changelist_queries("/admin/recipes/favorite/", 4 + ESTIMATE_QUERIES)
+
+    def test_shopping_cart_changelist(self):
+        self.assert_changelist_queries(
+            "/admin/recipes/shoppingcart/", 4 + ESTIMATE_QUERIES
+        )
+
+    def test_similar_recipe_changelist(self):
+        self.assert_changelist_queries(
+            "/admin/recipes/similarrecipe/", 4 + ESTIMATE_QUERIES
+        )
+
+
+def file_cache(directory):
+    return {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "recipes": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": directory,
+        },
+        "throttle": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+
+
+class RecipeCacheSettingsTests(SimpleTestCase):
+    def test_disabled_with_process_local_cache(self):
+        self.assertFalse(recipe_representations.enabled)
+
+    def test_enabled_with_shared_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(CACHES=file_cache(directory)):
+                self.assertTrue(recipe_representations.enabled)
+                with override_settings(RECIPE_CACHE_TTL=0):
+                    self.assertFalse(recipe_representations.enabled)
+
+
+class RecipeCacheTests(TestCase):
+    """Кеш JSON рецептов на общем бэкенде сбрасывается при изменениях."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(CACHES=file_cache(directory.name))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="password"
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name="Каша", text="Сварить", cooking_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.recipe,
+            ingredient=Ingredient.objects.create(name="овсянка", measurement_unit="г"),
+            amount=100,
+        )
+
+    def names(self):
+        return [
+            recipe["name"]
+            for recipe in self.client.get("/api/recipes/").json()["results"]
+        ]
+
+    def test_changed_recipe_is_not_served_from_cache(self):
+        self.assertEqual(self.names(), ["Каша"])
+        Recipe.objects.filter(pk=self.recipe.pk).update(name="Суп")
+        # Без сигналов запись из кеша остаётся прежней
+        self.assertEqual(self.names(), ["Каша"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = "Суп"
+            self.recipe.save()
+        self.assertEqual(self.names(), ["Суп"])
+
+    def test_version_changes_after_commit(self):
+        self.assertEqual(self.names(), ["Каша"])
+        key = f"recipe-version:recipe:{self.recipe.pk}"
+        version = recipe_representations.cache.get(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.recipe.name = "Суп"
+                self.recipe.save()
+                # Читатель до фиксации видит прежнюю версию и прежние строки
+                self.assertEqual(recipe_representations.cache.get(key), version)
+        self.assertNotEqual(recipe_representations.cache.get(key), version)
+        self.assertEqual(self.names(), ["Суп"])
+
+    def test_login_does_not_bump_author(self):
+        with mock.patch.object(recipe_representations, "bump_user") as bump:
+            with self.captureOnCommitCallbacks(execute=True):
+                update_last_login(None, self.author)
+            bump.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.author.first_name = "Повар"
+                self.author.save()
+            bump.assert_called_once_with(self.author.pk)
+
+
+class RecipeFacetCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            CACHES=file_cache(directory.name), FACET_CACHE_MIN_HITS=1
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="password"
+        )
+        self.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент {number}", measurement_unit="г")
+            for number in range(5)
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name="Каша", text="Сварить", cooking_time=10
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=self.recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def facets(self, query=""):
+        response = self.client.get(f"/api/recipes/?facets=1{query}")
+        return {
+            row["range"]: row["count"]
+            for row in response.json()["facets"]["cooking_time"]
+        }
+
+    def update(self, cooking_time, ingredients=None):
+        payload = {
+            "cooking_time": cooking_time,
+            "ingredients": [
+                {"id": ingredient.id, "amount": 2}
+                for ingredient in ingredients or self.ingredients
+            ],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/recipes/{self.recipe.id}/", payload, format="json"
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_recipe_write_bumps_version_once(self):
+        with mock.patch.object(recipe_facets, "bump", wraps=recipe_facets.bump) as bump:
+            self.update(40)
+        bump.assert_called_once()
+
+    def test_counts_follow_recipe_writes(self):
+        self.assertEqual(self.facets()["0-15"], 1)
+        self.update(40)
+        facets = self.facets()
+        self.assertEqual((facets["0-15"], facets["31-60"]), (0, 1))
+
+    def test_write_keeps_entries_of_other_authors(self):
+        other = User.objects.create_user(username="other", email="other@example.com")
+        self.facets(f"&author={other.pk}")
+        self.facets()
+        with mock.patch.object(
+            facets, "compute_facets", wraps=facets.compute_facets
+        ) as compute:
+            self.update(40)
+            self.facets(f"&author={other.pk}")
+            compute.assert_not_called()
+            self.facets()
+            compute.assert_called_once()
+
+    def test_entries_with_added_ingredient_are_refreshed(self):
+        spare = Ingredient.objects.create(name="соль", measurement_unit="г")
+        query = f"&ingredients={spare.pk}"
+        self.assertEqual(self.facets(query)["0-15"], 0)
+        self.update(10, [*self.ingredients, spare])
+        self.assertEqual(self.facets(query)["0-15"], 1)
+        self.update(10)
+        self.assertEqual(self.facets(query)["0-15"], 0)
+
+
+@override_settings(PANTRY_INDEX_SYNC_INTERVAL=3600)
+class PantryIndexTests(TestCase):
+    """Индекс продуктов против прямого перебора разностей множеств."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username="author", email="a@example.com")
+        cls.ingredients = [
+            ingredient.pk
+            for ingredient in Ingredient.objects.bulk_create(
+                Ingredient(name=f"ингредиент {number}", measurement_unit="г")
+                for number in range(20)
+            )
+        ]
+        # Плотные id дают битовые карты, разреженные — массивы id
+        recipe_ids = list(range(1, 41)) + [500 + 37 * number for number in range(20)]
+        Recipe.objects.bulk_create(
+            Recipe(
+                id=recipe_id,
+                author=author,
+                name=f"рецепт {recipe_id}",
+                text="-",
+                cooking_time=1,
+            )
+            for recipe_id in recipe_ids
+        )
+        generator = random.Random(42)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id, amount=1)
+            for recipe_id in recipe_ids
+            for ingredient_id in generator.sample(
+                cls.ingredients[: 6 if recipe_id > 40 else 20], generator.randint(1, 6)
+            )
+        )
+
+    def setUp(self):
+        self.index = PantryIndex()
+        self.index.data = PantryData.build()
+        self.index.synced_at = time.monotonic()
+        self.generator = random.Random(7)
+
+    def expected(self, pantry, max_missing):
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            "recipe_id", "ingredient_id"
+        ):
+            recipes[recipe_id].add(ingredient_id)
+        matches = [
+            (recipe_id, len(ingredients - pantry))
+            for recipe_id, ingredients in recipes.items()
+            if ingredients & pantry and len(ingredients - pantry) <= max_missing
+        ]
+        return sorted(matches, key=lambda match: (match[1], -match[0]))
+
+    def assert_matches_brute_force(self):
+        for _ in range(20):
+            pantry = set(
+                self.generator.sample(self.ingredients, self.generator.randint(1, 12))
+            )
+            for max_missing in (0, 2):
+                with self.subTest(pantry=sorted(pantry), max_missing=max_missing):
+                    expected = self.expected(pantry, max_missing)
+                    matches = self.index.match(pantry, max_missing)
+                    self.assertEqual(len(matches), len(expected))
+                    self.assertEqual(matches[:], expected)
+                    self.assertEqual(matches[3:9], expected[3:9])
+
+    def test_match(self):
+        postings = self.index.data.postings.values()
+        self.assertEqual({type(posting) for posting in postings}, {int, array})
+        self.assert_matches_brute_force()
+
+    def test_apply_after_ingredient_added(self):
+        present = set(
+            RecipeIngredient.objects.filter(recipe_id=3).values_list(
+                "ingredient_id", flat=True
+            )
+        )
+        ingredient_id = next(pk for pk in self.ingredients if pk not in present)
+        RecipeIngredient.objects.create(
+            recipe_id=3, ingredient_id=ingredient_id, amount=1
+        )
+        self.index.data.apply({3})
+        self.assert_matches_brute_force()
+
+    def test_apply_after_ingredient_removed(self):
+        for recipe_id in (3, 537):
+            RecipeIngredient.objects.filter(recipe_id=recipe_id).first().delete()
+        self.index.data.apply({3, 537})
+        self.assert_matches_brute_force()
+
+    def test_apply_after_recipe_deleted(self):
+        Recipe.objects.filter(id__in=[3, 537]).delete()
+        self.index.data.apply({3, 537})
+        self.assert_matches_brute_force()
+
+
+class SimilarRecipeTests(TestCase):
+    def matrix(self, pairs):
+        # Рецепты: 1 — {a, b}, 2 — {a, b, c}, 3 — {a}, 4 — {c, d}
+        return IngredientMatrix(
+            {"a": 3, "b": 2, "c": 2, "d": 1}, pairs, total=4, max_recipe_id=4
+        )
+
+    def test_neighbors_match_hand_computed_scores(self):
+        pairs = [
+            (1, "a"), (1, "b"), (2, "a"), (2, "b"), (2, "c"),
+            (3, "a"), (4, "c"), (4, "d"),
+        ]  # fmt: skip
+        matrix = self.matrix(pairs)
+        a, b, d = math.log(1 + 4 / 3), math.log(3), math.log(5)
+        # a входит в 95-й перцентиль частот: кандидатов не даёт, но в
+        # оценке учитывается, поэтому 3 не попадает в кандидаты 1
+        [(score, recipe_id)] = matrix.neighbors(1, {"a", "b"}, 10)
+        self.assertEqual(recipe_id, 2)
+        self.assertAlmostEqual(score, (a + b) / (a + 2 * b))
+        ranking = matrix.neighbors(2, {"a", "b", "c"}, 10)
+        self.assertEqual([recipe_id for _, recipe_id in ranking], [1, 4])
+        self.assertAlmostEqual(ranking[0][0], (a + b) / (a + 2 * b))
+        self.assertAlmostEqual(ranking[1][0], b / (a + 2 * b + d))
+        self.assertEqual(matrix.neighbors(2, {"a", "b", "c"}, 1), ranking[:1])
+
+    def test_rows_added_while_loading_are_skipped(self):
+        # Рецепт 5 и ингредиент e появились после подсчёта частот
+        matrix = self.matrix([(1, "a"), (1, "b"), (1, "e"), (2, "b"), (5, "b")])
+        # Без пропуска — IndexError в нормах и KeyError в весах
+        self.assertEqual(matrix.neighbors(5, {"b", "e"}, 10)[0], (1.0, 2))
+
+    def test_merge_reverse_keeps_top_scores(self):
+        author = User.objects.create_user(username="author", email="a@example.com")
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f"рецепт {number}", text="-", cooking_time=1)
+            for number in range(5)
+        )
+        target, kept, dropped, changed, new = (recipe.pk for recipe in recipes)
+        now = timezone.now()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(
+                recipe_id=target, similar_id=similar, score=score, computed_at=now
+            )
+            for score, similar in ((0.9, kept), (0.5, dropped), (0.8, changed))
+        )
+        # changed пересчитан: его сходство с target упало, new поднялся выше
+        _merge_reverse(
+            [changed, new],
+            {target: [(0.3, changed), (0.7, new)]},
+            limit=2,
+            computed_at=now,
+            batch_size=10,
+        )
+        self.assertEqual(
+            list(
+                SimilarRecipe.objects.filter(recipe_id=target)
+                .order_by("-score")
+                .values_list("similar_id", "score")
+            ),
+            [(kept, 0.9), (new, 0.7)],
+        )
+
+
+@override_settings(SHOPPING_CART_RETENTION_DAYS=30)
+class PurgeShoppingCartsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="cook", email="c@example.com")
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.user, name=f"рецепт {number}", text="-", cooking_time=1)
+            for number in range(5)
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe) for recipe in recipes
+        )
+        cls.expired = sorted(cart.pk for cart in ShoppingCart.objects.all()[:3])
+        ShoppingCart.objects.filter(pk__in=cls.expired).update(
+            touched_at=timezone.now() - timedelta(days=31)
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def purge(self, *args):
+        output = io.StringIO()
+        call_command(
+            "purge_shopping_carts",
+            *args,
+            "--batch=2",
+            "--pause=0",
+            f"--archive-dir={self.directory}",
+            stdout=output,
+        )
+        return output.getvalue()
+
+    def archived_ids(self):
+        ids = []
+        for name in os.listdir(self.directory):
+            with gzip.open(os.path.join(self.directory, name), "rt") as file:
+                ids.extend(json.loads(line)["id"] for line in file)
+        return sorted(ids)
+
+    def test_expired_rows_are_archived_and_deleted(self):
+        self.assertIn("Удалено записей: 3", self.purge())
+        self.assertEqual(ShoppingCart.objects.count(), 2)
+        self.assertEqual(self.archived_ids(), self.expired)
+        self.assertIn("Удалено записей: 0", self.purge())
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_dry_run_and_disabled_retention(self):
+        self.assertIn("Будет удалено записей: 3", self.purge("--dry-run"))
+        self.assertIn("удалять нечего", self.purge("--days=0"))
+        self.assertEqual(ShoppingCart.objects.count(), 5)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_rolled_back_batch_is_not_archived(self):
+        with mock.patch.object(
+            QuerySet, "delete", side_effect=DatabaseError("сбой")
+        ), self.assertRaises(DatabaseError):
+            self.purge()
+        self.assertEqual(ShoppingCart.objects.count(), 5)
+        self.assertEqual(self.archived_ids(), [])
+
+
+class AuthorSuggestionTests(TestCase):
+    def test_followed_author_without_follows(self):
+        # 1 подписан на 2 и 3; 2 — на 4; 3 ни на кого не подписан
+        graph = FollowGraph([(1, 2), (1, 3), (2, 4)], [])
+        self.assertEqual([author for _, author in graph.suggestions(1, 10)], [4])
+        self.assertEqual(graph.suggestions(3, 10), [])
+
+    def test_rebuild(self):
+        users = [
+            User.objects.create_user(
+                username=f"user{number}", email=f"user{number}@example.com"
+            )
+            for number in range(4)
+        ]
+        Follow.objects.create(follower=users[0], following=users[1])
+        Follow.objects.create(follower=users[0], following=users[2])
+        Follow.objects.create(follower=users[1], following=users[3])
+        self.assertEqual(rebuild_author_suggestions(), 2)
+        self.assertEqual(
+            list(AuthorSuggestion.objects.values_list("user", "author")),
+            [(users[0].pk, users[3].pk)],
+        )
+
+
+class TrendingTests(TestCase):
+    NOW = datetime(2026, 1, 10, 12, 30, tzinfo=dt_timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="cook", email="c@example.com")
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.user, name=f"рецепт {number}", text="-", cooking_time=1)
+            for number in range(3)
+        )
+
+    def setUp(self):
+        self.hour = hour_of(self.NOW)
+        patcher = mock.patch("recipes.trending.timezone.now", return_value=self.NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def activity(self, recipe, hours_ago, span=RecipeActivity.HOUR, **counts):
+        return RecipeActivity.objects.create(
+            recipe=recipe, start_hour=self.hour - hours_ago, span=span, **counts
+        )
+
+    def rollup(self):
+        return sorted(
+            RecipeActivity.objects.filter(
+                Q(favorites__gt=0) | Q(carts__gt=0)
+            ).values_list("recipe_id", "span", "start_hour", "favorites", "carts")
+        )
+
+    def test_scores_decay_with_age(self):
+        first, second, _ = self.recipes
+        self.activity(first, 1, favorites=2)
+        self.activity(first, 36, span=RecipeActivity.DAY, carts=1)
+        self.activity(second, 13, favorites=1, carts=1)
+        # За пределами суток: часовой интервал до начала окна и сутки,
+        # закончившиеся раньше него
+        self.activity(second, 25, favorites=5)
+        self.activity(second, 60, span=RecipeActivity.DAY, favorites=5)
+
+        def decayed(age):
+            return 2 ** (-age / 6)
+
+        scores = {row["recipe_id"]: row["score"] for row in trending_scores("24h")}
+        self.assertEqual(set(scores), {first.pk, second.pk})
+        # Возраст интервала считается от его середины
+        self.assertAlmostEqual(scores[first.pk], 2 * decayed(0.5) + 2 * decayed(24))
+        self.assertAlmostEqual(scores[second.pk], 3 * decayed(12.5))
+        self.assertEqual(trending_scores("24h")[0]["recipe_id"], first.pk)
+        self.assertEqual(
+            {row["recipe_id"] for row in trending_scores("7d")}, {first.pk, second.pk}
+        )
+
+    def test_compact_sums_old_hours_into_days(self):
+        recipe = self.recipes[0]
+        # Полночь по UTC — 12 часов назад; граница свёртки — ещё двое суток назад
+        day = self.hour - 12 - 3 * RecipeActivity.DAY
+        self.activity(recipe, self.hour - day, span=RecipeActivity.DAY, favorites=1)
+        self.activity(recipe, self.hour - day - 2, favorites=2, carts=1)
+        self.activity(recipe, self.hour - day - 20, favorites=3)
+        self.activity(self.recipes[1], self.hour - day - 5, carts=4)
+        recent = self.activity(recipe, 50, favorites=7)
+
+        self.assertEqual(compact_activity(keep_hours=48), 3)
+        self.assertEqual(
+            self.rollup(),
+            sorted(
+                [
+                    (recipe.pk, RecipeActivity.DAY, day, 6, 1),
+                    (self.recipes[1].pk, RecipeActivity.DAY, day, 0, 4),
+                    (recipe.pk, RecipeActivity.HOUR, recent.start_hour, 7, 0),
+                ]
+            ),
+        )
+        self.assertEqual(compact_activity(keep_hours=48), 0)
+
+    def test_deleted_rows_are_retracted(self):
+        recipe = self.recipes[0]
+        Favorite.objects.create(user=self.user, recipe=recipe, created_at=self.NOW)
+        cart = ShoppingCart.objects.create(
+            user=self.user, recipe=recipe, created_at=self.NOW - timedelta(days=5)
+        )
+        compact_activity(keep_hours=48)
+        self.assertEqual(len(self.rollup()), 2)
+
+        Favorite.objects.filter(user=self.user).delete()
+        cart.delete()
+        self.assertEqual(self.rollup(), [])
+
+    def test_retract_matches_rebuild(self):
+        reader = User.objects.create_user(username="reader", email="r@example.com")
+        guest = User.objects.create_user(username="guest", email="g@example.com")
+        for days_ago, user in ((0, self.user), (0, reader), (4, guest)):
+            for recipe in self.recipes:
+                ShoppingCart.objects.create(
+                    user=user,
+                    recipe=recipe,
+                    created_at=self.NOW - timedelta(days=days_ago, hours=recipe.pk),
+                )
+        compact_activity(keep_hours=48)
+        ShoppingCart.objects.filter(user=guest, recipe=self.recipes[0]).delete()
+        ShoppingCart.objects.filter(user=self.user, recipe=self.recipes[1]).delete()
+        live = self.rollup()
+        rebuild_activity()
+        compact_activity(keep_hours=48)
+        self.assertEqual(live, self.rollup())
+
+    def test_retract_never_goes_below_zero(self):
+        recipe = self.recipes[0]
+        # bulk_create не шлёт сигналов: событие в сводку не попало
+        Favorite.objects.bulk_create(
+            [Favorite(user=self.user, recipe=recipe, created_at=self.NOW)]
+        )
+        self.activity(recipe, 0, carts=1)
+        Favorite.objects.filter(user=self.user).delete()
+        self.assertEqual(
+            list(RecipeActivity.objects.values_list("favorites", "carts")), [(0, 1)]
+        )
+
+
+@override_settings(FEED_INBOX_MAX_FOLLOWS=2, FEED_INBOX_BACKFILL=1)
+class FeedInboxTests(TestCase):
+    """Inbox ленты совпадает с лентой, собранной слиянием подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username="reader", email="r@example.com")
+        cls.authors = User.objects.bulk_create(
+            User(username=f"author{number}", email=f"a{number}@example.com")
+            for number in range(3)
+        )
+        for author in cls.authors:
+            for number in range(3):
+                Recipe.objects.create(
+                    author=author, name=f"рецепт {number}", text="-", cooking_time=1
+                )
+        Job.objects.all().delete()
+
+    def run_jobs(self):
+        while jobs := claim("tests", limit=100):
+            for job in jobs:
+                execute(job)
+
+    def inbox(self, user=None):
+        return set(
+            FeedEntry.objects.filter(user=user or self.reader).values_list(
+                "recipe_id", flat=True
+            )
+        )
+
+    def merged(self, user=None):
+        return set(
+            Recipe.objects.filter(
+                author__followers__follower=user or self.reader
+            ).values_list("id", flat=True)
+        )
+
+    def follow(self, *authors, user=None):
+        for author in authors:
+            Follow.objects.create(follower=user or self.reader, following=author)
+
+    def unfollow(self, author):
+        Follow.objects.get(follower=self.reader, following=author).delete()
+
+    def assert_feed(self, inbox):
+        self.run_jobs()
+        feed = set(feed_queryset(self.reader).values_list("id", flat=True))
+        self.assertEqual(feed, self.merged())
+        self.assertEqual(self.inbox(), self.merged() if inbox else set())
+
+    def test_follow_backfills_first_page_then_history(self):
+        author = self.authors[0]
+        self.follow(author)
+        # Сразу — FEED_INBOX_BACKFILL рецептов, остальное докладывает задача
+        self.assertEqual(len(self.inbox()), 1)
+        self.assert_feed(inbox=True)
+        self.assertEqual(len(self.inbox()), 3)
+
+    def test_new_recipe_fans_out_to_inbox_followers(self):
+        author = self.authors[0]
+        heavy = User.objects.create_user(username="heavy", email="h@example.com")
+        self.follow(author)
+        self.follow(*self.authors, user=heavy)
+        self.run_jobs()
+        recipe = Recipe.objects.create(
+            author=author, name="новый", text="-", cooking_time=1
+        )
+        self.assertNotIn(recipe.pk, self.inbox())
+        self.assert_feed(inbox=True)
+        self.assertIn(recipe.pk, self.inbox())
+        # Подписчик с большим числом подписок читает ленту слиянием
+        self.assertEqual(self.inbox(heavy), set())
+        self.assertIn(recipe.pk, set(feed_queryset(heavy).values_list("id", flat=True)))
+
+    def test_unfollow_prunes_author_entries(self):
+        first, second, _ = self.authors
+        self.follow(first, second)
+        self.assert_feed(inbox=True)
+        self.unfollow(first)
+        self.assertEqual(self.inbox(), set(second.recipes.values_list("id", flat=True)))
+        self.assert_feed(inbox=True)
+
+    def test_crossing_inbox_limit_switches_feed_source(self):
+        first, second, third = self.authors
+        self.follow(first, second)
+        self.assert_feed(inbox=True)
+        self.follow(third)
+        self.assert_feed(inbox=False)
+        # Без третьего автора лента снова пойдёт из inbox
+        self.assertEqual(list(followers_switching_to_inbox(first.pk)), [self.reader.pk])
+        self.unfollow(third)
+        # Inbox перестроен по FEED_INBOX_BACKFILL рецептов на автора,
+        # историю докладывает задача
+        self.assertEqual(len(self.inbox()), 2)
+        self.assert_feed(inbox=True)
+        self.unfollow(second)
+        self.assert_feed(inbox=True)
@@ -0,0 +1,159 @@
+import math
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, Exp, TruncHour
+from django.utils import timezone
+
+from recipes.models import Favorite, RecipeActivity, ShoppingCart
+
+FAVORITE_WEIGHT = 1.0
+CART_WEIGHT = 2.0
+# Окно → (длина в часах, период полураспада оценки в часах)
+WINDOWS = {"24h": (24, 6), "7d": (24 * 7, 48)}
+BATCH_SIZE = 1000
+
+
+def hour_of(moment):
+    return int(moment.timestamp() // 3600)
+
+
+def record_event(recipe_id, field, moment=None):
+    """Увеличивает счётчик `field` в часовом интервале события."""
+    start_hour = hour_of(moment or timezone.now())
+    lookup = {"recipe_id": recipe_id, "span": RecipeActivity.HOUR}
+    bucket = RecipeActivity.objects.filter(start_hour=start_hour, **lookup)
+    if bucket.update(**{field: F(field) + 1}):
+        return
+    try:
+        with transaction.atomic():
+            RecipeActivity.objects.create(start_hour=start_hour, **lookup, **{field: 1})
+    except IntegrityError:
+        bucket.update(**{field: F(field) + 1})
+
+
+def retract_event(recipe_id, field, moment):
+    """Отменяет событие `record_event` с моментом `moment`: запись удалили.
+
+    Счётчик уменьшается в том интервале, куда событие попало, — часовом
+    или уже свёрнутом в сутки, — поэтому итог совпадает с тем, что
+    посчитал бы `rebuild_activity` по оставшимся записям.
+    """
+    start_hour = hour_of(moment)
+    counters = RecipeActivity.objects.filter(recipe_id=recipe_id, **{f"{field}__gt": 0})
+    if counters.filter(span=RecipeActivity.HOUR, start_hour=start_hour).update(
+        **{field: F(field) - 1}
+    ):
+        return
+    counters.filter(
+        span=RecipeActivity.DAY, start_hour=start_hour - start_hour % RecipeActivity.DAY
+    ).update(**{field: F(field) - 1})
+
+
+def trending_scores(window):
+    """Сумма событий по рецептам с экспоненциальным затуханием по возрасту."""
+    hours, half_life = WINDOWS[window]
+    now_hour = hour_of(timezone.now())
+    since = now_hour - hours
+    decay = math.log(2) / half_life
+    age = Cast(F("start_hour") + F("span") / 2.0 - now_hour, FloatField())
+    events = F("favorites") * FAVORITE_WEIGHT + F("carts") * CART_WEIGHT
+    return (
+        RecipeActivity.objects.filter(
+            Q(span=RecipeActivity.HOUR, start_hour__gte=since)
+            | Q(span=RecipeActivity.DAY, start_hour__gt=since - RecipeActivity.DAY)
+        )
+        .values("recipe_id")
+        .annotate(score=Sum(events * Exp(age * decay), output_field=FloatField()))
+        .order_by("-score", "-recipe_id")
+    )
+
+
+def _merge_into(buckets, span):
+    """Прибавляет {(recipe_id, start_hour): (favorites, carts)} к интервалам."""
+    items = list(buckets.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        chunk = dict(items[start : start + BATCH_SIZE])
+        existing = RecipeActivity.objects.filter(
+            span=span,
+            recipe_id__in={recipe_id for recipe_id, _ in chunk},
+            start_hour__in={start_hour for _, start_hour in chunk},
+        )
+        updated = []
+        for row in existing:
+            counts = chunk.pop((row.recipe_id, row.start_hour), None)
+            if counts is None:
+                continue
+            row.favorites += counts[0]
+            row.carts += counts[1]
+            updated.append(row)
+        RecipeActivity.objects.bulk_update(updated, ["favorites", "carts"])
+        RecipeActivity.objects.bulk_create(
+            RecipeActivity(
+                recipe_id=recipe_id,
+                start_hour=start_hour,
+                span=span,
+                favorites=favorites,
+                carts=carts,
+            )
+            for (recipe_id, start_hour), (favorites, carts) in chunk.items()
+        )
+
+
+def rebuild_activity():
+    """Пересобирает часовые интервалы по `created_at` избранного и корзин."""
+    buckets = defaultdict(lambda: [0, 0])
+    for position, model in enumerate((Favorite, ShoppingCart)):
+        rows = (
+            model.objects.annotate(hour=TruncHour("created_at", tzinfo=dt_timezone.utc))
+            .values("recipe_id", "hour")
+            .annotate(total=Count("id"))
+            .order_by()
+        )
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            buckets[(row["recipe_id"], hour_of(row["hour"]))][position] += row["total"]
+    with transaction.atomic():
+        RecipeActivity.objects.all().delete()
+        _merge_into(buckets, RecipeActivity.HOUR)
+    return len(buckets)
+
+
+def compact_activity(keep_hours):
+    """Сворачивает часовые интервалы старше `keep_hours` в суточные.
+
+    Каждые сутки обрабатываются в своей транзакции, поэтому таблица не
+    блокируется надолго, а прерванный запуск можно просто повторить.
+    """
+    cutoff = hour_of(timezone.now()) - keep_hours
+    cutoff -= cutoff % RecipeActivity.DAY
+    compacted = 0
+    while True:
+        oldest = (
+            RecipeActivity.objects.filter(
+                span=RecipeActivity.HOUR, start_hour__lt=cutoff
+            )
+            .order_by("start_hour")
+            .values_list("start_hour", flat=True)
+            .first()
+        )
+        if oldest is None:
+            return compacted
+        day = oldest - oldest % RecipeActivity.DAY
+        with transaction.atomic():
+            hourly = RecipeActivity.objects.select_for_update().filter(
+                span=RecipeActivity.HOUR,
+                start_hour__gte=day,
+                start_hour__lt=day + RecipeActivity.DAY,
+            )
+            buckets = defaultdict(lambda: [0, 0])
+            for recipe_id, favorites, carts in hourly.values_list(
+                "recipe_id", "favorites", "carts"
+            ):
+                counts = buckets[(recipe_id, day)]
+                counts[0] += favorites
+                counts[1] += carts
+                compacted += 1
+            _merge_into(buckets, RecipeActivity.DAY)
+            hourly.delete()
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from users.models import User, Follow
+from foodgram.pagination import EstimatedCountPaginator
+from recipes.deletion import delete_user
+from users.models import AuthorSuggestion, User, Follow
 
 
 @admin.register(User)
@@ -16,6 +18,8 @@ class UserAdmin(BaseUserAdmin):
     )
     search_fields = ("username", "email")
     list_filter = ("is_staff", "is_superuser", "is_active")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (None, {"fields": ("username", "password")}),
         (
@@ -46,6 +50,13 @@ class UserAdmin(BaseUserAdmin):
         ),
     )
 
+    def delete_model(self, request, obj):
+        delete_user(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            delete_user(user)
+
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
@@ -55,7 +66,11 @@ class FollowAdmin(admin.ModelAdmin):
         "get_follower_email",
         "get_following_email",
     )
+    list_select_related = ("follower", "following")
     search_fields = ("follower__username", "following__username")
+    autocomplete_fields = ("follower", "following")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_follower_email(self, obj):
         return obj.follower.email
@@ -66,3 +81,13 @@ class FollowAdmin(admin.ModelAdmin):
         return obj.following.email
 
     get_following_email.short_description = "Email автора"
+
+
+@admin.register(AuthorSuggestion)
+class AuthorSuggestionAdmin(admin.ModelAdmin):
+    list_display = ("user", "author", "score", "computed_at")
+    list_select_related = ("user", "author")
+    search_fields = ("user__username", "user__email")
+    raw_id_fields = ("user", "author")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
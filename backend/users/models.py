@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Upper
 
 
 class User(AbstractUser):
@@ -17,6 +18,12 @@ class User(AbstractUser):
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
         ordering = ["email"]
+        # Уникальность без учёта регистра; индексы по UPPER() используются
+        # и проверкой `__iexact` при регистрации
+        constraints = [
+            models.UniqueConstraint(Upper("email"), name="user_email_ci_unique"),
+            models.UniqueConstraint(Upper("username"), name="user_username_ci_unique"),
+        ]
 
     def __str__(self):
         return self.username
@@ -49,9 +56,47 @@ class Follow(models.Model):
                 name="prevent_self_follow",
             ),
         ]
+        indexes = [
+            models.Index(fields=["following", "follower"], name="follow_following_idx")
+        ]
 
     def __str__(self):
         return f"{self.follower} follows {self.following}"
 
     def is_following(self, user1, user2):
         return Follow.objects.filter(follower=user1, following=user2).exists()
+
+
+class AuthorSuggestion(models.Model):
+    """Предрасчитанный топ авторов для пользователя (build_author_suggestions)."""
+
+    user = models.ForeignKey(
+        User,
+        related_name="author_suggestions",
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+    )
+    author = models.ForeignKey(
+        User,
+        related_name="suggested_to",
+        on_delete=models.CASCADE,
+        verbose_name="Автор",
+    )
+    score = models.FloatField(verbose_name="Оценка")
+    computed_at = models.DateTimeField(verbose_name="Дата расчёта")
+
+    class Meta:
+        verbose_name = "Рекомендация автора"
+        verbose_name_plural = "Рекомендации авторов"
+        ordering = ["user", "-score"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "author"], name="unique_author_suggestion"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["user", "-score"], name="author_suggestion_score_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.user} → {self.author} ({self.score:.3f})"
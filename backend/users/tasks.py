@@ -0,0 +1,12 @@
+from foodgram.storage import delete_unused
+from jobs.queue import task
+from users.models import User
+
+
+@task()
+def delete_avatar(name, requested_at=None):
+    # Одинаковые файлы хранятся один раз (foodgram.storage), поэтому файл
+    # удаляется, только если на него больше не ссылается ни один аватар.
+    delete_unused(
+        name, User.objects.filter(avatar=name).exists, requested_at=requested_at
+    )
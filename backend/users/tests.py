@@ -1 +1,137 @@
-# Create your tests here.
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from jobs.models import Job
+from recipes.deletion import delete_user
+from recipes.feed import feed_queryset
+from recipes.models import FeedEntry, Recipe
+from rest_framework.authtoken.models import Token
+from users.models import AuthorSuggestion, Follow, User
+
+# Для списка без фильтров в PostgreSQL пагинатор сначала смотрит pg_class
+ESTIMATE_QUERIES = 1 if connection.vendor == "postgresql" else 0
+
+
+class AdminChangelistQueryTests(TestCase):
+    """Число запросов списков админки не зависит от числа строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="password"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = User.objects.count()
+        users = User.objects.bulk_create(
+            User(username=f"user{number}", email=f"user{number}@example.com")
+            for number in range(start, start + count)
+        )
+        now = timezone.now()
+        Follow.objects.bulk_create(
+            Follow(follower=self.admin, following=user) for user in users
+        )
+        AuthorSuggestion.objects.bulk_create(
+            AuthorSuggestion(user=user, author=self.admin, score=1, computed_at=now)
+            for user in users
+        )
+
+    def assert_changelist_queries(self, url, queries):
+        for count in (3, 30):
+            self.add_rows(count)
+            with self.subTest(rows=count), self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_user_changelist(self):
+        self.assert_changelist_queries("/admin/users/user/", 4 + ESTIMATE_QUERIES)
+
+    def test_follow_changelist(self):
+        self.assert_changelist_queries("/admin/users/follow/", 4 + ESTIMATE_QUERIES)
+
+    def test_author_suggestion_changelist(self):
+        self.assert_changelist_queries(
+            "/admin/users/authorsuggestion/", 4 + ESTIMATE_QUERIES
+        )
+
+    def test_user_search(self):
+        self.assert_changelist_queries("/admin/users/user/?q=user1", 4)
+
+
+class DeleteUserTests(TestCase):
+    def test_related_rows_are_deleted_in_chunks(self):
+        users = [
+            User.objects.create_user(
+                username=f"user{number}", email=f"user{number}@example.com"
+            )
+            for number in range(4)
+        ]
+        user = users[0]
+        now = timezone.now()
+        for other in users[1:]:
+            Follow.objects.create(follower=user, following=other)
+            Follow.objects.create(follower=other, following=user)
+            AuthorSuggestion.objects.create(
+                user=user, author=other, score=1, computed_at=now
+            )
+            AuthorSuggestion.objects.create(
+                user=other, author=user, score=1, computed_at=now
+            )
+        Token.objects.create(user=user)
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            delete_user(user, chunk=2)
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+        self.assertEqual(Follow.objects.count(), 0)
+        self.assertEqual(AuthorSuggestion.objects.count(), 0)
+        self.assertEqual(Token.objects.count(), 0)
+        # По 3 подсказки в каждую сторону пачками по 2 строки
+        deletes = [
+            q for q in queries if q.startswith('DELETE FROM "users_authorsuggestion"')
+        ]
+        self.assertGreaterEqual(len(deletes), 4)
+
+    @override_settings(FEED_INBOX_MAX_FOLLOWS=2)
+    def test_followers_feeds_are_cleaned_without_per_row_jobs(self):
+        deleted, first, second, merged, inbox = (
+            User.objects.create_user(
+                username=f"user{number}", email=f"user{number}@example.com"
+            )
+            for number in range(5)
+        )
+        recipes = {
+            author: Recipe.objects.create(
+                author=author, name="Каша", text="Сварить", cooking_time=10
+            )
+            for author in (deleted, first, second)
+        }
+        # merged подписан на трёх авторов и читает ленту слиянием,
+        # inbox — только на удаляемого
+        for author in (deleted, first, second):
+            Follow.objects.create(follower=merged, following=author)
+        Follow.objects.create(follower=inbox, following=deleted)
+        Job.objects.all().delete()
+        with mock.patch("recipes.signals.on_unfollow") as on_unfollow:
+            delete_user(deleted, chunk=2)
+        on_unfollow.assert_not_called()
+        # Задача только для подписчика, которому лента переключилась на inbox
+        self.assertEqual(
+            [job.payload for job in Job.objects.all()], [{"user_id": merged.pk}]
+        )
+        self.assertFalse(FeedEntry.objects.filter(author=deleted).exists())
+        self.assertEqual(set(feed_queryset(merged)), {recipes[first], recipes[second]})
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=merged).values_list("recipe", flat=True)),
+            {recipes[first].pk, recipes[second].pk},
+        )
+        self.assertFalse(feed_queryset(inbox).exists())
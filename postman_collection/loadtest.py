@@ -0,0 +1,403 @@
+"""Нагрузочный прогон API по запросам postman-коллекции.
+
+Сначала коллекция частично выполняется по порядку (подготовка): создаются
+пользователи, токены, рецепты и подписки, а переменные коллекции
+заполняются так же, как это делают тест-скрипты Postman. Затем несколько
+потоков-«пользователей» случайно, с учётом весов, выбирают сценарии
+(папки коллекции) и выполняют их запросы, пока не истечёт время.
+
+Пример:
+    python loadtest.py --start-server --concurrency 16 --duration 60
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+COLLECTION = os.path.join(os.path.dirname(__file__), "foodgram.postman_collection.json")
+MANAGE_PY = os.path.join(os.path.dirname(__file__), "..", "backend", "manage.py")
+
+SETUP_FOLDERS = (
+    "register_and_get_tokens/create_users",
+    "register_and_get_tokens/get_tokens",
+    "ingredients/get_ingradients",
+    "recipes/create_recipes",
+    "subscriptions/create_subscriptions",
+    "shopping_cart/add_to_shopping_cart",
+    "favorite/add_to_favorite",
+)
+TEARDOWN_FOLDERS = ("delete_requests",)
+# Сценарии по умолчанию только читают данные, поэтому их можно
+# выполнять параллельно сколько угодно раз.
+DEFAULT_SCENARIOS = {
+    "users/get_user_info": 3,
+    "ingredients/get_ingradients": 3,
+    "recipes/get_recipes": 6,
+    "recipes/get_recipe_short_link": 1,
+    "subscriptions/get_subscriptions": 2,
+    "shopping_cart/download_shopping_cart": 1,
+    "recipe_filters_for_favorite_and_shopping_cart": 2,
+}
+
+VARIABLE = re.compile(r"{{\s*(\w+)\s*}}")
+JS_GET = re.compile(r"const (\w+) = _\.get\(responseData, \"([^\"]+)\"\)")
+JS_SET = re.compile(r"pm\.collectionVariables\.set\(['\"](\w+)['\"], (.+?)\);?$")
+JS_PATH = re.compile(
+    r"^responseData((?:\[\d+\]|\.\w+)*)(?:\.slice\((\d+),\s*(\d+)\))?$"
+)
+
+
+def js_path(data, path):
+    for key in re.findall(r"\[(\d+)\]|\.(\w+)", path):
+        index, name = key
+        data = data[int(index)] if index else data[name]
+    return data
+
+
+class Step:
+    def __init__(self, name, request, auth, script):
+        self.name = name
+        self.method = request["method"]
+        url = request["url"]
+        self.url = url["raw"] if isinstance(url, dict) else url
+        self.body = (request.get("body") or {}).get("raw")
+        self.headers = {
+            header["key"]: header["value"]
+            for header in request.get("header", [])
+            if not header.get("disabled")
+        }
+        if auth and auth.get("type") == "apikey":
+            values = {item["key"]: item["value"] for item in auth["apikey"]}
+            self.headers[values["key"]] = values["value"]
+        if self.body is not None:
+            self.headers.setdefault("Content-Type", "application/json")
+        self.extractors = self.parse_script(script)
+
+    @staticmethod
+    def parse_script(lines):
+        aliases = {}
+        extractors = []
+        for line in lines:
+            line = line.strip()
+            match = JS_GET.search(line)
+            if match:
+                aliases[match[1]] = "." + match[2]
+                continue
+            match = JS_SET.search(line)
+            if not match:
+                continue
+            name, expression = match[1], match[2].strip()
+            if expression in aliases:
+                extractors.append((name, aliases[expression], None))
+                continue
+            path = JS_PATH.match(expression)
+            if path:
+                bounds = (int(path[2]), int(path[3])) if path[2] else None
+                extractors.append((name, path[1], bounds))
+        return extractors
+
+    def render(self, text, variables):
+        return VARIABLE.sub(lambda match: str(variables.get(match[1], match[0])), text)
+
+    def extract(self, payload, variables):
+        for name, path, bounds in self.extractors:
+            try:
+                value = js_path(payload, path)
+            except (KeyError, IndexError, TypeError):
+                continue
+            if value is None:
+                continue
+            if bounds:
+                value = value[bounds[0] : bounds[1]]
+            variables[name] = value
+
+
+def load_collection(path):
+    with open(path, encoding="utf-8") as file:
+        collection = json.load(file)
+    variables = {item["key"]: item["value"] for item in collection.get("variable", [])}
+    folders = defaultdict(list)
+
+    def walk(items, prefix, auth):
+        for item in items:
+            item_auth = item.get("auth") or auth
+            if "item" in item:
+                # «register_and_get_tokens // No Auth» → «register_and_get_tokens»
+                name = item["name"].split("//")[0].strip()
+                folder = f"{prefix}/{name}" if prefix else name
+                walk(item["item"], folder, item_auth)
+                continue
+            request_auth = item["request"].get("auth") or item_auth
+            script = [
+                line
+                for event in item.get("event", [])
+                if event["listen"] == "test"
+                for line in event["script"]["exec"]
+            ]
+            step = Step(item["name"].strip(), item["request"], request_auth, script)
+            parts = prefix.split("/")
+            for depth in range(1, len(parts) + 1):
+                folders["/".join(parts[:depth])].append(step)
+
+    walk(collection["item"], "", collection.get("auth"))
+    return variables, folders
+
+
+class Client:
+    """Держит keep-alive соединение на поток, как это делает браузер."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.connection_class = (
+            http.client.HTTPSConnection
+            if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.netloc = parts.netloc
+        self.timeout = timeout
+        self.connection = None
+
+    def request(self, method, path, body, headers):
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self.connection_class(
+                    self.netloc, timeout=self.timeout
+                )
+            try:
+                self.connection.request(
+                    method,
+                    path,
+                    body=body.encode("utf-8") if body is not None else None,
+                    headers=headers,
+                )
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    def add(self, name, elapsed, status):
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            self.statuses[name][status] += 1
+            if status is None or status >= 500:
+                self.errors[name] += 1
+
+    def report(self, duration):
+        def percentile(values, share):
+            return values[min(len(values) - 1, int(len(values) * share))]
+
+        rows = {}
+        everything = []
+        for name, values in sorted(self.latencies.items()):
+            values.sort()
+            everything.extend(values)
+            rows[name] = {
+                "requests": len(values),
+                "throughput_rps": round(len(values) / duration, 2),
+                "error_rate": round(self.errors[name] / len(values), 4),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+                "statuses": {
+                    str(key): value for key, value in self.statuses[name].items()
+                },
+            }
+        everything.sort()
+        total = {
+            "requests": len(everything),
+            "throughput_rps": round(len(everything) / duration, 2),
+            "error_rate": (
+                round(sum(self.errors.values()) / len(everything), 4)
+                if everything
+                else 0
+            ),
+        }
+        if everything:
+            total.update(
+                p50_ms=round(percentile(everything, 0.50) * 1000, 2),
+                p95_ms=round(percentile(everything, 0.95) * 1000, 2),
+                p99_ms=round(percentile(everything, 0.99) * 1000, 2),
+            )
+        return {"duration_s": round(duration, 2), "total": total, "requests": rows}
+
+
+def run_steps(client, steps, variables, stats=None, prefix=""):
+    for step in steps:
+        url = urlsplit(step.render(step.url, variables))
+        path = url.path + (f"?{url.query}" if url.query else "")
+        body = step.render(step.body, variables) if step.body is not None else None
+        headers = {
+            key: step.render(value, variables) for key, value in step.headers.items()
+        }
+        started = time.perf_counter()
+        try:
+            status, payload = client.request(step.method, path, body, headers)
+        except (http.client.HTTPException, OSError):
+            status, payload = None, b""
+        if stats is not None:
+            stats.add(prefix + step.name, time.perf_counter() - started, status)
+        if step.extractors and payload:
+            try:
+                step.extract(json.loads(payload), variables)
+            except ValueError:
+                pass
+
+
+def worker(base_url, timeout, scenarios, folders, variables, stats, deadline, seed):
+    rng = random.Random(seed)
+    client = Client(base_url, timeout)
+    names = list(scenarios)
+    weights = [scenarios[name] for name in names]
+    while time.monotonic() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        run_steps(client, folders[scenario], dict(variables), stats, f"{scenario} :: ")
+
+
+def wait_for_server(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    client = Client(base_url, 1)
+    while time.monotonic() < deadline:
+        try:
+            client.request("GET", "/api/ingredients/", None, {})
+            return
+        except (http.client.HTTPException, OSError):
+            time.sleep(0.2)
+    raise SystemExit(f"Сервер {base_url} не ответил за {timeout} с")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--collection", default=COLLECTION)
+    parser.add_argument(
+        "--base-url", default=None, help="По умолчанию baseUrl коллекции"
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30, help="Секунды нагрузки")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        default=[],
+        metavar="ПАПКА=ВЕС",
+        help="Сценарий и его вес; заменяет набор по умолчанию",
+    )
+    parser.add_argument("--skip-setup", action="store_true")
+    parser.add_argument("--teardown", action="store_true", help="Удалить созданное")
+    parser.add_argument(
+        "--start-server",
+        action="store_true",
+        help="Запустить manage.py runserver на адресе --base-url",
+    )
+    parser.add_argument("--server-command", help="Своя команда запуска сервера")
+    parser.add_argument("--report", default="loadtest_report.json")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    variables, folders = load_collection(args.collection)
+    if args.base_url:
+        variables["baseUrl"] = args.base_url
+    base_url = variables["baseUrl"]
+    scenarios = DEFAULT_SCENARIOS
+    if args.scenario:
+        scenarios = {}
+        for item in args.scenario:
+            name, _, weight = item.partition("=")
+            scenarios[name] = float(weight or 1)
+    unknown = [
+        name
+        for name in (*scenarios, *SETUP_FOLDERS, *TEARDOWN_FOLDERS)
+        if name not in folders
+    ]
+    if unknown:
+        raise SystemExit(f"Нет таких папок в коллекции: {', '.join(unknown)}")
+
+    server = None
+    if args.start_server or args.server_command:
+        command = args.server_command or (
+            f"{sys.executable} {MANAGE_PY} runserver --noreload "
+            f"{urlsplit(base_url).netloc}"
+        )
+        # Иначе потоки-«пользователи» упираются в лимиты API, а не в сервер.
+        # Для внешнего сервера (--base-url) лимиты отключаются его настройками.
+        env = {"API_THROTTLE_ENABLED": "False", **os.environ}
+        server = subprocess.Popen(command, shell=True, start_new_session=True, env=env)
+    try:
+        wait_for_server(base_url, 60)
+        client = Client(base_url, args.timeout)
+        if not args.skip_setup:
+            for folder in SETUP_FOLDERS:
+                run_steps(client, folders[folder], variables)
+        stats = Stats()
+        deadline = time.monotonic() + args.duration
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(
+                target=worker,
+                args=(
+                    base_url,
+                    args.timeout,
+                    scenarios,
+                    folders,
+                    variables,
+                    stats,
+                    deadline,
+                    args.seed + number,
+                ),
+            )
+            for number in range(args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report = stats.report(time.perf_counter() - started)
+        report["concurrency"] = args.concurrency
+        report["scenarios"] = scenarios
+        if args.teardown:
+            for folder in TEARDOWN_FOLDERS:
+                run_steps(client, folders[folder], variables)
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+
+    with open(args.report, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(
+        f"{'Запрос':<90} {'n':>7} {'rps':>8} {'err':>6} {'p50':>8} {'p95':>8} {'p99':>8}"
+    )
+    for name, row in list(report["requests"].items()) + [("ИТОГО", report["total"])]:
+        print(
+            f"{name[:90]:<90} {row['requests']:>7} {row['throughput_rps']:>8} "
+            f"{row['error_rate']:>6.1%} {row.get('p50_ms', 0):>8} "
+            f"{row.get('p95_ms', 0):>8} {row.get('p99_ms', 0):>8}"
+        )
+    print(f"Отчёт сохранён в {args.report}")
+
+
+if __name__ == "__main__":
+    main()